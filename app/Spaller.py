@@ -6,7 +6,28 @@ import subprocess
 import threading
 import time
 import ctypes
-from urllib.parse import urlparse
+import shutil
+import socket
+import hashlib
+import hmac
+import secrets
+import zipfile
+import argparse
+import uuid
+import urllib.request
+import signal
+import collections
+import sqlite3
+import atexit
+import codecs
+import re
+import traceback
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, quote, parse_qs
 
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                               QHBoxLayout, QLabel, QPushButton, QCheckBox, QScrollArea,
@@ -17,12 +38,288 @@ from PySide6.QtCore import Qt, QThread, Signal, QPropertyAnimation, QEasingCurve
 from PySide6.QtGui import QFont, QPixmap, QPainter, QColor, QLinearGradient, QPen, QBrush, QMouseEvent, QCursor, QIcon
 import webbrowser
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CATALOG_HOST = "raw.githubusercontent.com"
+
+CATALOG_URLS = {
+    "chocolatey": "https://raw.githubusercontent.com/ice-exe/Spaller/refs/heads/main/resources/choco_data.json",
+    "direct": "https://raw.githubusercontent.com/ice-exe/Spaller/refs/heads/main/resources/apps_data.json"
+}
+
+CHOCOLATEY_PATHS = [
+    r"C:\ProgramData\chocolatey\bin\choco.exe",
+    r"C:\chocolatey\bin\choco.exe",
+    os.path.expandvars(r"%ALLUSERSPROFILE%\chocolatey\bin\choco.exe")
+]
+
+BYTES_PER_MB = 1000 * 1000
+DEFAULT_APP_SIZE = 50  # MB, used when the catalog has no size
+
+SIZE_CACHE_FILE = "size_cache.json"
+SIZE_CACHE_TTL = 7 * 24 * 60 * 60  # Re-validate measured sizes weekly
+SIZE_PROBE_WORKERS = 8
+INSTALL_SPACE_FACTOR = 2  # Installed footprint relative to download size
+DISK_SPACE_MARGIN = 500 * BYTES_PER_MB
+
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024  # Multiple of the 4 KiB page/sector size
+DOWNLOAD_POOL_BUFFERS = 8
+FSYNC_POLICIES = ("never", "end", "interval")
+DEFAULT_FSYNC_POLICY = os.environ.get('SPALLER_FSYNC_POLICY', "end")
+FSYNC_INTERVAL = 64 * 1024 * 1024  # Bytes between syncs with the "interval" policy
+
+PROGRESS_UPDATES_PER_SECOND = 10  # Per app, across all download workers
+PROGRESS_RATE_SMOOTHING = 0.3  # EWMA weight of the newest rate sample
+
+CHOCOLATEY_INSTALL_SCRIPT_URL = "https://community.chocolatey.org/install.ps1"
+CHOCOLATEY_PACKAGE_URL = "https://community.chocolatey.org/api/v2/package/"
+BUNDLE_MANIFEST_FILE = "manifest.json"
+BUNDLE_CATALOG_FILES = {"chocolatey": "choco_data.json", "direct": "apps_data.json"}
+BUNDLE_DOWNLOAD_WORKERS = 4
+
+INSTALLER_CACHE_DIR = "installers"
+INSTALLER_CACHE_INDEX = "installer_cache.json"
+INSTALLER_CACHE_MAX_BYTES = int(os.environ.get('SPALLER_CACHE_MAX_MB', 4000)) * BYTES_PER_MB
+INSTALLER_CACHE_URL_TTL = 24 * 60 * 60  # "latest" URLs change, so URL-keyed entries expire daily
+
+PEER_CACHE_PORT = 47625
+PEER_DISCOVERY_GROUP = "239.255.76.67"
+PEER_DISCOVERY_PORT = 47624
+PEER_BEACON_INTERVAL = 5
+PEER_EXPIRY = 30  # Forget peers not heard from for this long
+PEER_TIMEOUT = 3
+PEER_INFLIGHT_WAIT = 300  # How long to wait for a peer that is already downloading the same URL
+
+INSTALL_IDLE_GRACE = int(os.environ.get('SPALLER_IDLE_GRACE', 60))  # Seconds before idle detection starts
+INSTALL_IDLE_TIMEOUT = int(os.environ.get('SPALLER_IDLE_TIMEOUT', 90))  # Seconds without activity = hung
+INSTALL_HARD_TIMEOUT = 60 * 60  # Absolute cap, even for installers that stay busy
+INSTALL_FALLBACK_TIMEOUT = 600  # Cap when psutil is missing and activity cannot be observed
+SUPERVISOR_POLL_INTERVAL = 1.0
+SUPERVISOR_CPU_EPSILON = 0.05  # CPU seconds per poll that count as activity
+SUPERVISOR_IO_EPSILON = 64 * 1024  # Bytes per poll that count as activity
+SUPERVISOR_LOG_FILE = "installers.log"
+
+INSTALLER_TYPES_FILE = "installer_types.json"
+INSTALLER_SCAN_LIMIT = 16 * 1024 * 1024  # Framework markers live in the stub and resources near the start
+
+# Byte markers identifying installer frameworks, checked in order
+INSTALLER_SIGNATURES = [
+    ("wix-burn", [b".wixburn"]),
+    ("inno", [b"Inno Setup Setup Data", b"InnoSetupLdrWindow", b"JR.Inno.Setup"]),
+    ("nsis", [b"\xef\xbe\xad\xdeNullsoftInst", b"Nullsoft Install System", b"NullsoftInst"]),
+    ("squirrel", [b"SquirrelSetup", b"Squirrel.Windows", b"SquirrelTemp"]),
+    ("installshield", [b"InstallShield"]),
+    ("install4j", [b"install4j"]),
+    ("advanced-installer", [b"Advanced Installer"]),
+]
+
+# Unattended switches per framework; MSI is handled through msiexec
+INSTALLER_SILENT_ARGS = {
+    "msi": ["/qn", "/norestart"],
+    "inno": ["/VERYSILENT", "/SUPPRESSMSGBOXES", "/NORESTART", "/SP-"],
+    "nsis": ["/S"],
+    "squirrel": ["--silent"],
+    "wix-burn": ["/quiet", "/norestart"],
+    "installshield": ["/s", "/v/qn"],
+    "install4j": ["-q"],
+    "advanced-installer": ["/exenoui", "/qn", "/norestart"],
+    "unknown": ["/S", "/silent", "/quiet"],
+}
+
+LINT_WORKERS = 16
+
+# Leading bytes of the file types we are willing to run as installers
+INSTALLER_MAGIC = {
+    ".exe": [b"MZ"],
+    ".msi": [b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"],
+    ".msix": [b"PK\x03\x04"],
+    ".appx": [b"PK\x03\x04"],
+    ".zip": [b"PK\x03\x04"],
+    ".7z": [b"7z\xbc\xaf\x27\x1c"],
+}
+WEB_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "application/json")
+
+CATALOG_CHUNK_SIZE = 64 * 1024  # Catalogs are parsed as they stream in
+CATALOG_WHITESPACE = re.compile(r'[ \t\n\r]*')
+MIRROR_STATS_FILE = "mirrors.json"
+MIRROR_RACE_COUNT = 2  # Top-ranked mirrors that race for the first bytes
+MIRROR_RACE_BYTES = 64 * 1024
+MIRROR_READ_TIMEOUT = 30  # Seconds of silence before giving up on a mirror that has alternatives
+MIRROR_CHECK_WINDOW = 5.0  # Seconds of transfer per throughput check
+MIRROR_COLLAPSE_RATIO = 0.1  # Switch when a window falls below this share of the best window so far
+MIRROR_MIN_RATE = 50 * 1000  # Bytes per second; anything slower counts as collapsed
+MIRROR_FAILURE_COOLDOWN = 6 * 60 * 60  # Rank a mirror that failed recently below the others
+MIRROR_RATE_SMOOTHING = 0.3
+EVENT_LOG_FILE = "install_events.jsonl"
+EVENT_SUBSCRIBER_RATE = 10  # Batches per second delivered to each event subscriber
+HASH_ALGORITHMS = ("sha256", "sha384", "sha512")  # Digests a catalog entry or lockfile may pin
+QUARANTINE_DIR = "quarantine"
+QUARANTINE_INDEX = "quarantine.json"
+QUARANTINE_MAX_FILES = 20  # Oldest quarantined installers are deleted beyond this
+INSTALL_PARALLELISM = int(os.environ.get('SPALLER_PARALLEL_INSTALLS', min(4, os.cpu_count() or 1)))
+CONCURRENCY_CLASSES = ("parallel", "msi", "chocolatey", "winget", "scoop", "exclusive")
+SERIAL_CONCURRENCY_CLASSES = ("msi", "chocolatey", "winget", "scoop")  # Windows Installer mutex, package manager locks
+METRICS_BIND = os.environ.get('SPALLER_METRICS_BIND', "127.0.0.1")
+METRICS_SNAPSHOT_FILE = "metrics.json"
+METRICS_SNAPSHOT_INTERVAL = 15  # Seconds between JSON snapshots
+METRICS_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_THROUGHPUT_BUCKETS = (100e3, 500e3, 1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6, 1e9)  # Bytes per second
+METRICS_DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+JOURNAL_FILE = "journal.sqlite3"
+JOURNAL_KEEP_RUNS = 50
+AGENT_PORT = int(os.environ.get('SPALLER_AGENT_PORT', 47626))
+AGENT_JOB_HISTORY = 100  # Finished jobs the agent remembers
+AGENT_HEARTBEAT_INTERVAL = 15  # Seconds between keep-alive lines on an idle event stream
+AGENT_TOKEN_FILE = "agent_token"  # Generated bearer token when the agent is started without --token
+AGENT_LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+# Installer exit codes that ask for a restart, per install backend: "required" (installed, finished
+# by the next restart), "initiated" (installed, and the installer is restarting Windows itself) or
+# "deferred" (nothing was installed; try again after a restart)
+RESTART_EXIT_CODES = {
+    "chocolatey": {3010: "required", 1641: "initiated", 350: "deferred", 1604: "deferred"},
+    "msi": {3010: "required", 1641: "initiated"},
+    "direct": {3010: "required", 1641: "initiated"},
+    "winget": {0x8A150109: "required", 0x8A15010B: "initiated", 0x8A15010A: "deferred"},
+}
+# Switch that stops each installer framework from restarting on its own, added to catalog overrides
+NORESTART_ARGS = {"msi": "/norestart", "wix-burn": "/norestart", "inno": "/NORESTART",
+                  "advanced-installer": "/norestart"}
+RESTART_WAIT_REASON = "Waiting for a restart"
+CHOCO_OUTDATED_TIMEOUT = 10 * 60  # One 'choco outdated' checks every installed package against the source
+RESTART_HISTORY_FILE = "restart_history.json"
+RESTART_DELAY = 60  # Seconds of warning before Spaller restarts Windows
+RESTART_TASK_NAME = "SpallerResume"  # Elevated logon task that continues a run after a restart
+FAILURE_LABELS = (  # Substring of a failure reason -> spaller_install_failures_total label
+    ("checksum", "checksum"),
+    ("not an installer", "not_installer"),
+    ("does not look like", "not_installer"),
+    ("download failed", "download"),
+    ("bundle", "bundle"),
+    ("still running after", "timeout"),
+    ("no cpu, i/o or output", "idle"),
+    ("exit code", "exit_code"),
+    ("no chocolatey package", "no_package"),
+    ("no download url", "no_url"),
+    ("no install backend", "no_backend"),
+)
+SEARCH_DEBOUNCE_MS = 150  # Search once typing pauses instead of on every keystroke
+APP_WIDGET_POOL_SIZE = 256  # Hidden app widgets kept for reuse by the next category or search
+STALL_LOG_FILE = "ui_stalls.log"
+STALL_THRESHOLD = 0.25  # Seconds the GUI event loop may be blocked before the watchdog reports it
+STALL_HEARTBEAT_INTERVAL = 0.05
+STALL_MAX_SAMPLES = 5  # Stacks taken per stall, one each time it grows by another threshold
+STALL_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+BACKEND_STATS_FILE = "backend_stats.json"
+BACKEND_TIME_SMOOTHING = 0.3
+# Backends tried first for an app with no install history, by the install method the user picked
+PREFERRED_BACKENDS = {"chocolatey": ("chocolatey",), "direct": ("direct", "msi")}
+WINGET_NOTHING_TO_DO_CODES = (0x8A15002B, 0x8A15010D)  # No applicable upgrade, already installed
+PREREQ_CACHE_FILE = "prereq_cache.json"
+PREREQ_CACHE_TTL = 6 * 60 * 60  # Chocolatey version, 6 hours
+NETWORK_PROBE_TTL = 5 * 60  # Network reachability, 5 minutes
+
+class WindowsPlatform:
+    """The operating system calls behind an install: elevation, Chocolatey and running installers
+    
+    Everything OS-specific an install run touches goes through PLATFORM, so the
+    engine can be driven elsewhere by a stand-in (the benchmarks use a simulated
+    platform with a local installer farm and a fake choco).
+    """
+    
+    def __init__(self):
+        self.admin = None
+    
+    def is_admin(self):
+        # Elevation cannot change for a running process, so ask Windows only once
+        if self.admin is None:
+            try:
+                self.admin = bool(ctypes.windll.shell32.IsUserAnAdmin())
+            except:
+                self.admin = False
+        return self.admin
+    
+    def find_chocolatey(self):
+        candidates = []
+        
+        choco_install = os.environ.get('ChocolateyInstall')
+        if choco_install:
+            candidates.append(os.path.join(choco_install, "bin", "choco.exe"))
+        
+        which_path = shutil.which('choco')
+        if which_path:
+            candidates.append(which_path)
+        
+        candidates.extend(CHOCOLATEY_PATHS)
+        
+        for path in candidates:
+            if os.path.isfile(path):
+                return path
+        
+        return None
+    
+    def chocolatey_version(self, choco_path):
+        try:
+            result = subprocess.run([choco_path, '--version'],
+                                  capture_output=True, text=True, timeout=10)
+            if result.returncode == 0:
+                return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else None
+        except Exception:
+            pass
+        return None
+    
+    def find_tool(self, name):
+        """Return the path of a command-line package manager such as winget or scoop, or None"""
+        return shutil.which(name)
+    
+    def run_installer(self, supervisor, command, shell=False, watch_names=()):
+        """Run a package manager, msiexec or installer command line under the supervisor"""
+        return supervisor.run(command, shell=shell, watch_names=watch_names)
+
+PLATFORM = WindowsPlatform()
+
 def is_admin():
     """Check if the current process has admin privileges"""
+    return PLATFORM.is_admin()
+
+def get_state_dir():
+    """Return the per-user directory holding Spaller caches and state files"""
+    state_dir = os.environ.get('SPALLER_STATE_DIR')
+    if not state_dir:
+        if os.environ.get('LOCALAPPDATA'):
+            state_dir = os.path.join(os.environ['LOCALAPPDATA'], "Spaller")
+        else:
+            state_dir = os.path.join(os.path.expanduser("~"), ".spaller")
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+def get_download_dir():
+    """Return the directory installers are downloaded to"""
+    return os.path.join(os.path.expanduser("~"), "Downloads")
+
+def read_json_file(path, default=None):
+    """Read a JSON state file, returning default if it is missing or corrupt"""
     try:
-        return ctypes.windll.shell32.IsUserAnAdmin()
-    except:
-        return False
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def write_json_file(path, data):
+    """Atomically write a JSON state file"""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Failed to write {path}: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
 
 def run_as_admin():
     """Restart the application with admin privileges using multiple methods"""
@@ -116,152 +413,3175 @@ del "%~f0"
         print(f"Error restarting as admin: {e}")
         return False
 
+def find_chocolatey():
+    """Locate choco.exe without spawning a shell, returning its path or None"""
+    return PLATFORM.find_chocolatey()
+
 def check_chocolatey_installed():
     """Check if Chocolatey is installed"""
+    return find_chocolatey() is not None
+
+def get_chocolatey_version(choco_path):
+    """Ask an existing choco.exe for its version"""
+    return PLATFORM.chocolatey_version(choco_path)
+
+def check_disk_space(path=None):
+    """Return free and total bytes on the volume holding path"""
+    path = path or get_download_dir()
+    # Walk up until we hit a directory that exists so fresh paths still resolve to a volume
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    
+    usage = shutil.disk_usage(path)
+    return {'path': path, 'free': usage.free, 'total': usage.total}
+
+def get_system_volume():
+    """Return a path on the volume applications are installed to"""
+    return os.environ.get('ProgramFiles') or os.environ.get('SystemDrive', '') + os.sep or os.sep
+
+def format_duration(seconds):
+    """Format an ETA as m:ss or h:mm:ss"""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def format_size(size_mb, measured=False):
+    """Format a size in MB for display, marking estimates with ~"""
+    if size_mb < 1000:
+        text = f"{size_mb:.1f} MB" if measured and size_mb < 100 else f"{size_mb:.0f} MB"
+    else:
+        text = f"{size_mb / 1000:.1f} GB"
+    return text if measured else f"~{text}"
+
+def preflight_disk_space(total_mb, download_dir=None, installing=True):
+    """Return the volumes that cannot hold a batch as (path, required, free) byte tuples"""
+    download_bytes = int(total_mb * BYTES_PER_MB)
+    requirements = [(download_dir or get_download_dir(), download_bytes)]
+    if installing:
+        requirements.append((get_system_volume(), download_bytes * INSTALL_SPACE_FACTOR))
+    
+    volumes = {}
+    for path, required in requirements:
+        disk = check_disk_space(path)
+        try:
+            volume = os.stat(disk['path']).st_dev
+        except OSError:
+            volume = disk['path']
+        entry = volumes.setdefault(volume, {'path': disk['path'], 'free': disk['free'], 'required': DISK_SPACE_MARGIN})
+        entry['required'] += required
+    
+    return [(v['path'], v['required'], v['free']) for v in volumes.values() if v['required'] > v['free']]
+
+def check_network(host=CATALOG_HOST, port=443, timeout=3):
+    """Check that the catalog host (or the configured proxy) accepts connections"""
+    proxies = urllib.request.getproxies()
+    proxy = proxies.get('https') or proxies.get('http')
+    
+    target_host, target_port = host, port
+    if proxy and not urllib.request.proxy_bypass(host):
+        parsed = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+        target_host = parsed.hostname
+        target_port = parsed.port or 8080
+    
+    start = time.perf_counter()
     try:
-        # Try multiple ways to check for Chocolatey
-        result = subprocess.run(['choco', '--version'], 
-                              capture_output=True, text=True, timeout=10, shell=True)
-        if result.returncode == 0:
-            return True
+        with socket.create_connection((target_host, target_port), timeout=timeout):
+            pass
+        reachable = True
+    except OSError:
+        reachable = False
+    
+    return {
+        'reachable': reachable,
+        'proxy': proxy,
+        'latency_ms': round((time.perf_counter() - start) * 1000, 1)
+    }
+
+def probe_content_length(session, url, cached=None, timeout=10):
+    """Measure the size of a download with HEAD (or a one-byte range GET) and return a cache entry"""
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    
+    response = session.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+    if response.status_code == 304 and cached:
+        return dict(cached, checked_at=time.time())
+    
+    length = None
+    if response.ok and 'text/html' not in response.headers.get('Content-Type', ''):
+        length = response.headers.get('Content-Length')
+    
+    if not length or length == '0':
+        # Some CDNs refuse HEAD or omit the length, so ask for a single byte instead
+        response = session.get(url, headers={'Range': 'bytes=0-0'}, stream=True,
+                               allow_redirects=True, timeout=timeout)
+        try:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                length = content_range.rsplit('/', 1)[1]
+            elif response.ok:
+                length = response.headers.get('Content-Length')
+        finally:
+            response.close()
+    
+    if not length or not length.isdigit() or int(length) <= 1:
+        return None
+    
+    return {
+        'size': int(length),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'final_url': response.url,
+        'checked_at': time.time()
+    }
+
+class SizeProber:
+    """Measure installer sizes through a bounded pool of HEAD requests with a persisted cache"""
+    
+    def __init__(self, cache_path=None, ttl=SIZE_CACHE_TTL, max_workers=SIZE_PROBE_WORKERS):
+        self.cache_path = cache_path or os.path.join(get_state_dir(), SIZE_CACHE_FILE)
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.cache = read_json_file(self.cache_path, {}) or {}
+    
+    def get_cached(self, url, fresh_only=True):
+        with self.lock:
+            entry = self.cache.get(url)
+        if entry and fresh_only and time.time() - entry.get('checked_at', 0) > self.ttl:
+            return None
+        return entry
+    
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+    
+    def probe(self, url):
+        """Return the size entry for url, hitting the network only when the cache is stale"""
+        entry = self.get_cached(url)
+        if entry:
+            return entry
         
-        # Check if choco.exe exists in common locations
-        choco_paths = [
-            r"C:\ProgramData\chocolatey\bin\choco.exe",
-            r"C:\chocolatey\bin\choco.exe",
-            os.path.expandvars(r"%ALLUSERSPROFILE%\chocolatey\bin\choco.exe")
-        ]
+        stale = self.get_cached(url, fresh_only=False)
+        try:
+            entry = probe_content_length(self.session(), url, stale)
+        except requests.RequestException:
+            entry = None
+        
+        if entry:
+            with self.lock:
+                self.cache[url] = entry
+        return entry
+    
+    def probe_many(self, urls, callback=None, should_stop=None):
+        """Probe urls concurrently, calling callback(url, entry) as each one finishes"""
+        pending = []
+        for url in dict.fromkeys(urls):
+            entry = self.get_cached(url)
+            if entry:
+                if callback:
+                    callback(url, entry)
+            else:
+                pending.append(url)
+        
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self.probe, url): url for url in pending}
+                for future, url in futures.items():
+                    if should_stop and should_stop():
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+                    entry = future.result()
+                    if entry and callback:
+                        callback(url, entry)
+        
+        self.save()
+    
+    def save(self):
+        with self.lock:
+            data = dict(self.cache)
+        write_json_file(self.cache_path, data)
+
+class ContentValidationError(Exception):
+    """Raised when a download URL does not return an installer (usually a web page)"""
+
+def expected_magic(installer_name):
+    ext = os.path.splitext(installer_name or "")[1].lower()
+    return INSTALLER_MAGIC.get(ext) or [magic for values in INSTALLER_MAGIC.values() for magic in values]
+
+def validate_response_headers(response):
+    """Reject responses whose headers already show they are not an installer"""
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type in WEB_CONTENT_TYPES:
+        raise ContentValidationError(f"URL returned a web page ({content_type}), not an installer")
+    
+    disposition = response.headers.get('Content-Disposition', '')
+    if 'filename' in disposition:
+        file_name = disposition.split('filename', 1)[1].lstrip('*= ').strip('"\'; ')
+        if os.path.splitext(file_name)[1].lower() in ('.html', '.htm', '.php', '.aspx'):
+            raise ContentValidationError(f"URL serves '{file_name}', not an installer")
+
+def validate_leading_bytes(data, installer_name=None):
+    """Reject content whose first bytes are not an executable, MSI or archive"""
+    head = bytes(data[:16])
+    if any(head.startswith(magic) for magic in expected_magic(installer_name)):
+        return
+    
+    text = head.lstrip().lower()
+    if text.startswith((b"<!doctype", b"<html", b"<?xml", b"<head")):
+        raise ContentValidationError("URL returned an HTML page, not an installer")
+    expected = os.path.splitext(installer_name or "")[1] or "an installer"
+    raise ContentValidationError(f"Downloaded content does not look like {expected} (starts with {head[:8]!r})")
+
+class IncompleteDownloadError(Exception):
+    """Raised when the server closes the connection before sending the advertised length"""
+
+class InstallCancelledError(Exception):
+    """Raised from a download's progress callback to abandon it once the run is cancelled"""
+
+class BufferPool:
+    """Hand out preallocated, reusable bytearrays so download loops never allocate per chunk"""
+    
+    def __init__(self, block_size=DOWNLOAD_BLOCK_SIZE, count=DOWNLOAD_POOL_BUFFERS):
+        self.block_size = block_size
+        self.count = count
+        self.created = 0
+        self.free = []
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            self.created += 1
+        return bytearray(self.block_size)
+    
+    def release(self, buffer):
+        with self.lock:
+            # Keep at most count buffers around; extras from a busy moment are dropped
+            if len(self.free) < self.count and len(buffer) == self.block_size:
+                self.free.append(buffer)
+
+DOWNLOAD_BUFFER_POOL = BufferPool()
+
+def get_stream_reader(response):
+    """Return a file-like object with readinto() for the body of a streamed response"""
+    raw = response.raw
+    encoding = response.headers.get('Content-Encoding', 'identity').lower()
+    if encoding in ('', 'identity'):
+        # Read straight from http.client, which fills our buffer in place;
+        # urllib3's own readinto() allocates a temporary bytes object per call
+        fp = getattr(raw, '_fp', None)
+        if fp is not None and hasattr(fp, 'readinto'):
+            return fp
+    raw.decode_content = True
+    return raw
+
+def preallocate_file(f, length):
+    """Reserve length bytes for f so the filesystem can lay the file out contiguously"""
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, length)
+        else:
+            f.truncate(length)
+    except OSError:
+        pass
+
+class DownloadSink:
+    """Write a response body to disk in large aligned blocks read into pooled buffers"""
+    
+    def __init__(self, path, expected_length=None, fsync_policy=DEFAULT_FSYNC_POLICY,
+                 block_size=DOWNLOAD_BLOCK_SIZE, pool=None, progress_callback=None, observers=(),
+                 validator=None, offset=0, sync_callback=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        
+        self.path = path
+        self.expected_length = expected_length
+        self.fsync_policy = fsync_policy
+        self.pool = pool or (DOWNLOAD_BUFFER_POOL if block_size == DOWNLOAD_BLOCK_SIZE
+                             else BufferPool(block_size))
+        self.progress_callback = progress_callback
+        self.observers = list(observers)  # Called with each block (a memoryview) as it is written
+        self.validator = validator  # Called with the first block before anything is written
+        self.offset = offset  # Resume an earlier partial download at this byte
+        self.bytes_written = offset
+        self.sync_callback = sync_callback  # Called with bytes_written once they are fsynced to disk
+    
+    def read_block(self, reader, view):
+        """Fill view from reader, returning fewer bytes than len(view) only at end of stream"""
+        filled = 0
+        size = len(view)
+        while filled < size:
+            count = reader.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        return filled
+    
+    def write_from(self, reader):
+        """Copy reader to the target file and return the number of bytes written"""
+        buffer = self.pool.acquire()
+        view = memoryview(buffer)
+        unsynced = 0
+        started = time.monotonic()
         
-        for path in choco_paths:
-            if os.path.exists(path):
-                return True
+        try:
+            # Unbuffered: every write is already one full block
+            with open(self.path, 'r+b' if self.offset else 'wb', buffering=0) as f:
+                if self.offset:
+                    f.seek(self.offset)
+                elif self.expected_length:
+                    preallocate_file(f, self.expected_length)
                 
-        return False
-    except:
-        return False
+                while True:
+                    filled = self.read_block(reader, view)
+                    if filled:
+                        block = view[:filled]
+                        if self.validator and not self.bytes_written:
+                            self.validator(block)
+                        written = 0
+                        while written < filled:
+                            written += f.write(block[written:])
+                        for observer in self.observers:
+                            observer(block)
+                        block.release()
+                        
+                        self.bytes_written += filled
+                        METRICS.download_bytes.inc(amount=filled)
+                        unsynced += filled
+                        if self.fsync_policy == "interval" and unsynced >= FSYNC_INTERVAL:
+                            self.sync(f)
+                            unsynced = 0
+                        
+                        if self.progress_callback:
+                            self.progress_callback(self.bytes_written, self.expected_length)
+                    
+                    if filled < len(view):
+                        break
+                
+                if self.expected_length and self.bytes_written != self.expected_length:
+                    f.truncate(self.bytes_written)
+                
+                if self.fsync_policy != "never":
+                    self.sync(f)
+        finally:
+            view.release()
+            self.pool.release(buffer)
+        
+        if self.expected_length and self.bytes_written < self.expected_length:
+            raise IncompleteDownloadError(
+                f"Received {self.bytes_written} of {self.expected_length} bytes")
+        
+        elapsed = time.monotonic() - started
+        if elapsed > 0:
+            METRICS.download_throughput.observe((self.bytes_written - self.offset) / elapsed)
+        return self.bytes_written
+    
+    def sync(self, f):
+        os.fsync(f.fileno())
+        if self.sync_callback:
+            self.sync_callback(self.bytes_written)
 
-def install_chocolatey():
-    """Install Chocolatey package manager"""
+def feed_file_prefix(path, length, observers):
+    """Pass the first length bytes of a file to download observers, as if they had just arrived"""
+    with open(path, 'rb') as f:
+        while length > 0:
+            block = f.read(min(length, DOWNLOAD_BLOCK_SIZE))
+            if not block:
+                break
+            for observer in observers:
+                observer(block)
+            length -= len(block)
+
+def download_file(url, path, session=None, timeout=300, fsync_policy=DEFAULT_FSYNC_POLICY,
+                  progress_callback=None, observers=(), validate=False, installer_name=None,
+                  sync_callback=None, response_callback=None):
+    """Download url to path through a DownloadSink and return the number of bytes written
+    
+    response_callback is called with (url, response) before anything is written.
+    """
+    response = (session or requests).get(url, timeout=timeout, stream=True,
+                                         headers={'Accept-Encoding': 'identity'})
     try:
-        # PowerShell command to install Chocolatey
-        ps_command = """
-        Set-ExecutionPolicy Bypass -Scope Process -Force;
-        [System.Net.ServicePointManager]::SecurityProtocol = [System.Net.ServicePointManager]::SecurityProtocol -bor 3072;
-        iex ((New-Object System.Net.WebClient).DownloadString('https://community.chocolatey.org/install.ps1'))
-        """
-        
-        # Try using PowerShell directly
-        result = subprocess.run([
-            'powershell', '-ExecutionPolicy', 'Bypass', '-Command', ps_command
-        ], capture_output=True, text=True, timeout=300, shell=True)
-        
-        if result.returncode == 0:
-            # Refresh environment variables
-            subprocess.run(['refreshenv'], shell=True, capture_output=True)
-            return True
-        
-        # Alternative method using cmd
-        cmd_command = f'powershell -ExecutionPolicy Bypass -Command "{ps_command}"'
-        result = subprocess.run(cmd_command, shell=True, capture_output=True, text=True, timeout=300)
-        
-        return result.returncode == 0
-        
-    except Exception as e:
-        print(f"Error installing Chocolatey: {e}")
-        return False
+        response.raise_for_status()
+        
+        expected_length = None
+        if response.headers.get('Content-Encoding', 'identity').lower() in ('', 'identity'):
+            length = response.headers.get('Content-Length', '')
+            expected_length = int(length) if length.isdigit() else None
+        
+        validator = None
+        if validate:
+            validate_response_headers(response)
+            validator = lambda block: validate_leading_bytes(block, installer_name or path)
+        if response_callback:
+            response_callback(url, response)
+        
+        sink = DownloadSink(path, expected_length, fsync_policy, progress_callback=progress_callback,
+                            observers=observers, validator=validator, sync_callback=sync_callback)
+        try:
+            return sink.write_from(get_stream_reader(response))
+        except ContentValidationError:
+            os.remove(path)
+            raise
+    finally:
+        response.close()
 
-class LoadingScreen(QSplashScreen):
-    def __init__(self):
-        pixmap = QPixmap(450, 280)
-        pixmap.fill(QColor(13, 17, 23))
-        
-        super().__init__(pixmap)
-        self.setWindowFlags(Qt.SplashScreen | Qt.FramelessWindowHint)
-        
-        self.progress = 0
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_progress)
-        self.timer.start(50)
+class ResumeRejectedError(Exception):
+    """Raised when a server will not continue a partial download of the same file"""
+
+def resume_validator(response):
+    """Return the If-Range value identifying the file behind a response: a strong ETag, else Last-Modified"""
+    etag = response.headers.get('ETag', '')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified') or None
+
+def resume_download(url, path, offset, validator, session=None, timeout=300, fsync_policy=DEFAULT_FSYNC_POLICY,
+                    progress_callback=None, observers=(), sync_callback=None):
+    """Continue the partial download at path from offset and return the number of bytes written
     
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
-        painter.setPen(Qt.NoPen)
-        painter.setBrush(QColor(13, 17, 23))
-        painter.drawRoundedRect(self.rect(), 12, 12)
-        
-        painter.setPen(QColor(88, 166, 255))
-        painter.setFont(QFont("Segoe UI", 28, QFont.Bold))
-        title_rect = QRect(0, 70, self.width(), 40)
-        painter.drawText(title_rect, Qt.AlignCenter, "Spaller")
-        
-        painter.setPen(QColor(125, 133, 144))
-        painter.setFont(QFont("Segoe UI", 12))
-        subtitle_rect = QRect(0, 120, self.width(), 25)
-        painter.drawText(subtitle_rect, Qt.AlignCenter, "Chocolatey Package Installer")
-        
-        bar_width = 300
-        bar_height = 4
-        bar_x = (self.width() - bar_width) // 2
-        bar_y = 180
-        
-        painter.setPen(Qt.NoPen)
-        painter.setBrush(QColor(33, 38, 45))
-        painter.drawRoundedRect(bar_x, bar_y, bar_width, bar_height, 2, 2)
-        
-        progress_width = int((bar_width * self.progress) / 100)
-        if progress_width > 0:
-            gradient = QLinearGradient(bar_x, 0, bar_x + progress_width, 0)
-            gradient.setColorAt(0, QColor(88, 166, 255))
-            gradient.setColorAt(1, QColor(58, 139, 253))
-            painter.setBrush(QBrush(gradient))
-            painter.drawRoundedRect(bar_x, bar_y, progress_width, bar_height, 2, 2)
-        
-        painter.setPen(QColor(125, 133, 144))
-        painter.setFont(QFont("Segoe UI", 10))
-        status_rect = QRect(0, 220, self.width(), 25)
-        painter.drawText(status_rect, Qt.AlignCenter, "Checking system requirements...")
+    The Range request carries If-Range, so a server whose file has changed sends the
+    whole new file instead. That, a range starting anywhere else or a validator that
+    no longer matches raises ResumeRejectedError before anything is written.
+    """
+    headers = {'Accept-Encoding': 'identity', 'Range': f"bytes={offset}-", 'If-Range': validator}
+    response = (session or requests).get(url, timeout=timeout, stream=True, headers=headers)
+    try:
+        response.raise_for_status()
+        content_range = response.headers.get('Content-Range', '')  # "bytes 100-999/1000"
+        start = content_range.replace('bytes', '').strip().partition('-')[0]
+        total = content_range.rpartition('/')[2]
+        current = resume_validator(response)
+        if response.status_code != 206 or start != str(offset) or not total.isdigit():
+            raise ResumeRejectedError(f"server did not continue at byte {offset} (HTTP {response.status_code})")
+        if current and current != validator:
+            raise ResumeRejectedError("server now has a different file")
+        
+        sink = DownloadSink(path, int(total), fsync_policy, progress_callback=progress_callback,
+                            observers=observers, offset=offset, sync_callback=sync_callback)
+        return sink.write_from(get_stream_reader(response))
+    finally:
+        response.close()
+
+def installer_urls(app_info):
+    """Return the primary installer URL followed by any catalog mirrors, without duplicates"""
+    urls = [app_info.get('url')] + list(app_info.get('mirrors') or [])
+    return list(dict.fromkeys(url for url in urls if url))
+
+class MirrorStalledError(Exception):
+    """Raised when a mirror's throughput collapses partway through a download"""
+
+class MirrorStats:
+    """Per-host download speed and failure history, persisted to rank mirrors across runs"""
     
-    def update_progress(self):
-        self.progress = (self.progress + 2) % 101
-        self.update()
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_state_dir(), MIRROR_STATS_FILE)
+        self.lock = threading.Lock()
+        self.hosts = read_json_file(self.path, {}) or {}
+    
+    def entry(self, url):
+        host = urlparse(url).netloc.lower()
+        return self.hosts.setdefault(host, {'successes': 0, 'failures': 0, 'rate': 0.0,
+                                            'latency': 0.0, 'last_failure': 0})
+    
+    def record_success(self, url, rate, latency=None):
+        with self.lock:
+            entry = self.entry(url)
+            entry['successes'] += 1
+            if rate > 0:
+                entry['rate'] = rate if not entry['rate'] else \
+                    entry['rate'] + MIRROR_RATE_SMOOTHING * (rate - entry['rate'])
+            if latency is not None:
+                entry['latency'] = latency if not entry['latency'] else \
+                    entry['latency'] + MIRROR_RATE_SMOOTHING * (latency - entry['latency'])
+    
+    def record_failure(self, url, reason=""):
+        with self.lock:
+            entry = self.entry(url)
+            entry['failures'] += 1
+            entry['last_failure'] = time.time()
+            entry['last_error'] = str(reason)[:200]
+    
+    def score(self, url):
+        with self.lock:
+            entry = self.hosts.get(urlparse(url).netloc.lower())
+            if not entry:
+                return None
+            health = (entry['successes'] + 1) / (entry['successes'] + entry['failures'] + 2)
+            score = (entry['rate'] or 1.0) * health
+            if time.time() - entry['last_failure'] < MIRROR_FAILURE_COOLDOWN:
+                score *= 0.1
+            return score
+    
+    def rank(self, urls):
+        """Order urls best first; hosts without history keep their catalog order after known good ones"""
+        scores = {url: self.score(url) for url in urls}
+        known = [score for score in scores.values() if score is not None]
+        neutral = sorted(known)[len(known) // 2] if known else 0
+        return sorted(urls, key=lambda url: -(neutral if scores[url] is None else scores[url]))
+    
+    def save(self):
+        with self.lock:
+            data = json.loads(json.dumps(self.hosts))
+        write_json_file(self.path, data)
 
-class CustomTitleBar(QFrame):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.parent_window = parent
-        self.setFixedHeight(45)
-        self.setup_ui()
-        self.drag_position = QPoint()
+class PrefixedReader:
+    """Reader that replays bytes already received before continuing with the underlying stream"""
     
-    def setup_ui(self):
-        self.setStyleSheet("""
-            QFrame {
-                background-color: #161b22;
-                border: none;
-            }
-        """)
-        
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(20, 12, 15, 12)
-        layout.setSpacing(12)
-        
-        title_label = QLabel("Spaller")
-        title_label.setFont(QFont("Segoe UI", 14, QFont.Bold))
-        title_label.setStyleSheet("color: #58a6ff; border: none;")
-        layout.addWidget(title_label)
+    def __init__(self, prefix, reader):
+        self.prefix = memoryview(prefix)
+        self.reader = reader
+    
+    def readinto(self, view):
+        if self.prefix:
+            count = min(len(view), len(self.prefix))
+            view[:count] = self.prefix[:count]
+            self.prefix = self.prefix[count:]
+            return count
+        return self.reader.readinto(view)
+    
+    def read1(self, size):
+        if self.prefix:
+            buffer = bytearray(min(size, len(self.prefix)))
+            return bytes(buffer[:self.readinto(buffer)])
+        read1 = getattr(self.reader, 'read1', None)
+        return read1(size) if read1 else self.reader.read(size)
+
+class ThroughputGuard:
+    """Reader wrapper that raises MirrorStalledError once a mirror's throughput collapses"""
+    
+    def __init__(self, reader, window=MIRROR_CHECK_WINDOW, ratio=MIRROR_COLLAPSE_RATIO, min_rate=MIRROR_MIN_RATE):
+        self.reader = reader
+        self.window = window
+        self.ratio = ratio
+        self.min_rate = min_rate
+        self.best_rate = 0.0
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+    
+    def readinto(self, view):
+        # read1 returns whatever has arrived instead of waiting for the whole block,
+        # so a trickling mirror is noticed within one window
+        read1 = getattr(self.reader, 'read1', None)
+        if read1:
+            data = read1(len(view))
+            count = len(data)
+            view[:count] = data
+        else:
+            count = self.reader.readinto(view)
+        self.window_bytes += count or 0
+        elapsed = time.monotonic() - self.window_start
+        if elapsed >= self.window:
+            rate = self.window_bytes / elapsed
+            if rate < max(self.min_rate, self.best_rate * self.ratio):
+                raise MirrorStalledError(f"throughput fell to {rate / 1000:.0f} kB/s")
+            self.best_rate = max(self.best_rate, rate)
+            self.window_start = time.monotonic()
+            self.window_bytes = 0
+        return count
+
+def close_raced_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[0].close()
+
+class MirrorDownloader:
+    """Download one file from whichever of several mirrors is fastest, failing over mid-transfer
+    
+    The top-ranked mirrors race for the first bytes and the winner streams the file.
+    If it errors out or its throughput collapses, the next mirror continues with a
+    Range request from the last byte on disk (or re-reads and skips the prefix when
+    it cannot serve ranges). Outcomes are recorded in MirrorStats for future ranking.
+    """
+    
+    def __init__(self, session=None, stats=None, race_count=MIRROR_RACE_COUNT,
+                 read_timeout=MIRROR_READ_TIMEOUT, fsync_policy=DEFAULT_FSYNC_POLICY):
+        self.session = session
+        self.stats = stats or MirrorStats()
+        self.race_count = race_count
+        self.read_timeout = read_timeout
+        self.fsync_policy = fsync_policy
+    
+    def open(self, url, offset=0):
+        """Start a streamed GET and return (response, first bytes, seconds to first byte)"""
+        started = time.monotonic()
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+        response = (self.session or requests).get(url, timeout=(15, self.read_timeout), stream=True,
+                                                  headers=headers)
+        try:
+            response.raise_for_status()
+            if not offset:
+                first = get_stream_reader(response).read(MIRROR_RACE_BYTES)
+                return response, first, time.monotonic() - started
+            return response, b"", time.monotonic() - started
+        except Exception:
+            response.close()
+            raise
+    
+    def race(self, urls, validate, installer_name):
+        """Open urls concurrently and return (url, response, first bytes, latency) for the first good one"""
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        futures = {executor.submit(self.open, url): url for url in urls}
+        winner = None
+        last_error = None
+        pending = set(futures)
+        
+        while pending and not winner:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = futures[future]
+                try:
+                    response, first, latency = future.result()
+                except Exception as e:
+                    self.stats.record_failure(url, e)
+                    last_error = e
+                    continue
+                
+                if winner:
+                    response.close()
+                    continue
+                try:
+                    if validate:
+                        validate_response_headers(response)
+                        validate_leading_bytes(first, installer_name)
+                except ContentValidationError as e:
+                    response.close()
+                    self.stats.record_failure(url, e)
+                    last_error = e
+                    continue
+                winner = (url, response, first, latency)
+        
+        # Slower mirrors are closed as soon as they answer
+        for future in pending:
+            future.add_done_callback(close_raced_response)
+        executor.shutdown(wait=False)
+        
+        if not winner:
+            raise last_error
+        return winner
+    
+    def download(self, urls, path, progress_callback=None, observers=(), validate=False, installer_name=None,
+                 offset=0, sync_callback=None, response_callback=None):
+        """Download the file served by urls to path and return (bytes written, url that finished it)
         
-        subtitle_label = QLabel("Chocolatey Package Installer")
-        subtitle_label.setFont(QFont("Segoe UI", 9))
-        subtitle_label.setStyleSheet("color: #8b949e; border: none;")
-        layout.addWidget(subtitle_label)
+        A non-zero offset continues a partial file already at path. response_callback
+        is called with (url, response) whenever a mirror starts the file from byte 0.
+        """
+        candidates = self.stats.rank(list(dict.fromkeys(urls)))
+        expected_length = None
+        last_error = ValueError("No download URL")
+        attempts = 0
         
-        # Admin indicator
-        admin_label = QLabel("🛡️ Admin" if is_admin() else "⚠️ Limited")
-        admin_label.setFont(QFont("Segoe UI", 8, QFont.Bold))
-        admin_label.setStyleSheet("color: #3fb950; border: none;" if is_admin() else "color: #f85149; border: none;")
-        layout.addWidget(admin_label)
+        try:
+            while candidates:
+                if attempts:
+                    METRICS.download_retries.inc("mirror")
+                attempts += 1
+                if offset == 0:
+                    racers = candidates[:self.race_count]
+                    try:
+                        url, response, first, latency = self.race(racers, validate, installer_name)
+                    except Exception as e:
+                        last_error = e
+                        candidates = candidates[len(racers):]
+                        continue
+                    expected_length = self.content_length(response)
+                else:
+                    url = candidates[0]
+                    first = b""
+                    try:
+                        response, _, latency = self.open(url, offset)
+                    except Exception as e:
+                        self.stats.record_failure(url, e)
+                        last_error = e
+                        candidates.remove(url)
+                        continue
+                    if expected_length is None:
+                        expected_length = self.full_length(response)
+                candidates.remove(url)
+                
+                try:
+                    reader = self.resume_reader(response, offset, expected_length, first)
+                    if candidates:
+                        reader = ThroughputGuard(reader)
+                    validator = None
+                    if validate and not offset:
+                        validator = lambda block: validate_leading_bytes(block, installer_name)
+                    if response_callback and not offset:
+                        response_callback(url, response)
+                    sink = DownloadSink(path, expected_length, self.fsync_policy,
+                                        progress_callback=progress_callback, observers=observers,
+                                        validator=validator, offset=offset, sync_callback=sync_callback)
+                    started = time.monotonic()
+                    try:
+                        written = sink.write_from(reader)
+                    finally:
+                        offset = sink.bytes_written
+                    
+                    elapsed = time.monotonic() - started
+                    self.stats.record_success(url, (written - sink.offset) / elapsed if elapsed > 0 else 0, latency)
+                    return written, url
+                except (ContentValidationError, MirrorStalledError, IncompleteDownloadError,
+                        requests.RequestException, OSError, ValueError) as e:
+                    self.stats.record_failure(url, e)
+                    last_error = e
+                    if isinstance(e, ContentValidationError):
+                        offset = 0
+                finally:
+                    response.close()
+            
+            if isinstance(last_error, ContentValidationError) and os.path.exists(path):
+                os.remove(path)
+            raise last_error
+        finally:
+            self.stats.save()
+    
+    def content_length(self, response):
+        if response.headers.get('Content-Encoding', 'identity').lower() not in ('', 'identity'):
+            return None
+        length = response.headers.get('Content-Length', '')
+        return int(length) if length.isdigit() else None
+    
+    def full_length(self, response):
+        """Return the size of the whole file behind a response that may be a byte range"""
+        if response.status_code == 206:
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            return int(total) if total.isdigit() else None
+        return self.content_length(response)
+    
+    def resume_reader(self, response, offset, expected_length, first):
+        """Return a reader positioned at offset for this response"""
+        reader = get_stream_reader(response)
+        if not offset:
+            return PrefixedReader(first, reader)
+        
+        if response.status_code == 206:
+            content_range = response.headers.get('Content-Range', '')  # "bytes 100-999/1000"
+            start = content_range.replace('bytes', '').strip().partition('-')[0]
+            total = content_range.rpartition('/')[2]
+            if start != str(offset):
+                raise ValueError(f"mirror resumed at byte {start}, expected {offset}")
+            if expected_length and total.isdigit() and int(total) != expected_length:
+                raise ValueError("mirror serves a different file size")
+            return reader
+        
+        # No range support: read and drop what is already on disk
+        length = self.content_length(response)
+        if expected_length and length and length != expected_length:
+            raise ValueError("mirror serves a different file size")
+        remaining = offset
+        scratch = bytearray(min(offset, DOWNLOAD_BLOCK_SIZE))
+        view = memoryview(scratch)
+        while remaining:
+            count = reader.readinto(view[:min(remaining, len(view))])
+            if not count:
+                raise IncompleteDownloadError("mirror closed the connection while skipping ahead")
+            remaining -= count
+        return reader
+
+def check_installer_url(session, url, installer_name=None, timeout=15):
+    """Fetch only the headers and first bytes of url; return None if it serves an installer, else the problem"""
+    try:
+        response = session.get(url, stream=True, timeout=timeout, allow_redirects=True,
+                               headers={'Accept-Encoding': 'identity'})
+    except requests.RequestException as e:
+        return f"request failed: {e.__class__.__name__}"
+    
+    try:
+        if not response.ok:
+            return f"HTTP {response.status_code}"
+        validate_response_headers(response)
+        validate_leading_bytes(get_stream_reader(response).read(16), installer_name)
+        return None
+    except ContentValidationError as e:
+        return str(e)
+    except (requests.RequestException, OSError) as e:
+        return f"read failed: {e.__class__.__name__}"
+    finally:
+        response.close()
+
+def check_chocolatey_package(session, package_id, timeout=15):
+    """Check that a package id exists on the community repository"""
+    try:
+        response = session.head(CHOCOLATEY_PACKAGE_URL + package_id, timeout=timeout, allow_redirects=True)
+    except requests.RequestException as e:
+        return f"request failed: {e.__class__.__name__}"
+    return None if response.ok else f"package not found (HTTP {response.status_code})"
+
+class ProgressCoalescer:
+    """Merge byte-level progress from any number of download workers into batched, rate-limited updates
+    
+    Workers only record their latest counters under a lock. A single flusher thread
+    wakes max_rate times per second and hands everything that changed since the last
+    tick to emit() as one batch of (key, done, total, rate, eta) tuples, so no key is
+    reported more than max_rate times per second and workers never wait on delivery.
+    """
+    
+    def __init__(self, emit, max_rate=PROGRESS_UPDATES_PER_SECOND):
+        self.emit = emit
+        self.interval = 1.0 / max_rate
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = set()
+        self.finished = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="progress-coalescer", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+    
+    def update(self, key, done, total=None):
+        """Record progress for key; cheap enough to call for every block written"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                now = time.monotonic()
+                entry = self.entries[key] = {
+                    'done': 0, 'total': None, 'rate': 0.0,
+                    'sample_time': now, 'sample_done': done
+                }
+            entry['done'] = done
+            entry['total'] = total
+            self.dirty.add(key)
+    
+    def finish(self, key):
+        """Deliver the final state for key on the next tick and then forget it"""
+        with self.lock:
+            if key in self.entries:
+                self.dirty.add(key)
+                self.finished.add(key)
+    
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+    
+    def flush(self):
+        now = time.monotonic()
+        batch = []
+        with self.lock:
+            for key in self.dirty:
+                entry = self.entries[key]
+                elapsed = now - entry['sample_time']
+                if elapsed > 0:
+                    sample = (entry['done'] - entry['sample_done']) / elapsed
+                    if entry['rate']:
+                        entry['rate'] += PROGRESS_RATE_SMOOTHING * (sample - entry['rate'])
+                    else:
+                        entry['rate'] = sample
+                    entry['sample_time'] = now
+                    entry['sample_done'] = entry['done']
+                
+                rate = entry['rate']
+                total = entry['total']
+                eta = (total - entry['done']) / rate if total and rate > 0 else -1.0
+                batch.append((key, entry['done'], total, rate, eta))
+            
+            self.dirty.clear()
+            for key in self.finished:
+                self.entries.pop(key, None)
+            self.finished.clear()
+        
+        if batch:
+            self.emit(batch)
+
+class InstallEvent:
+    """Base class for the typed events an install run publishes for each app"""
+    
+    kind = "event"
+    fields = ()
+    
+    def __init__(self, app_id, app_name, index, total):
+        self.app_id = app_id
+        self.app_name = app_name
+        self.index = index  # position of the app in the run, from 0
+        self.total = total  # number of apps in the run
+        self.timestamp = time.time()
+    
+    def to_dict(self):
+        data = {'event': self.kind, 'app_id': self.app_id, 'app': self.app_name,
+                'index': self.index, 'total': self.total, 'time': self.timestamp}
+        for field in self.fields:
+            data[field] = getattr(self, field)
+        return data
+
+class Queued(InstallEvent):
+    kind = "queued"
+
+class Resolving(InstallEvent):
+    """Looking up the package, or the installer in the cache, a peer or the bundle"""
+    kind = "resolving"
+    fields = ('backend',)
+    
+    def __init__(self, app_id, app_name, index, total, backend=""):
+        super().__init__(app_id, app_name, index, total)
+        self.backend = backend  # install backend about to be tried
+
+class Downloading(InstallEvent):
+    kind = "downloading"
+    fields = ('done', 'size', 'rate', 'eta')
+    
+    def __init__(self, app_id, app_name, index, total, done, size=None, rate=0.0, eta=-1.0):
+        super().__init__(app_id, app_name, index, total)
+        self.done = done  # bytes received so far
+        self.size = size  # expected bytes, None if unknown
+        self.rate = rate  # bytes per second
+        self.eta = eta  # seconds, -1 if unknown
+
+class Verifying(InstallEvent):
+    kind = "verifying"
+
+class Installing(InstallEvent):
+    kind = "installing"
+
+class Succeeded(InstallEvent):
+    kind = "succeeded"
+    fields = ('duration', 'restart', 'backend')
+    
+    def __init__(self, app_id, app_name, index, total, duration=0.0, restart="", backend=""):
+        super().__init__(app_id, app_name, index, total)
+        self.duration = duration
+        self.restart = restart  # "required" or "initiated" if the installer asked for a restart
+        self.backend = backend  # install backend that installed the app
+
+class Failed(InstallEvent):
+    kind = "failed"
+    fields = ('reason', 'duration')
+    
+    def __init__(self, app_id, app_name, index, total, reason="Installation failed", duration=0.0):
+        super().__init__(app_id, app_name, index, total)
+        self.reason = reason
+        self.duration = duration
+
+class Skipped(InstallEvent):
+    kind = "skipped"
+    fields = ('reason',)
+    
+    def __init__(self, app_id, app_name, index, total, reason=""):
+        super().__init__(app_id, app_name, index, total)
+        self.reason = reason
+
+class RunFinished(InstallEvent):
+    """Published once after the last app, with the outcome counts for the whole run"""
+    kind = "finished"
+    fields = ('succeeded', 'failed', 'skipped', 'error', 'restart', 'restart_apps', 'waiting')
+    
+    def __init__(self, total, succeeded, failed, skipped, error="", restart="", restart_apps=(), waiting=0):
+        super().__init__(None, "", total, total)
+        self.succeeded = succeeded
+        self.failed = failed
+        self.skipped = skipped
+        self.error = error
+        self.restart = restart  # "", "required" or "initiated" (an installer is already restarting Windows)
+        self.restart_apps = list(restart_apps)  # names of the apps that asked for the restart
+        self.waiting = waiting  # apps left to install after the restart
+
+class EventSubscription:
+    """One subscriber's queue, drained in batches by its own delivery thread
+    
+    publish() only appends under a lock, so a slow handler delays nobody but itself.
+    While a batch is pending, a newer Downloading event for the same app replaces the
+    older one, which keeps the queue bounded by the number of apps in the run.
+    """
+    
+    def __init__(self, handler, kinds=None, max_rate=EVENT_SUBSCRIBER_RATE):
+        self.handler = handler
+        self.kinds = set(kinds) if kinds else None
+        self.interval = 1.0 / max_rate
+        self.lock = threading.Lock()
+        self.pending = []
+        self.download_slots = {}  # app id -> index of its Downloading event in pending
+        self.wake = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="event-subscriber", daemon=True)
+        self.thread.start()
+    
+    def put(self, event):
+        if self.kinds and event.kind not in self.kinds:
+            return
+        with self.lock:
+            if isinstance(event, Downloading):
+                slot = self.download_slots.get(event.app_id)
+                if slot is not None:
+                    self.pending[slot] = event
+                    return
+                self.download_slots[event.app_id] = len(self.pending)
+            self.pending.append(event)
+        self.wake.set()
+    
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                batch, self.pending = self.pending, []
+                self.download_slots.clear()
+                closed = self.closed
+            
+            if batch:
+                try:
+                    self.handler(batch)
+                except Exception as e:
+                    print(f"Install event subscriber failed: {e}")
+            if closed:
+                return
+            time.sleep(self.interval)
+    
+    def close(self, timeout=5):
+        with self.lock:
+            self.closed = True
+        self.wake.set()
+        self.thread.join(timeout)
+
+class InstallEventBus:
+    """Publish install events to any number of independent subscribers"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+    
+    def subscribe(self, handler, kinds=None, max_rate=EVENT_SUBSCRIBER_RATE):
+        """Call handler(list_of_events) from a dedicated thread; kinds limits which events it sees"""
+        subscription = EventSubscription(handler, kinds, max_rate)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+        subscription.close()
+    
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+    
+    def close(self):
+        """Deliver everything still queued and stop the delivery threads"""
+        with self.lock:
+            subscriptions, self.subscriptions = self.subscriptions, []
+        for subscription in subscriptions:
+            subscription.close()
+
+LIFECYCLE_EVENTS = ("queued", "resolving", "verifying", "installing", "succeeded", "failed", "skipped", "finished")
+
+class JsonlEventLog:
+    """Subscriber that appends lifecycle events to a JSON-lines telemetry file"""
+    
+    def __init__(self, path=None, run_id=None):
+        self.path = path or os.path.join(get_state_dir(), EVENT_LOG_FILE)
+        self.run_id = run_id or uuid.uuid4().hex
+    
+    def attach(self, bus):
+        return bus.subscribe(self, kinds=LIFECYCLE_EVENTS)
+    
+    def __call__(self, batch):
+        lines = []
+        for event in batch:
+            data = event.to_dict()
+            data['run'] = self.run_id
+            lines.append(json.dumps(data))
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Failed to write {self.path}: {e}")
+
+def process_identity(pid=None):
+    """Return (pid, start time) for a process, so a reused pid is not mistaken for it"""
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            return pid, psutil.Process(pid).create_time()
+        except psutil.Error:
+            pass
+    return pid, None
+
+def process_alive(pid, started):
+    """Whether the process recorded as (pid, started) is still running"""
+    if not pid:
+        return False
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            created = process.create_time()
+            if process.status() == psutil.STATUS_ZOMBIE:
+                return False
+        except psutil.Error:
+            return False
+        return started is None or abs(created - started) < 1
+    if os.name == 'nt':
+        return False  # Cannot tell without psutil; assume the journal's owner is gone
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+def open_journal(source):
+    """Open the job journal, or return None (and install without one) if it cannot be used"""
+    try:
+        return JobJournal(source=source)
+    except sqlite3.Error as e:
+        print(f"Job journal unavailable, interrupted runs cannot be resumed: {e}")
+        return None
+
+class JobJournal:
+    """Crash-safe record of install runs in SQLite, so an interrupted run can be resumed
+    
+    Every lifecycle transition of every app is written synchronously as it happens,
+    together with downloaded artifacts and the byte offset reached by partial
+    downloads. A run whose owning process is gone (crash, reboot) or that was
+    cancelled, and that still has unfinished apps, is offered for resuming.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id TEXT PRIMARY KEY, source TEXT, method TEXT, action TEXT, apps TEXT, state TEXT,
+            pid INTEGER, pid_started REAL, created REAL, updated REAL);
+        CREATE TABLE IF NOT EXISTS apps (
+            run_id TEXT, app_id TEXT, position INTEGER, state TEXT, reason TEXT, artifact TEXT, sha256 TEXT,
+            partial TEXT, partial_url TEXT, partial_bytes INTEGER, partial_validator TEXT, updated REAL,
+            PRIMARY KEY (run_id, app_id));
+        CREATE TABLE IF NOT EXISTS transitions (run_id TEXT, app_id TEXT, state TEXT, detail TEXT, time REAL);
+        CREATE INDEX IF NOT EXISTS transitions_run ON transitions (run_id);
+    """
+    
+    def __init__(self, path=None, source="gui"):
+        self.path = path or os.path.join(get_state_dir(), JOURNAL_FILE)
+        self.source = source  # "gui", "cli" or "agent": each only resumes its own runs
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL survives a killed process or a reboot; NORMAL sync only risks the newest rows on power loss
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(apps)")}
+        if 'partial_validator' not in columns:
+            self.db.execute("ALTER TABLE apps ADD COLUMN partial_validator TEXT")
+    
+    def execute(self, statements):
+        """Run (sql, parameters) pairs in one transaction; a failed write never stops an install"""
+        with self.lock:
+            try:
+                self.db.execute("BEGIN IMMEDIATE")
+                try:
+                    for sql, parameters in statements:
+                        self.db.execute(sql, parameters)
+                    self.db.execute("COMMIT")
+                except sqlite3.Error:
+                    self.db.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                print(f"Could not write the job journal: {e}")
+    
+    def query(self, sql, parameters=()):
+        with self.lock:
+            return self.db.execute(sql, parameters).fetchall()
+    
+    def start_run(self, run_id, selected_apps, method, action="install"):
+        """Record a new run, or take over an interrupted one that is being resumed"""
+        now = time.time()
+        pid, pid_started = process_identity()
+        statements = [("INSERT OR IGNORE INTO runs (id, source, method, action, apps, created) VALUES (?, ?, ?, ?, ?, ?)",
+                       (run_id, self.source, method, action, json.dumps(selected_apps), now)),
+                      ("UPDATE runs SET state = 'running', pid = ?, pid_started = ?, updated = ? WHERE id = ?",
+                       (pid, pid_started, now, run_id))]
+        for position, (app_id, _) in enumerate(selected_apps):
+            statements.append(("INSERT OR IGNORE INTO apps (run_id, app_id, position, state, updated) "
+                               "VALUES (?, ?, ?, 'pending', ?)", (run_id, app_id, position, now)))
+        self.execute(statements)
+        self.prune()
+    
+    def record(self, run_id, event):
+        """Write one lifecycle event of a run"""
+        reason = getattr(event, 'reason', "") or getattr(event, 'restart', "")
+        state = event.kind
+        if isinstance(event, Skipped) and reason in ("Cancelled", RESTART_WAIT_REASON):
+            state = "pending"  # Not installed yet, so a resume should pick it up
+        self.execute([("UPDATE apps SET state = ?, reason = ?, updated = ? WHERE run_id = ? AND app_id = ?",
+                       (state, reason, event.timestamp, run_id, event.app_id)),
+                      ("INSERT INTO transitions VALUES (?, ?, ?, ?, ?)",
+                       (run_id, event.app_id, event.kind, reason, event.timestamp))])
+    
+    def begin_partial(self, run_id, app_id, path, url, validator=None):
+        """Note where a download from byte 0 is going and the ETag or Last-Modified of its source"""
+        self.execute([("UPDATE apps SET partial = ?, partial_url = ?, partial_bytes = 0, partial_validator = ? "
+                       "WHERE run_id = ? AND app_id = ?", (path, url, validator, run_id, app_id))])
+    
+    def record_progress(self, run_id, app_id, done):
+        """Note how many bytes of a partial download are on disk (called after each fsync)"""
+        self.execute([("UPDATE apps SET partial_bytes = ? WHERE run_id = ? AND app_id = ? AND partial IS NOT NULL",
+                       (done, run_id, app_id))])
+    
+    def record_artifact(self, run_id, app_id, path, sha256):
+        """Remember the verified installer of an app; the partial download is gone"""
+        self.execute([("UPDATE apps SET artifact = ?, sha256 = ?, partial = NULL, partial_url = NULL, "
+                       "partial_bytes = NULL, partial_validator = NULL WHERE run_id = ? AND app_id = ?",
+                       (path, sha256, run_id, app_id))])
+    
+    def finish_run(self, run_id, state):
+        self.execute([("UPDATE runs SET state = ?, pid = NULL, updated = ? WHERE id = ?",
+                       (state, time.time(), run_id))])
+    
+    def resume_state(self, run_id):
+        """Return {app id: {'sha256', 'partial', 'partial_url', 'partial_bytes', 'partial_validator'}} for a run"""
+        rows = self.query("SELECT app_id, sha256, partial, partial_url, partial_bytes, partial_validator "
+                          "FROM apps WHERE run_id = ?", (run_id,))
+        return {app_id: {'sha256': sha256, 'partial': partial, 'partial_url': partial_url,
+                         'partial_bytes': partial_bytes or 0, 'partial_validator': partial_validator}
+                for app_id, sha256, partial, partial_url, partial_bytes, partial_validator in rows}
+    
+    def resumable_runs(self):
+        """Return this source's interrupted or cancelled runs that still have apps to install, newest first
+        
+        Runs left waiting for a restart are only offered once Windows has actually restarted.
+        """
+        runs = []
+        booted = psutil.boot_time() if psutil is not None else None
+        for run_id, run_source, method, action, apps, state, pid, pid_started, created, updated in self.query(
+                "SELECT id, source, method, action, apps, state, pid, pid_started, created, updated FROM runs "
+                "WHERE state IN ('running', 'cancelled', 'restart') ORDER BY created DESC"):
+            if run_source != self.source:
+                continue
+            if state == 'running' and process_alive(pid, pid_started):
+                continue
+            if state == 'restart' and booted is not None and booted < (updated or 0):
+                continue
+            remaining = {app_id for (app_id,) in self.query(
+                "SELECT app_id FROM apps WHERE run_id = ? AND state NOT IN ('succeeded', 'failed', 'skipped')",
+                (run_id,))}
+            if not remaining:
+                self.finish_run(run_id, 'completed')
+                continue
+            selected_apps = [(app_id, app_data) for app_id, app_data in json.loads(apps) if app_id in remaining]
+            runs.append({'id': run_id, 'source': run_source, 'method': method, 'action': action,
+                         'state': {'running': "interrupted", 'restart': "waiting for a restart"}.get(state, state),
+                         'created': created,
+                         'total': len(json.loads(apps)), 'remaining': selected_apps})
+        return runs
+    
+    def abandon(self, run_id):
+        self.finish_run(run_id, 'abandoned')
+    
+    def prune(self):
+        """Forget all but the newest JOURNAL_KEEP_RUNS runs"""
+        old = [run_id for (run_id,) in self.query("SELECT id FROM runs ORDER BY created DESC LIMIT -1 OFFSET ?",
+                                                  (JOURNAL_KEEP_RUNS,))]
+        statements = []
+        for run_id in old:
+            for table, column in (("transitions", "run_id"), ("apps", "run_id"), ("runs", "id")):
+                statements.append((f"DELETE FROM {table} WHERE {column} = ?", (run_id,)))
+        if statements:
+            self.execute(statements)
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class CliEventRenderer:
+    """Subscriber that prints install progress to a terminal"""
+    
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self.progress_shown = False
+    
+    def attach(self, bus):
+        return bus.subscribe(self)
+    
+    def __call__(self, batch):
+        for event in batch:
+            if isinstance(event, Downloading):
+                if self.live:
+                    self.show_download(event)
+                continue
+            
+            prefix = f"[{event.index + 1}/{event.total}] {event.app_name}"
+            if isinstance(event, Queued):
+                continue
+            elif isinstance(event, Resolving):
+                line = f"{prefix}: resolving" + (f" via {event.backend}" if event.backend else "")
+            elif isinstance(event, Verifying):
+                line = f"{prefix}: verifying"
+            elif isinstance(event, Installing):
+                line = f"{prefix}: installing"
+            elif isinstance(event, Succeeded):
+                line = f"{prefix}: installed in {format_duration(event.duration)}"
+                if event.backend:
+                    line += f" via {event.backend}"
+                if event.restart:
+                    line += f" (restart {event.restart})"
+            elif isinstance(event, Failed):
+                line = f"{prefix}: FAILED - {event.reason}"
+            elif isinstance(event, Skipped):
+                line = f"{prefix}: skipped - {event.reason}"
+            elif isinstance(event, RunFinished):
+                line = (f"Done: {event.succeeded} installed, {event.failed} failed, {event.skipped} skipped"
+                        + (f" ({event.error})" if event.error else ""))
+                if event.restart:
+                    line += f"\nRestart required by: {', '.join(event.restart_apps)}"
+                if event.waiting:
+                    line += f"\n{event.waiting} app(s) will install after the restart"
+            else:
+                continue
+            self.write_line(line)
+        self.stream.flush()
+    
+    def show_download(self, event):
+        if event.size:
+            text = f"{event.done / BYTES_PER_MB:.0f}/{event.size / BYTES_PER_MB:.0f} MB"
+        else:
+            text = f"{event.done / BYTES_PER_MB:.0f} MB"
+        if event.rate > 0:
+            text += f" · {event.rate / BYTES_PER_MB:.1f} MB/s"
+        if event.eta >= 0:
+            text += f" · ETA {format_duration(event.eta)}"
+        self.stream.write(f"\r[{event.index + 1}/{event.total}] {event.app_name}: downloading {text}\033[K")
+        self.progress_shown = True
+    
+    def write_line(self, line):
+        if self.progress_shown:
+            self.stream.write("\r\033[K")
+            self.progress_shown = False
+        self.stream.write(line + "\n")
+
+class MetricFamily:
+    """A counter, gauge or histogram with optional labels
+    
+    Updates take one short lock, so they are cheap enough for the per-block
+    download path. Histogram buckets are cumulative, as Prometheus expects.
+    """
+    
+    def __init__(self, name, description, kind="counter", labels=(), buckets=()):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.samples = {}  # label values -> value, or [bucket counts, sum, count] for histograms
+    
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.samples[label_values] = self.samples.get(label_values, 0) + amount
+    
+    def set(self, value, *label_values):
+        with self.lock:
+            self.samples[label_values] = value
+    
+    def observe(self, value, *label_values):
+        with self.lock:
+            sample = self.samples.get(label_values)
+            if sample is None:
+                sample = self.samples[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[0][i] += 1
+            sample[1] += value
+            sample[2] += 1
+    
+    def value(self, *label_values):
+        with self.lock:
+            return self.samples.get(label_values, 0)
+    
+    def copy_samples(self):
+        with self.lock:
+            if self.kind == "histogram":
+                return sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self.samples.items())
+            return sorted(self.samples.items())
+    
+    def label_text(self, label_values, extra=()):
+        pairs = list(zip(self.labels, label_values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+    
+    def render(self):
+        """Return the family in the Prometheus text exposition format, one line per sample"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in self.copy_samples():
+            if self.kind == "histogram":
+                counts, total, count = value
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = self.label_text(label_values, [('le', format_sample(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self.label_text(label_values, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{self.label_text(label_values)} {format_sample(total)}")
+                lines.append(f"{self.name}_count{self.label_text(label_values)} {count}")
+            else:
+                lines.append(f"{self.name}{self.label_text(label_values)} {format_sample(value)}")
+        return lines
+    
+    def snapshot(self):
+        samples = []
+        for label_values, value in self.copy_samples():
+            sample = {'labels': dict(zip(self.labels, label_values))}
+            if self.kind == "histogram":
+                counts, total, count = value
+                buckets = {format_sample(bound): bucket_count for bound, bucket_count in zip(self.buckets, counts)}
+                sample.update(buckets=buckets, sum=total, count=count)
+            else:
+                sample['value'] = value
+            samples.append(sample)
+        return {'type': self.kind, 'help': self.description, 'samples': samples}
+
+def format_sample(value):
+    """Render a sample value exactly: integers without an exponent, floats in full precision"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def failure_label(reason):
+    """Reduce a free-text failure reason to a low-cardinality metrics label"""
+    reason = (reason or "").lower()
+    for marker, label in FAILURE_LABELS:
+        if marker in reason:
+            return label
+    return "other"
+
+class MetricsRegistry:
+    """Counters and histograms fed from the catalog, download and install paths"""
+    
+    def __init__(self):
+        self.families = []
+        self.catalog_fetch_seconds = self.add(
+            "spaller_catalog_fetch_seconds", "Time to download and parse a catalog", "histogram",
+            ("mode",), METRICS_LATENCY_BUCKETS)
+        self.download_bytes = self.add("spaller_download_bytes_total", "Downloaded bytes written to disk")
+        self.download_throughput = self.add(
+            "spaller_download_throughput_bytes_per_second", "Average transfer rate of each finished download",
+            "histogram", buckets=METRICS_THROUGHPUT_BUCKETS)
+        self.download_retries = self.add(
+            "spaller_download_retries_total", "Transfers retried on another mirror or peer", labels=("source",))
+        self.cache_requests = self.add(
+            "spaller_installer_cache_requests_total", "Installer cache lookups before downloading", labels=("result",))
+        self.install_duration = self.add(
+            "spaller_install_duration_seconds", "Time from starting an app to its outcome", "histogram",
+            ("outcome",), METRICS_DURATION_BUCKETS)
+        self.install_failures = self.add(
+            "spaller_install_failures_total", "Failed installs by reason", labels=("reason",))
+        self.queue_depth = self.add("spaller_install_queue_depth", "Apps waiting for an install worker", "gauge")
+        self.installs_active = self.add("spaller_installs_active", "Apps being downloaded or installed", "gauge")
+        self.restart_requests = self.add(
+            "spaller_restart_requests_total", "Installers that asked for a Windows restart", labels=("request",))
+        self.backend_installs = self.add(
+            "spaller_backend_installs_total", "Install attempts by backend and outcome", labels=("backend", "outcome"))
+        self.ui_stall_duration = self.add(
+            "spaller_ui_stall_seconds", "GUI event-loop stalls caught by the watchdog, by the blocking operation",
+            "histogram", ("operation",), STALL_BUCKETS)
+    
+    def add(self, name, description, kind="counter", labels=(), buckets=()):
+        family = MetricFamily(name, description, kind, labels, buckets)
+        self.families.append(family)
+        return family
+    
+    def cache_hit_ratio(self):
+        hits, misses = self.cache_requests.value("hit"), self.cache_requests.value("miss")
+        return hits / (hits + misses) if hits + misses else 0.0
+    
+    def render(self):
+        lines = []
+        for family in self.families:
+            lines.extend(family.render())
+        lines.extend(["# HELP spaller_installer_cache_hit_ratio Share of cache lookups that avoided a download",
+                      "# TYPE spaller_installer_cache_hit_ratio gauge",
+                      f"spaller_installer_cache_hit_ratio {format_sample(self.cache_hit_ratio())}"])
+        return "\n".join(lines) + "\n"
+    
+    def snapshot(self):
+        return {'generated': time.time(), 'pid': os.getpid(),
+                'metrics': {family.name: family.snapshot() for family in self.families},
+                'installer_cache_hit_ratio': self.cache_hit_ratio()}
+
+METRICS = MetricsRegistry()
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serve the registry as Prometheus text on /metrics and as JSON on /metrics.json"""
+    
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self.send_body(self.server.registry.render().encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/metrics.json":
+            self.send_body(json.dumps(self.server.registry.snapshot()).encode('utf-8'), "application/json")
+        else:
+            self.send_body(b"not found\n", "text/plain", 404)
+    
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class MetricsExporter:
+    """Serve METRICS over HTTP for scraping and write a JSON snapshot to the state directory periodically"""
+    
+    def __init__(self, registry=None, port=0, bind=METRICS_BIND, snapshot_path=None,
+                 interval=METRICS_SNAPSHOT_INTERVAL):
+        self.registry = registry or METRICS
+        self.port = port
+        self.bind = bind
+        self.snapshot_path = snapshot_path or os.path.join(get_state_dir(), METRICS_SNAPSHOT_FILE)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.server = None
+    
+    def start(self):
+        self.server = ThreadingHTTPServer((self.bind, self.port), MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.server.registry = self.registry
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+        threading.Thread(target=self.write_snapshots, name="metrics-snapshot", daemon=True).start()
+        return self
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.write_snapshot()
+    
+    def write_snapshots(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_snapshot()
+    
+    def write_snapshot(self):
+        try:
+            write_json_file(self.snapshot_path, self.registry.snapshot())
+        except OSError as e:
+            print(f"Could not write metrics snapshot: {e}")
+
+class PrerequisiteProber:
+    """Run the independent startup checks concurrently, caching slow results on disk"""
+    
+    def __init__(self, cache_path=None, ttl=PREREQ_CACHE_TTL, network_ttl=NETWORK_PROBE_TTL):
+        self.cache_path = cache_path or os.path.join(get_state_dir(), PREREQ_CACHE_FILE)
+        self.ttl = ttl
+        self.network_ttl = network_ttl
+        self.lock = threading.Lock()
+        self.cache = read_json_file(self.cache_path, {}) or {}
+    
+    def probe_all(self, force=False):
+        """Run every probe and return a dict of results"""
+        start = time.perf_counter()
+        probes = {
+            'admin': is_admin,
+            'chocolatey': lambda: self.probe_chocolatey(force),
+            'disk': check_disk_space,
+            'network': lambda: self.probe_network(force)
+        }
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+            futures = {name: executor.submit(probe) for name, probe in probes.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = None
+                    print(f"Prerequisite probe '{name}' failed: {e}")
+        
+        self.save()
+        results['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return results
+    
+    def probe_chocolatey(self, force=False):
+        """Locate Chocolatey and read its version, reusing the cached version if the binary is unchanged"""
+        path = find_chocolatey()
+        if not path:
+            return {'path': None, 'version': None}
+        
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        
+        cached = self.get_cached('chocolatey', self.ttl)
+        if (not force and cached and cached.get('path') == path
+                and cached.get('mtime') == mtime):
+            return cached
+        
+        value = {'path': path, 'version': get_chocolatey_version(path), 'mtime': mtime}
+        self.set_cached('chocolatey', value)
+        return value
+    
+    def probe_network(self, force=False):
+        """Check network reachability, reusing a recent result"""
+        cached = self.get_cached('network', self.network_ttl)
+        if not force and cached and cached.get('reachable'):
+            return cached
+        
+        value = check_network()
+        self.set_cached('network', value)
+        return value
+    
+    def get_cached(self, name, ttl):
+        with self.lock:
+            entry = self.cache.get(name)
+        if not entry or time.time() - entry.get('checked_at', 0) > ttl:
+            return None
+        return entry.get('value')
+    
+    def set_cached(self, name, value):
+        with self.lock:
+            self.cache[name] = {'value': value, 'checked_at': time.time()}
+    
+    def invalidate(self, *names):
+        """Drop cached results so the next probe runs them for real"""
+        with self.lock:
+            for name in names or list(self.cache.keys()):
+                self.cache.pop(name, None)
+        self.save()
+    
+    def save(self):
+        with self.lock:
+            data = dict(self.cache)
+        write_json_file(self.cache_path, data)
+
+def install_chocolatey(bundle=None):
+    """Install Chocolatey package manager"""
+    if bundle:
+        return install_chocolatey_offline(bundle)
+    
+    try:
+        # PowerShell command to install Chocolatey
+        ps_command = """
+        Set-ExecutionPolicy Bypass -Scope Process -Force;
+        [System.Net.ServicePointManager]::SecurityProtocol = [System.Net.ServicePointManager]::SecurityProtocol -bor 3072;
+        iex ((New-Object System.Net.WebClient).DownloadString('https://community.chocolatey.org/install.ps1'))
+        """
+        
+        # Try using PowerShell directly
+        result = subprocess.run([
+            'powershell', '-ExecutionPolicy', 'Bypass', '-Command', ps_command
+        ], capture_output=True, text=True, timeout=300, shell=True)
+        
+        if result.returncode == 0:
+            # Refresh environment variables
+            subprocess.run(['refreshenv'], shell=True, capture_output=True)
+            return True
+        
+        # Alternative method using cmd
+        cmd_command = f'powershell -ExecutionPolicy Bypass -Command "{ps_command}"'
+        result = subprocess.run(cmd_command, shell=True, capture_output=True, text=True, timeout=300)
+        
+        return result.returncode == 0
+        
+    except Exception as e:
+        print(f"Error installing Chocolatey: {e}")
+        return False
+
+def install_chocolatey_offline(bundle):
+    """Install Chocolatey from the bootstrap script and nupkg shipped in an offline bundle"""
+    script_path = bundle.path_for(bundle.manifest.get('chocolatey', {}).get('script'))
+    nupkg_path = bundle.path_for(bundle.manifest.get('chocolatey', {}).get('package'))
+    if not script_path or not nupkg_path:
+        print("Offline bundle does not contain the Chocolatey bootstrap")
+        return False
+    
+    try:
+        # install.ps1 installs from ChocolateyDownloadUrl instead of the community repository
+        env = dict(os.environ, ChocolateyDownloadUrl=nupkg_path)
+        ps_command = f"Set-ExecutionPolicy Bypass -Scope Process -Force; & '{script_path}'"
+        result = subprocess.run([
+            'powershell', '-ExecutionPolicy', 'Bypass', '-Command', ps_command
+        ], capture_output=True, text=True, timeout=300, env=env)
+        return result.returncode == 0
+    except Exception as e:
+        print(f"Error installing Chocolatey from bundle: {e}")
+        return False
+
+class StreamingHasher:
+    """Digest a download from the blocks a DownloadSink writes, so verifying needs no second pass
+    
+    SHA-256 is always computed because it keys the installer cache; any other
+    algorithms are added on request.
+    """
+    
+    def __init__(self, algorithms=()):
+        self.digests = {name: hashlib.new(name) for name in dict.fromkeys(("sha256",) + tuple(algorithms))}
+        self.size = 0
+    
+    def feed(self, block):
+        for digest in self.digests.values():
+            digest.update(block)
+        self.size += len(block)
+    
+    def hexdigests(self):
+        return {name: digest.hexdigest() for name, digest in self.digests.items()}
+
+def file_digests(path, algorithms=()):
+    """Hash a file in large blocks with every requested algorithm in one pass"""
+    hasher = StreamingHasher(algorithms)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_BLOCK_SIZE), b''):
+            hasher.feed(block)
+    return hasher.hexdigests()
+
+def file_sha256(path):
+    """Hash a file in large blocks"""
+    return file_digests(path)['sha256']
+
+def file_signature(path):
+    """Return [size, mtime_ns] for a file, which changes whenever its content is rewritten"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def expected_digests(app_info, pinned=None):
+    """Return {algorithm: hex digest} an installer must match, from its catalog entry and lockfile pin"""
+    expected = {}
+    for source in (app_info, pinned or {}):
+        for name in HASH_ALGORITHMS:
+            if source.get(name):
+                expected[name] = source[name].strip().lower()
+    return expected
+
+def digest_mismatches(expected, actual):
+    """Return the algorithms whose digest in actual is missing or differs from expected"""
+    return [name for name, value in expected.items() if actual.get(name) != value]
+
+def load_lockfile(path):
+    """Read a lockfile pinning installer digests by app id
+    
+    The file maps "Category:Name" to {"sha256": "...", "sha512": "..."}, either
+    at the top level or under an "apps" key.
+    """
+    if not path:
+        return {}
+    data = read_json_file(path)
+    if not isinstance(data, dict):
+        raise ValueError(f"Lockfile {path} is missing or not a JSON object")
+    apps = data.get('apps', data)
+    return {app_id: pins for app_id, pins in apps.items() if isinstance(pins, dict)}
+
+QUARANTINE_LOCK = threading.Lock()
+
+def quarantine_file(path, url=None, expected=None, actual=None):
+    """Move a file that failed verification aside for inspection and return its new path"""
+    root = os.path.join(get_state_dir(), QUARANTINE_DIR)
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}-{os.path.basename(path)}")
+    shutil.move(path, target)
+    
+    index_path = os.path.join(root, QUARANTINE_INDEX)
+    with QUARANTINE_LOCK:
+        records = read_json_file(index_path, []) or []
+        records.append({'file': os.path.basename(target), 'url': url, 'expected': expected or {},
+                        'actual': actual or {}, 'quarantined': time.time()})
+        for record in records[:-QUARANTINE_MAX_FILES]:
+            try:
+                os.remove(os.path.join(root, record['file']))
+            except OSError:
+                pass
+        write_json_file(index_path, records[-QUARANTINE_MAX_FILES:])
+    print(f"Quarantined {os.path.basename(path)}: expected {expected}, got {actual}")
+    return target
+
+def parse_chocolatey_packages(command):
+    """Return the package ids from a catalog command such as 'choco install git -y'"""
+    tokens = command.split()
+    if 'install' not in tokens:
+        return []
+    return [token for token in tokens[tokens.index('install') + 1:] if not token.startswith('-')]
+
+def query_outdated_packages(source=None, timeout=CHOCO_OUTDATED_TIMEOUT):
+    """Ask Chocolatey once for every installed package that has a newer version
+    
+    Returns {package id (lowercase): (installed version, available version)}.
+    Pinned packages and packages missing from the source are left out. Raises
+    RuntimeError if Chocolatey is missing or the query fails.
+    """
+    choco_path = find_chocolatey()
+    if not choco_path:
+        raise RuntimeError("Chocolatey is not installed")
+    command = [choco_path, 'outdated', '--limit-output', '--ignore-pinned', '--ignore-unfound']
+    if source:
+        command += ['--source', source]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise RuntimeError(f"Could not run choco outdated: {e}")
+    # With enhanced exit codes, 2 means "some packages are outdated"
+    if result.returncode not in (0, 2):
+        raise RuntimeError(f"choco outdated failed with exit code {result.returncode}: "
+                           f"{(result.stdout or result.stderr).strip()[-300:]}")
+    
+    outdated = {}
+    for line in result.stdout.splitlines():
+        fields = line.strip().split('|')
+        if len(fields) >= 3 and fields[1] != fields[2]:
+            outdated[fields[0].lower()] = (fields[1], fields[2])
+    return outdated
+
+def plan_upgrades(candidates, outdated):
+    """Pick the apps with at least one outdated Chocolatey package
+    
+    candidates is a list of (app_id, app_data) like an install selection. Returns
+    the selection to upgrade, each app_data carrying an 'upgrade' list of
+    {'package', 'installed', 'available'}, and the outdated package ids that no
+    candidate accounts for.
+    """
+    plan = []
+    claimed = set()
+    for app_id, app_data in candidates:
+        packages = parse_chocolatey_packages(app_data['info'].get('chocolatey', ''))
+        changes = [{'package': package, 'installed': outdated[package.lower()][0],
+                    'available': outdated[package.lower()][1]}
+                   for package in packages if package.lower() in outdated]
+        if changes:
+            claimed.update(change['package'].lower() for change in changes)
+            plan.append((app_id, dict(app_data, upgrade=changes)))
+    return plan, sorted(set(outdated) - claimed)
+
+def format_upgrade_plan(plan):
+    """Return one "name  package  installed -> available" line per outdated package"""
+    rows = [(app_data['name'], change['package'], change['installed'], change['available'])
+            for _, app_data in plan for change in app_data['upgrade']]
+    if not rows:
+        return []
+    widths = [max(len(row[column]) for row in rows) for column in range(3)]
+    return [f"{name:<{widths[0]}}  {package:<{widths[1]}}  {installed:>{widths[2]}} -> {available}"
+            for name, package, installed, available in rows]
+
+def resolve_app_selection(apps_data, selectors):
+    """Turn 'Category:Name', 'Category:*' or bare app names into a list of app ids"""
+    app_ids = []
+    lookup = {}
+    for category, apps in apps_data.items():
+        for app_name in apps:
+            lookup.setdefault(app_name.lower(), []).append(f"{category}:{app_name}")
+    
+    for selector in selectors:
+        selector = selector.strip()
+        if not selector:
+            continue
+        category, _, app_name = selector.rpartition(':')
+        if category and app_name == '*':
+            matches = [f"{category}:{name}" for name in apps_data.get(category, {})]
+        elif category:
+            matches = [selector] if app_name in apps_data.get(category, {}) else []
+        else:
+            matches = lookup.get(selector.lower(), [])
+        
+        if not matches:
+            raise ValueError(f"No application matches '{selector}'")
+        app_ids.extend(app_id for app_id in matches if app_id not in app_ids)
+    
+    return app_ids
+
+def catalog_selection(apps_data, app_ids):
+    """Build the [(app_id, {'name', 'category', 'info', 'size'})] list the install engine takes"""
+    selected_apps = []
+    for app_id in app_ids:
+        category, _, app_name = app_id.partition(':')
+        app_info = apps_data[category][app_name]
+        selected_apps.append((app_id, {'name': app_name, 'category': category, 'info': app_info,
+                                       'size': app_info.get('size', DEFAULT_APP_SIZE)}))
+    return selected_apps
+
+def load_profile(path):
+    """Load a selection profile: a JSON list of app selectors or {"apps": [...]}"""
+    data = read_json_file(path)
+    if isinstance(data, dict):
+        data = data.get('apps')
+    if not isinstance(data, list):
+        raise ValueError(f"{path} is not a valid selection profile")
+    return data
+
+def read_nuspec_dependencies(nupkg_path):
+    """Return (id, exact version or None) for each dependency declared in a .nupkg"""
+    with zipfile.ZipFile(nupkg_path) as archive:
+        nuspec_name = next((name for name in archive.namelist() if name.endswith('.nuspec')), None)
+        if not nuspec_name:
+            return []
+        root = ET.fromstring(archive.read(nuspec_name))
+    
+    dependencies = []
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] == 'dependency':
+            version = element.get('version', '')
+            # Only exact pins like [1.2.3] name a version; ranges take the latest release
+            exact = version[1:-1] if version.startswith('[') and version.endswith(']') and ',' not in version else None
+            dependencies.append((element.get('id'), exact))
+    return dependencies
+
+class OfflineBundle:
+    """A self-contained directory of catalogs, packages and installers built by the bundle command"""
+    
+    def __init__(self, path):
+        if zipfile.is_zipfile(path):
+            path = self.extract(path)
+        self.root = os.path.abspath(path)
+        self.manifest = read_json_file(os.path.join(self.root, BUNDLE_MANIFEST_FILE))
+        if not self.manifest:
+            raise ValueError(f"{path} is not a Spaller bundle (missing {BUNDLE_MANIFEST_FILE})")
+        self.verified = set()
+    
+    @staticmethod
+    def extract(archive_path):
+        name = os.path.splitext(os.path.basename(archive_path))[0]
+        target = os.path.join(get_state_dir(), "bundles", name)
+        if not os.path.exists(os.path.join(target, BUNDLE_MANIFEST_FILE)):
+            with zipfile.ZipFile(archive_path) as archive:
+                archive.extractall(target)
+        return target
+    
+    def path_for(self, relative_path):
+        if not relative_path:
+            return None
+        return os.path.join(self.root, *relative_path.split('/'))
+    
+    def catalog_path(self, mode):
+        return self.path_for(self.manifest.get('catalogs', {}).get(mode))
+    
+    def package_source(self):
+        return self.path_for("packages")
+    
+    def app_entry(self, app_id):
+        return self.manifest.get('apps', {}).get(app_id, {})
+    
+    def verify(self, relative_path):
+        """Check a bundled file against the manifest hash (once per process)"""
+        if relative_path in self.verified:
+            return True
+        expected = self.manifest.get('files', {}).get(relative_path, {}).get('sha256')
+        path = self.path_for(relative_path)
+        if not expected or not os.path.isfile(path) or file_sha256(path) != expected:
+            return False
+        self.verified.add(relative_path)
+        return True
+    
+    def installer_for(self, app_id):
+        """Return the verified local installer path for an app, or None"""
+        relative_path = self.app_entry(app_id).get('installer')
+        if relative_path and self.verify(relative_path):
+            return self.path_for(relative_path)
+        return None
+    
+    def packages_verified(self, app_id):
+        return all(self.verify(path) for path in self.app_entry(app_id).get('packages', []))
+
+class BundleBuilder:
+    """Download everything a selection needs into a directory that installs without network access"""
+    
+    def __init__(self, output_dir, catalogs, app_ids, log=print):
+        self.output_dir = os.path.abspath(output_dir)
+        self.catalogs = catalogs
+        self.app_ids = app_ids
+        self.log = log
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.files = {}
+        self.packages = {}  # lowercase package id -> relative nupkg path
+        self.mirror_stats = MirrorStats()
+    
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+    
+    def build(self):
+        for folder in ("catalog", "chocolatey", "packages", "installers"):
+            os.makedirs(os.path.join(self.output_dir, folder), exist_ok=True)
+        
+        manifest = {
+            'format': 1,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'catalogs': self.write_catalogs(),
+            'chocolatey': self.fetch_chocolatey_bootstrap(),
+            'apps': {}
+        }
+        
+        with ThreadPoolExecutor(max_workers=BUNDLE_DOWNLOAD_WORKERS) as executor:
+            jobs = {app_id: executor.submit(self.bundle_app, app_id) for app_id in self.app_ids}
+            for app_id, job in jobs.items():
+                try:
+                    manifest['apps'][app_id] = job.result()
+                except Exception as e:
+                    self.log(f"  ! {app_id}: {e}")
+                    manifest['apps'][app_id] = {'error': str(e)}
+        
+        manifest['files'] = self.files
+        write_json_file(os.path.join(self.output_dir, BUNDLE_MANIFEST_FILE), manifest)
+        return manifest
+    
+    def add_file(self, relative_path, sha256=None):
+        path = os.path.join(self.output_dir, *relative_path.split('/'))
+        entry = {'sha256': sha256 or file_sha256(path), 'size': os.path.getsize(path)}
+        with self.lock:
+            self.files[relative_path] = entry
+        return relative_path
+    
+    def write_catalogs(self):
+        """Snapshot both catalogs, trimmed to the selected apps"""
+        selected = {}
+        for app_id in self.app_ids:
+            category, _, app_name = app_id.partition(':')
+            selected.setdefault(category, []).append(app_name)
+        
+        written = {}
+        for mode, file_name in BUNDLE_CATALOG_FILES.items():
+            catalog = self.catalogs.get(mode) or {}
+            snapshot = {}
+            for category, app_names in selected.items():
+                apps = {name: catalog[category][name] for name in app_names
+                        if name in catalog.get(category, {})}
+                if apps:
+                    snapshot[category] = apps
+            
+            relative_path = f"catalog/{file_name}"
+            write_json_file(os.path.join(self.output_dir, "catalog", file_name), snapshot)
+            written[mode] = self.add_file(relative_path)
+        return written
+    
+    def download(self, url, relative_path, mirrors=(), expected=None):
+        """Download into the bundle, verifying the expected {algorithm: digest} as it streams"""
+        path = os.path.join(self.output_dir, *relative_path.split('/'))
+        hasher = StreamingHasher(expected or ())
+        if mirrors:
+            MirrorDownloader(session=self.session(), stats=self.mirror_stats).download(
+                [url, *mirrors], path, observers=[hasher.feed])
+        else:
+            download_file(url, path, session=self.session(), observers=[hasher.feed])
+        
+        digests = hasher.hexdigests()
+        mismatched = digest_mismatches(expected or {}, digests)
+        if mismatched:
+            quarantine_file(path, url, expected, digests)
+            raise ValueError(f"{os.path.basename(path)} does not match the pinned {'/'.join(mismatched)} checksum")
+        return self.add_file(relative_path, digests['sha256'])
+    
+    def fetch_chocolatey_bootstrap(self):
+        self.log("Fetching Chocolatey bootstrap...")
+        return {
+            'script': self.download(CHOCOLATEY_INSTALL_SCRIPT_URL, "chocolatey/install.ps1"),
+            'package': self.download(CHOCOLATEY_PACKAGE_URL + "chocolatey", "chocolatey/chocolatey.nupkg")
+        }
+    
+    def fetch_package(self, package_id, version=None):
+        """Download a .nupkg and, recursively, its dependencies; return their relative paths"""
+        key = package_id.lower()
+        with self.lock:
+            if key in self.packages:
+                return []
+            self.packages[key] = None
+        
+        url = CHOCOLATEY_PACKAGE_URL + package_id + (f"/{version}" if version else "")
+        response = self.session().get(url, timeout=300, stream=True, headers={'Accept-Encoding': 'identity'})
+        try:
+            response.raise_for_status()
+            # The feed redirects to the versioned file name, e.g. git.2.43.0.nupkg
+            file_name = os.path.basename(urlparse(response.url).path) or f"{package_id}.nupkg"
+            if not file_name.endswith('.nupkg'):
+                file_name = f"{package_id}.{version or 'latest'}.nupkg"
+            relative_path = f"packages/{file_name}"
+            sink = DownloadSink(os.path.join(self.output_dir, "packages", file_name))
+            sink.write_from(get_stream_reader(response))
+        finally:
+            response.close()
+        
+        self.add_file(relative_path)
+        with self.lock:
+            self.packages[key] = relative_path
+        self.log(f"  + {file_name}")
+        
+        paths = [relative_path]
+        for dependency_id, dependency_version in read_nuspec_dependencies(os.path.join(self.output_dir, *relative_path.split('/'))):
+            paths.extend(self.fetch_package(dependency_id, dependency_version))
+        return paths
+    
+    def bundle_app(self, app_id):
+        category, _, app_name = app_id.partition(':')
+        entry = {'packages': []}
+        
+        choco_info = self.catalogs.get("chocolatey", {}).get(category, {}).get(app_name, {})
+        for package_id in parse_chocolatey_packages(choco_info.get('chocolatey', '')):
+            entry['packages'].extend(self.fetch_package(package_id))
+        
+        direct_info = self.catalogs.get("direct", {}).get(category, {}).get(app_name, {})
+        if direct_info.get('url'):
+            installer_name = direct_info.get('installer', f"{app_name.replace(' ', '_')}_installer.exe")
+            entry['installer'] = self.download(direct_info['url'], f"installers/{installer_name}",
+                                               installer_urls(direct_info)[1:], expected_digests(direct_info))
+            self.log(f"  + {installer_name}")
+        
+        return entry
+
+class InstallerCache:
+    """Content-addressed store of verified installers, keyed by SHA-256 and indexed by origin URL"""
+    
+    def __init__(self, root=None, max_bytes=INSTALLER_CACHE_MAX_BYTES):
+        self.root = root or os.path.join(get_state_dir(), INSTALLER_CACHE_DIR)
+        self.index_path = os.path.join(self.root, INSTALLER_CACHE_INDEX)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        os.makedirs(self.root, exist_ok=True)
+        self.index = read_json_file(self.index_path, {}) or {}
+        self.index.setdefault('blobs', {})
+        self.index.setdefault('urls', {})
+    
+    def blob_path(self, sha256):
+        entry = self.index['blobs'].get(sha256)
+        if not entry:
+            return None
+        path = os.path.join(self.root, sha256, entry['name'])
+        return path if os.path.isfile(path) else None
+    
+    def get(self, sha256):
+        """Return the cached file for a hash, touching it for LRU eviction
+        
+        A blob whose size and modification time still match the ones recorded when
+        it was verified is trusted without being read again. Anything else is
+        re-hashed once, and quarantined if it no longer matches.
+        """
+        with self.lock:
+            path = self.blob_path(sha256)
+            if not path:
+                return None
+            entry = self.index['blobs'][sha256]
+            entry['used'] = time.time()
+            if entry.get('verified') == file_signature(path):
+                return path
+        
+        actual = file_sha256(path)
+        with self.lock:
+            if self.index['blobs'].get(sha256) is not entry:
+                return self.blob_path(sha256)
+            if actual == sha256:
+                entry['verified'] = file_signature(path)
+                self.save()
+                return path
+            del self.index['blobs'][sha256]
+            self.save()
+        quarantine_file(path, expected={'sha256': sha256}, actual={'sha256': actual})
+        shutil.rmtree(os.path.join(self.root, sha256), ignore_errors=True)
+        return None
+    
+    def digests(self, sha256):
+        """Return every digest recorded for a blob when it was verified"""
+        with self.lock:
+            entry = self.index['blobs'].get(sha256)
+            return dict(entry.get('digests', {}), sha256=sha256) if entry else {}
+    
+    def lookup_url(self, url, max_age=INSTALLER_CACHE_URL_TTL):
+        """Return (sha256, entry) for a recently cached download of url"""
+        with self.lock:
+            entry = self.index['urls'].get(url)
+            if not entry or time.time() - entry.get('fetched', 0) > max_age:
+                return None, None
+            sha256 = entry['sha256']
+            if not self.blob_path(sha256):
+                return None, None
+            return sha256, self.index['blobs'][sha256]
+    
+    def add(self, path, url=None, sha256=None, digests=None):
+        """Move a verified file into the cache and return its new path
+        
+        digests are any extra {algorithm: hex digest} computed while it downloaded.
+        """
+        sha256 = sha256 or file_sha256(path)
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        
+        with self.lock:
+            existing = self.blob_path(sha256)
+            if existing:
+                os.remove(path)
+                target = existing
+            else:
+                target = os.path.join(self.root, sha256, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+                self.index['blobs'][sha256] = {'name': name, 'size': size}
+            
+            entry = self.index['blobs'][sha256]
+            extra = {algorithm: value for algorithm, value in (digests or {}).items() if algorithm != 'sha256'}
+            if extra:
+                entry['digests'] = dict(entry.get('digests', {}), **extra)
+            if not existing:
+                entry['verified'] = file_signature(target)
+            entry['used'] = time.time()
+            if url:
+                self.index['urls'][url] = {'sha256': sha256, 'fetched': time.time()}
+            self.evict()
+            self.save()
+        return target
+    
+    def evict(self):
+        """Drop least recently used blobs until the cache fits in max_bytes"""
+        blobs = self.index['blobs']
+        total = sum(entry['size'] for entry in blobs.values())
+        for sha256 in sorted(blobs, key=lambda key: blobs[key].get('used', 0)):
+            if total <= self.max_bytes:
+                break
+            total -= blobs[sha256]['size']
+            shutil.rmtree(os.path.join(self.root, sha256), ignore_errors=True)
+            del blobs[sha256]
+        
+        self.index['urls'] = {url: entry for url, entry in self.index['urls'].items()
+                              if entry['sha256'] in blobs}
+    
+    def begin(self, url):
+        with self.lock:
+            self.in_flight.add(url)
+    
+    def end(self, url):
+        with self.lock:
+            self.in_flight.discard(url)
+    
+    def is_in_flight(self, url):
+        with self.lock:
+            return url in self.in_flight
+    
+    def save(self):
+        write_json_file(self.index_path, self.index)
+
+class PeerRequestHandler(BaseHTTPRequestHandler):
+    """Serve verified installers from the local cache to other Spaller instances"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        cache = self.server.cache
+        
+        if parsed.path == "/spaller/v1/lookup":
+            url = parse_qs(parsed.query).get('url', [''])[0]
+            sha256, entry = cache.lookup_url(url)
+            if sha256:
+                self.send_json(200, {'sha256': sha256, 'size': entry['size']})
+            elif cache.is_in_flight(url):
+                self.send_json(202, {'state': "downloading"})
+            else:
+                self.send_json(404, {'state': "missing"})
+        elif parsed.path.startswith("/spaller/v1/blob/"):
+            sha256 = parsed.path.rsplit('/', 1)[-1].lower()
+            path = cache.get(sha256)
+            if not path:
+                self.send_json(404, {'state': "missing"})
+                return
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(os.path.getsize(path)))
+            self.send_header('X-Content-SHA256', sha256)
+            self.end_headers()
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile, DOWNLOAD_BLOCK_SIZE)
+        else:
+            self.send_json(404, {'error': "not found"})
+    
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class PeerCache:
+    """Share the installer cache with other Spaller instances on the LAN
+    
+    Each instance serves its cache over HTTP and announces itself with multicast
+    beacons. Before downloading from the origin, a client asks known peers for
+    content whose SHA-256 it already trusts and checks what it receives against
+    that hash. Without a trusted hash it goes straight to the origin, so on a
+    catalog without digests peers only help once a lockfile pins them.
+    """
+    
+    def __init__(self, cache, port=PEER_CACHE_PORT, peers=None, discovery=True, bind="0.0.0.0"):
+        self.cache = cache
+        self.port = port
+        self.bind = bind
+        self.configured_peers = list(peers or [])
+        self.discovery = discovery
+        self.discovered = {}  # "host:port" -> last seen
+        self.instance_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+        self.threads = []
+        self.local = threading.local()
+    
+    def start(self):
+        self.server = ThreadingHTTPServer((self.bind, self.port), PeerRequestHandler)
+        self.server.daemon_threads = True
+        self.server.cache = self.cache
+        self.port = self.server.server_address[1]
+        self.spawn(self.server.serve_forever, "peer-cache-server")
+        
+        if self.discovery:
+            self.spawn(self.listen_for_beacons, "peer-discovery")
+            self.spawn(self.send_beacons, "peer-beacon")
+        return self
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+    
+    def spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+    
+    def send_beacons(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        message = json.dumps({'spaller': 1, 'id': self.instance_id, 'port': self.port}).encode('utf-8')
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    sock.sendto(message, (PEER_DISCOVERY_GROUP, PEER_DISCOVERY_PORT))
+                except OSError:
+                    pass
+                self.stop_event.wait(PEER_BEACON_INTERVAL)
+        finally:
+            sock.close()
+    
+    def listen_for_beacons(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind(("", PEER_DISCOVERY_PORT))
+            membership = socket.inet_aton(PEER_DISCOVERY_GROUP) + socket.inet_aton("0.0.0.0")
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.settimeout(1)
+        except OSError as e:
+            print(f"Peer discovery unavailable: {e}")
+            sock.close()
+            return
+        
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    data, (host, _) = sock.recvfrom(1024)
+                    beacon = json.loads(data.decode('utf-8'))
+                except (socket.timeout, ValueError):
+                    continue
+                except OSError:
+                    break
+                if beacon.get('spaller') == 1 and beacon.get('id') != self.instance_id:
+                    with self.lock:
+                        self.discovered[f"{host}:{int(beacon['port'])}"] = time.monotonic()
+        finally:
+            sock.close()
+    
+    def peers(self):
+        now = time.monotonic()
+        with self.lock:
+            discovered = [peer for peer, seen in self.discovered.items() if now - seen < PEER_EXPIRY]
+        own = {f"127.0.0.1:{self.port}", f"localhost:{self.port}"}
+        return [peer for peer in dict.fromkeys(self.configured_peers + discovered) if peer not in own]
+    
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+    
+    def lookup(self, peer, url):
+        response = self.session().get(f"http://{peer}/spaller/v1/lookup?url={quote(url, safe='')}",
+                                      timeout=PEER_TIMEOUT)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 202:
+            return {'state': "downloading"}
+        return None
+    
+    def fetch(self, url, dest_path, sha256, progress_callback=None, observers=()):
+        """Try to fetch url's content from a peer into dest_path; return its SHA-256 or None
+        
+        sha256 must come from this machine (the catalog, the lockfile or a download it
+        verified itself). A peer's lookup answer is only used to wait for a peer that
+        is still downloading the same URL, never as the hash to check against.
+        """
+        if not sha256:
+            return None
+        
+        deadline = time.monotonic() + PEER_INFLIGHT_WAIT
+        while True:
+            busy = False
+            for peer in self.peers():
+                try:
+                    if self.fetch_blob(peer, sha256, dest_path, progress_callback, observers):
+                        return sha256
+                    found = self.lookup(peer, url)
+                    if found and found.get('state') == "downloading":
+                        busy = True
+                        continue
+                    METRICS.download_retries.inc("peer")
+                except (IncompleteDownloadError, requests.RequestException, ValueError, OSError):
+                    METRICS.download_retries.inc("peer")
+                    continue
+            
+            # Another machine is already pulling this from the origin: wait for it
+            if not busy or time.monotonic() >= deadline:
+                return None
+            time.sleep(2)
+    
+    def fetch_blob(self, peer, sha256, dest_path, progress_callback=None, observers=()):
+        response = self.session().get(f"http://{peer}/spaller/v1/blob/{sha256}", stream=True,
+                                      timeout=PEER_TIMEOUT)
+        try:
+            if response.status_code != 200:
+                return False
+            length = response.headers.get('Content-Length', '')
+            hasher = StreamingHasher()
+            sink = DownloadSink(dest_path, int(length) if length.isdigit() else None,
+                                progress_callback=progress_callback, observers=[hasher.feed, *observers])
+            try:
+                sink.write_from(get_stream_reader(response))
+            except Exception:
+                # Never leave a peer's partial transfer where the next peer or the origin download writes
+                try:
+                    os.remove(dest_path)
+                except OSError:
+                    pass
+                raise
+        finally:
+            response.close()
+        
+        actual = hasher.hexdigests()
+        if actual['sha256'] != sha256:
+            print(f"Peer {peer} sent content that does not match {sha256}")
+            quarantine_file(dest_path, f"http://{peer}/spaller/v1/blob/{sha256}", {'sha256': sha256}, actual)
+            return False
+        return True
+
+def parse_peer_list(value):
+    """Split 'host:port,host' into host:port strings, defaulting the port"""
+    peers = []
+    for item in (value or "").split(','):
+        item = item.strip()
+        if item:
+            peers.append(item if ':' in item else f"{item}:{PEER_CACHE_PORT}")
+    return peers
+
+class InstallerDetector:
+    """Identify the installer framework from bytes as they are written to disk
+    
+    feed() is called with each downloaded block; markers split across block
+    boundaries are caught by keeping a short overlap. Scanning stops once a
+    framework is found or INSTALLER_SCAN_LIMIT bytes have been seen.
+    """
+    
+    def __init__(self, scan_limit=INSTALLER_SCAN_LIMIT):
+        self.scan_limit = scan_limit
+        self.overlap = max(len(marker) for _, markers in INSTALLER_SIGNATURES for marker in markers) - 1
+        self.tail = b""
+        self.scanned = 0
+        self.head = b""
+        self.result = None
+    
+    @property
+    def done(self):
+        return self.result is not None or self.scanned >= self.scan_limit
+    
+    def feed(self, data):
+        if self.done:
+            return
+        
+        data = bytes(data[:self.scan_limit - self.scanned])
+        if not self.scanned:
+            self.head = data[:8]
+            if self.head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+                self.result = "msi"
+                return
+        
+        window = self.tail + data
+        for framework, markers in INSTALLER_SIGNATURES:
+            if any(marker in window for marker in markers):
+                self.result = framework
+                return
+        
+        self.tail = window[-self.overlap:]
+        self.scanned += len(data)
+    
+    def finish(self):
+        if self.result:
+            return self.result
+        return "unknown"
+    
+    @classmethod
+    def detect_file(cls, path):
+        detector = cls()
+        with open(path, 'rb') as f:
+            while not detector.done:
+                block = f.read(DOWNLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                detector.feed(block)
+        return detector.finish()
+
+class InstallerTypeCache:
+    """Remember detected installer frameworks by content hash"""
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_state_dir(), INSTALLER_TYPES_FILE)
+        self.lock = threading.Lock()
+        self.types = read_json_file(self.path, {}) or {}
+    
+    def get(self, sha256):
+        with self.lock:
+            return self.types.get(sha256)
+    
+    def put(self, sha256, framework):
+        with self.lock:
+            if self.types.get(sha256) == framework:
+                return
+            self.types[sha256] = framework
+            data = dict(self.types)
+        write_json_file(self.path, data)
+
+def build_installer_command(path, framework, app_info=None):
+    """Return the unattended command line for an installer, honouring catalog overrides
+    
+    Catalog entries may set "installer_type" to force a framework and "silent_args"
+    (a list or a string) to replace the switches entirely.
+    """
+    app_info = app_info or {}
+    framework = app_info.get('installer_type') or framework
+    if path.lower().endswith('.msi'):
+        framework = "msi"
+    
+    args = app_info.get('silent_args')
+    if isinstance(args, str):
+        args = args.split()
+    if args is None:
+        args = INSTALLER_SILENT_ARGS.get(framework, INSTALLER_SILENT_ARGS["unknown"])
+    elif framework in NORESTART_ARGS and not any('norestart' in arg.lower() or 'reboot=' in arg.lower()
+                                                 for arg in args):
+        # A restart in the middle of a batch would take the remaining installs down with it
+        args = list(args) + [NORESTART_ARGS[framework]]
+    
+    if framework == "msi":
+        return ['msiexec', '/i', path] + list(args)
+    return [path] + list(args)
+
+class SupervisedResult:
+    """Outcome of a supervised installer run"""
+    
+    def __init__(self, returncode, reason, duration, output="", detail=""):
+        self.returncode = returncode
+        self.reason = reason  # "exited", "idle", "timeout", "cancelled" or "error"
+        self.duration = duration
+        self.output = output
+        self.detail = detail
+    
+    @property
+    def succeeded(self):
+        return self.reason == "exited" and self.returncode == 0
+    
+    def describe(self):
+        if self.reason == "exited":
+            return f"exit code {self.returncode}"
+        return self.detail or self.reason
+
+class InstallerSupervisor:
+    """Run an installer and kill its whole process tree once it stops doing anything
+    
+    Activity is CPU time, disk I/O or console output anywhere in the child's process
+    tree (plus any helper processes named in watch_names, such as the Windows
+    Installer service). After idle_grace seconds, idle_timeout seconds without any
+    activity mean the installer is waiting on a hidden dialog and is killed.
+    Without psutil only output and the fallback timeout can be observed.
+    After cancel(), running trees are killed at the next poll and nothing new starts.
+    """
+    
+    warned_without_psutil = False
+    
+    def __init__(self, idle_grace=INSTALL_IDLE_GRACE, idle_timeout=INSTALL_IDLE_TIMEOUT,
+                 hard_timeout=INSTALL_HARD_TIMEOUT, poll_interval=SUPERVISOR_POLL_INTERVAL,
+                 log_path=None):
+        self.idle_grace = idle_grace
+        self.idle_timeout = idle_timeout
+        self.hard_timeout = hard_timeout if psutil else min(hard_timeout, INSTALL_FALLBACK_TIMEOUT)
+        if psutil is None and not InstallerSupervisor.warned_without_psutil:
+            InstallerSupervisor.warned_without_psutil = True
+            print(f"WARNING: psutil is not installed, so installer activity cannot be watched. Every installer "
+                  f"is killed after {self.hard_timeout}s, even one that is still working; run "
+                  f"'pip install psutil' to supervise installs properly.")
+        self.poll_interval = poll_interval
+        self.log_path = log_path or os.path.join(get_state_dir(), SUPERVISOR_LOG_FILE)
+        self.cancelled = threading.Event()
+    
+    def cancel(self):
+        self.cancelled.set()
+    
+    def run(self, command, shell=False, watch_names=(), env=None):
+        start = time.monotonic()
+        if self.cancelled.is_set():
+            return SupervisedResult(None, "cancelled", 0, detail="Cancelled")
+        popen_args = {}
+        if os.name == 'nt':
+            popen_args['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            popen_args['start_new_session'] = True
+        
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       stdin=subprocess.DEVNULL, shell=shell, env=env, **popen_args)
+        except OSError as e:
+            result = SupervisedResult(None, "error", 0, detail=str(e))
+            self.record(command, result)
+            return result
+        
+        output = collections.deque(maxlen=200)
+        activity = {'last': start}
+        reader = threading.Thread(target=self.read_output, args=(process, output, activity), daemon=True)
+        reader.start()
+        
+        previous = None
+        reason, detail = "exited", ""
+        while True:
+            try:
+                # Returns as soon as the installer exits rather than at the next poll
+                process.wait(timeout=self.poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            now = time.monotonic()
+            
+            snapshot = self.snapshot(process.pid, watch_names)
+            if snapshot is not None:
+                if previous is None or self.changed(previous, snapshot):
+                    activity['last'] = now
+                previous = snapshot
+            
+            if self.cancelled.is_set():
+                reason, detail = "cancelled", "Cancelled"
+            elif now - start > self.hard_timeout:
+                reason, detail = "timeout", f"still running after {self.hard_timeout}s"
+            elif (snapshot is not None and now - start > self.idle_grace
+                    and now - activity['last'] > self.idle_timeout):
+                reason, detail = "idle", f"no CPU, I/O or output for {self.idle_timeout}s (waiting on a hidden prompt?)"
+            else:
+                continue
+            
+            self.kill_tree(process)
+            break
+        
+        process.wait()
+        reader.join(timeout=5)
+        result = SupervisedResult(process.returncode, reason, time.monotonic() - start,
+                                  b"".join(output).decode('utf-8', 'replace'), detail)
+        self.record(command, result)
+        return result
+    
+    def read_output(self, process, output, activity):
+        while True:
+            data = process.stdout.read1(4096) if hasattr(process.stdout, 'read1') else process.stdout.read(4096)
+            if not data:
+                break
+            output.append(data)
+            activity['last'] = time.monotonic()
+    
+    def snapshot(self, pid, watch_names=()):
+        """Return (pids, cpu seconds, io bytes) for the tree rooted at pid, or None without psutil"""
+        if psutil is None:
+            return None
+        
+        try:
+            processes = [psutil.Process(pid)]
+            processes.extend(processes[0].children(recursive=True))
+        except psutil.Error:
+            return None
+        if watch_names:
+            watched = {name.lower() for name in watch_names}
+            for proc in psutil.process_iter(['name']):
+                if (proc.info['name'] or '').lower() in watched:
+                    processes.append(proc)
+        
+        pids, cpu, io = set(), 0.0, 0
+        for proc in processes:
+            try:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    cpu += times.user + times.system
+                    if hasattr(proc, 'io_counters'):
+                        counters = proc.io_counters()
+                        io += counters.read_bytes + counters.write_bytes
+                pids.add(proc.pid)
+            except psutil.Error:
+                continue
+        return pids, cpu, io
+    
+    def changed(self, previous, current):
+        return (previous[0] != current[0]
+                or abs(current[1] - previous[1]) >= SUPERVISOR_CPU_EPSILON
+                or abs(current[2] - previous[2]) >= SUPERVISOR_IO_EPSILON)
+    
+    def kill_tree(self, process):
+        """Kill the process and every descendant"""
+        if psutil is not None:
+            try:
+                parent = psutil.Process(process.pid)
+                victims = parent.children(recursive=True) + [parent]
+                for victim in victims:
+                    try:
+                        victim.kill()
+                    except psutil.Error:
+                        pass
+                psutil.wait_procs(victims, timeout=10)
+                return
+            except psutil.Error:
+                pass
+        
+        try:
+            if os.name == 'nt':
+                subprocess.run(['taskkill', '/T', '/F', '/PID', str(process.pid)],
+                               capture_output=True, timeout=30)
+            else:
+                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+        except (OSError, subprocess.SubprocessError):
+            process.kill()
+    
+    def record(self, command, result):
+        """Append the outcome to the installer log so failures can be explained later"""
+        command_text = command if isinstance(command, str) else ' '.join(str(part) for part in command)
+        line = (f"{time.strftime('%Y-%m-%d %H:%M:%S')} [{result.reason}] {result.describe()} "
+                f"after {result.duration:.1f}s: {command_text}\n")
+        if result.reason != "exited" and result.output:
+            tail = result.output.strip().splitlines()[-5:]
+            line += ''.join(f"    | {text}\n" for text in tail)
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError:
+            pass
+
+def restart_request(result, backend, app_info=None):
+    """Return "required", "initiated" or "deferred" if an installer's exit code asks for a restart, else None
+    
+    backend is an install backend name or "msi"; backends without codes of their
+    own use the "direct" ones. Catalog entries may add codes for
+    unusual installers with "restart_exit_codes": {"5": "required"}.
+    """
+    if result.reason != "exited":
+        return None
+    codes = dict(RESTART_EXIT_CODES.get(backend, RESTART_EXIT_CODES["direct"]))
+    for code, request in ((app_info or {}).get('restart_exit_codes') or {}).items():
+        codes[int(code)] = request
+    return codes.get(result.returncode)
+
+class RestartHistory:
+    """Remember which apps have asked for a restart, so later runs install them last"""
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_state_dir(), RESTART_HISTORY_FILE)
+        self.lock = threading.Lock()
+        self.apps = read_json_file(self.path, {}) or {}  # app id -> {'count', 'last'}
+    
+    def prone(self, app_id, app_info=None):
+        """Whether an app is tagged "restart": true in the catalog or has asked for a restart before"""
+        return bool((app_info or {}).get('restart')) or app_id in self.apps
+    
+    def record(self, app_id):
+        with self.lock:
+            entry = self.apps.setdefault(app_id, {'count': 0})
+            entry['count'] += 1
+            entry['last'] = time.time()
+            data = dict(self.apps)
+        write_json_file(self.path, data)
+
+def order_for_restarts(selected_apps, history):
+    """Move restart-prone apps to the end of a run, otherwise keeping the selection order"""
+    return sorted(selected_apps, key=lambda entry: history.prone(entry[0], entry[1].get('info')))
+
+class BackendStats:
+    """Install time and success history per app and backend, persisted to pick backends across runs"""
+    
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_state_dir(), BACKEND_STATS_FILE)
+        self.lock = threading.Lock()
+        self.apps = read_json_file(self.path, {}) or {}  # app id -> backend -> history
+    
+    def record(self, app_id, backend, success, duration):
+        with self.lock:
+            entry = self.apps.setdefault(app_id, {}).setdefault(
+                backend, {'successes': 0, 'failures': 0, 'seconds': 0.0, 'last': 0})
+            entry['successes' if success else 'failures'] += 1
+            entry['seconds'] = duration if not entry['seconds'] else \
+                entry['seconds'] + BACKEND_TIME_SMOOTHING * (duration - entry['seconds'])
+            entry['last'] = time.time()
+    
+    def success_rate(self, app_id, backend):
+        """Smoothed share of an app's installs through a backend that succeeded, 0.5 without history"""
+        with self.lock:
+            entry = self.apps.get(app_id, {}).get(backend) or {'successes': 0, 'failures': 0}
+            return (entry['successes'] + 1) / (entry['successes'] + entry['failures'] + 2)
+    
+    def expected_seconds(self, app_id, backend):
+        """Average attempt time divided by the success rate, or None without history"""
+        with self.lock:
+            entry = self.apps.get(app_id, {}).get(backend)
+        if not entry:
+            return None
+        return entry['seconds'] / self.success_rate(app_id, backend)
+    
+    def health(self, backend):
+        """Success rate of a backend across every app, 0.5 without history"""
+        successes = failures = 0
+        with self.lock:
+            for history in self.apps.values():
+                entry = history.get(backend)
+                if entry:
+                    successes += entry['successes']
+                    failures += entry['failures']
+        return (successes + 1) / (successes + failures + 2)
+    
+    def rank(self, app_id, backends, preferred=()):
+        """Order backends best first by expected time for this app
+        
+        Backends without history for the app count as the median of the others.
+        Ties go to the better success rate for the app, so one that has worked
+        is not swapped for an untried one (which would install the app twice),
+        then to the backend most reliable across all apps, then to preferred.
+        There is no exploration: once an app has installed through one backend,
+        the others are only measured for it if that backend starts failing.
+        """
+        costs = {backend.name: self.expected_seconds(app_id, backend.name) for backend in backends}
+        known = sorted(cost for cost in costs.values() if cost is not None)
+        neutral = known[len(known) // 2] if known else 0
+        
+        def key(backend):
+            cost = costs[backend.name]
+            preference = preferred.index(backend.name) if backend.name in preferred else len(preferred)
+            return (neutral if cost is None else cost, -self.success_rate(app_id, backend.name),
+                    -self.health(backend.name), preference)
+        return sorted(backends, key=key)
+    
+    def save(self):
+        with self.lock:
+            data = json.loads(json.dumps(self.apps))
+        write_json_file(self.path, data)
+
+def restart_windows(delay=RESTART_DELAY):
+    """Ask Windows to restart after delay seconds and return whether it accepted"""
+    if os.name != 'nt':
+        return False
+    try:
+        result = subprocess.run(['shutdown', '/r', '/t', str(delay), '/c',
+                                 "Spaller is restarting Windows to finish installing applications"],
+                                capture_output=True, timeout=30)
+        return result.returncode == 0
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not restart Windows: {e}")
+        return False
+
+def schedule_resume_after_restart(run_id, source):
+    """Register an elevated logon task that continues a journaled run after the restart
+    
+    A RunOnce entry would start the command without elevation, so the installs
+    would fail or stop at UAC prompts; a task with the highest run level starts
+    it elevated in the user's session. The task deletes itself when it runs.
+    Command-line runs resume directly; the window offers its run on startup
+    anyway, so for it Spaller is just started again. The agent resumes its own
+    runs whenever it starts.
+    """
+    if os.name != 'nt' or source == "agent":
+        return False
+    
+    command = [sys.executable] if getattr(sys, 'frozen', False) else [sys.executable, os.path.abspath(__file__)]
+    command.append('--after-restart')
+    if source == "cli":
+        command += ['resume', '--run', run_id]
+    user = os.environ.get('USERNAME', '')
+    if os.environ.get('USERDOMAIN'):
+        user = f"{os.environ['USERDOMAIN']}\\{user}"
+    try:
+        result = subprocess.run(['schtasks', '/Create', '/F', '/TN', RESTART_TASK_NAME, '/SC', 'ONLOGON',
+                                 '/RL', 'HIGHEST', '/IT', '/RU', user, '/TR', subprocess.list2cmdline(command)],
+                                capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"Could not schedule the run to continue after a restart: {e}")
+        return False
+    if result.returncode != 0:
+        print(f"Could not schedule the run to continue after a restart: {(result.stderr or result.stdout).strip()}")
+        return False
+    return True
+
+def remove_resume_task():
+    """Delete the logon task that started this process, so it only runs once"""
+    if os.name != 'nt':
+        return
+    try:
+        subprocess.run(['schtasks', '/Delete', '/F', '/TN', RESTART_TASK_NAME], capture_output=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+class StallWatchdog:
+    """Log GUI event-loop stalls with the Python stack of the code blocking the loop
+    
+    A heartbeat timer on the GUI thread records each time the event loop gets to
+    it, and a monitor thread notices when it stops. Once a stall passes the
+    threshold the monitor samples the GUI thread's stack, again each time the
+    stall grows by another threshold. When the heartbeat resumes, the stall goes
+    to the diagnostics log with its duration, the operation that was running and
+    the sampled stacks. A histogram of stall durations is added when it stops.
+    """
+    
+    def __init__(self, threshold=STALL_THRESHOLD, interval=STALL_HEARTBEAT_INTERVAL, log_path=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.log_path = log_path or os.path.join(get_state_dir(), STALL_LOG_FILE)
+        self.thread_id = threading.get_ident()  # Created on the GUI thread
+        self.lock = threading.Lock()
+        self.last_beat = time.monotonic()
+        self.beats = 0
+        self.samples = []  # (seconds into the stall, stack, operation) for the stall in progress
+        self.completed = []  # (duration, samples) of stalls not logged yet
+        self.stalls = []  # (duration, operation) of every stall so far
+        self.started = time.time()
+        self.stop_event = threading.Event()
+        self.monitor = threading.Thread(target=self.watch, name="stall-watchdog", daemon=True)
+        self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(int(interval * 1000))
+        self.timer.timeout.connect(self.beat)
+    
+    def start(self):
+        self.write([f"{time.strftime('%Y-%m-%d %H:%M:%S')} watchdog started, reporting stalls over "
+                    f"{self.threshold * 1000:.0f} ms\n"])
+        self.last_beat = time.monotonic()
+        self.timer.start()
+        self.monitor.start()
+        return self
+    
+    def stop(self):
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.timer.stop()
+        self.monitor.join(timeout=5)
+        self.write_summary()
+    
+    def beat(self):
+        now = time.monotonic()
+        with self.lock:
+            stalled = now - self.last_beat - self.interval
+            if stalled >= self.threshold:
+                self.completed.append((stalled, self.samples))
+            self.samples = []
+            self.last_beat = now
+            self.beats += 1
+    
+    def watch(self):
+        poll = min(self.interval, self.threshold / 4)
+        while not self.stop_event.wait(poll):
+            with self.lock:
+                completed, self.completed = self.completed, []
+                beats = self.beats
+                stalled = time.monotonic() - self.last_beat - self.interval
+                due = (len(self.samples) < STALL_MAX_SAMPLES
+                       and stalled >= self.threshold * (len(self.samples) + 1))
+            for duration, samples in completed:
+                self.log_stall(duration, samples)
+            if due:
+                sample = self.sample(stalled)
+                with self.lock:
+                    # The loop may have come back while the stack was being taken
+                    if self.beats == beats:
+                        self.samples.append(sample)
+        with self.lock:
+            completed, self.completed = self.completed, []
+        for duration, samples in completed:
+            self.log_stall(duration, samples)
+    
+    def sample(self, stalled):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return stalled, [], "unknown"
+        return stalled, traceback.format_stack(frame), self.operation(frame)
+    
+    def operation(self, frame):
+        """Name the outermost Spaller function on the stack, the one the event loop called into"""
+        outermost = None
+        while frame is not None:
+            # Lambdas connected to signals only forward to the method worth naming
+            if frame.f_globals.get('__name__') == __name__ and frame.f_code.co_name not in ('main', '<lambda>'):
+                outermost = frame
+            frame = frame.f_back
+        if outermost is None:
+            return "qt"  # Painting, layout or other work with no Spaller code on the stack
+        code = outermost.f_code
+        if hasattr(code, 'co_qualname'):
+            return code.co_qualname
+        owner = outermost.f_locals.get('self')
+        return f"{type(owner).__name__}.{code.co_name}" if owner is not None else code.co_name
+    
+    def log_stall(self, duration, samples):
+        operation = samples[0][2] if samples else "unknown"
+        METRICS.ui_stall_duration.observe(duration, operation)
+        self.stalls.append((duration, operation))
+        
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M:%S')} stall of {duration:.2f}s in {operation}\n"]
+        previous = None
+        for offset, stack, _ in samples:
+            if stack == previous:
+                lines.append(f"    at {offset:.2f}s: same stack\n")
+                continue
+            lines.append(f"    at {offset:.2f}s:\n")
+            lines.extend(f"    | {text}\n" for text in ''.join(stack).rstrip().splitlines())
+            previous = stack
+        self.write(lines)
+    
+    def write_summary(self):
+        counts = [0] * (len(STALL_BUCKETS) + 1)
+        by_operation = collections.defaultdict(list)
+        for duration, operation in self.stalls:
+            counts[next((i for i, bound in enumerate(STALL_BUCKETS) if duration <= bound), len(STALL_BUCKETS))] += 1
+            by_operation[operation].append(duration)
+        
+        lines = [f"{time.strftime('%Y-%m-%d %H:%M:%S')} watchdog stopped after "
+                 f"{format_duration(time.time() - self.started)}: {len(self.stalls)} stalls\n"]
+        labels = [f"<= {bound:g}s" for bound in STALL_BUCKETS] + [f"> {STALL_BUCKETS[-1]:g}s"]
+        peak = max(counts) or 1
+        for label, count in zip(labels, counts):
+            lines.append(f"    {label:>8} {count:>5} {'#' * round(40 * count / peak)}\n")
+        ranked = sorted(by_operation.items(), key=lambda item: sum(item[1]), reverse=True)
+        for operation, durations in ranked:
+            lines.append(f"    {operation}: {len(durations)} stalls, {sum(durations):.2f}s total, "
+                         f"longest {max(durations):.2f}s\n")
+        self.write(lines)
+    
+    def write(self, lines):
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+        except OSError:
+            pass
+
+class LoadingScreen(QSplashScreen):
+    def __init__(self):
+        pixmap = QPixmap(450, 280)
+        pixmap.fill(QColor(13, 17, 23))
+        
+        super().__init__(pixmap)
+        self.setWindowFlags(Qt.SplashScreen | Qt.FramelessWindowHint)
+        
+        self.progress = 0
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.update_progress)
+        self.timer.start(50)
+    
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(13, 17, 23))
+        painter.drawRoundedRect(self.rect(), 12, 12)
+        
+        painter.setPen(QColor(88, 166, 255))
+        painter.setFont(QFont("Segoe UI", 28, QFont.Bold))
+        title_rect = QRect(0, 70, self.width(), 40)
+        painter.drawText(title_rect, Qt.AlignCenter, "Spaller")
+        
+        painter.setPen(QColor(125, 133, 144))
+        painter.setFont(QFont("Segoe UI", 12))
+        subtitle_rect = QRect(0, 120, self.width(), 25)
+        painter.drawText(subtitle_rect, Qt.AlignCenter, "Chocolatey Package Installer")
+        
+        bar_width = 300
+        bar_height = 4
+        bar_x = (self.width() - bar_width) // 2
+        bar_y = 180
+        
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(33, 38, 45))
+        painter.drawRoundedRect(bar_x, bar_y, bar_width, bar_height, 2, 2)
+        
+        progress_width = int((bar_width * self.progress) / 100)
+        if progress_width > 0:
+            gradient = QLinearGradient(bar_x, 0, bar_x + progress_width, 0)
+            gradient.setColorAt(0, QColor(88, 166, 255))
+            gradient.setColorAt(1, QColor(58, 139, 253))
+            painter.setBrush(QBrush(gradient))
+            painter.drawRoundedRect(bar_x, bar_y, progress_width, bar_height, 2, 2)
+        
+        painter.setPen(QColor(125, 133, 144))
+        painter.setFont(QFont("Segoe UI", 10))
+        status_rect = QRect(0, 220, self.width(), 25)
+        painter.drawText(status_rect, Qt.AlignCenter, "Checking system requirements...")
+    
+    def update_progress(self):
+        self.progress = (self.progress + 2) % 101
+        self.update()
+
+class CustomTitleBar(QFrame):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.parent_window = parent
+        self.setFixedHeight(45)
+        self.setup_ui()
+        self.drag_position = QPoint()
+    
+    def setup_ui(self):
+        self.setStyleSheet("""
+            QFrame {
+                background-color: #161b22;
+                border: none;
+            }
+        """)
+        
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(20, 12, 15, 12)
+        layout.setSpacing(12)
+        
+        title_label = QLabel("Spaller")
+        title_label.setFont(QFont("Segoe UI", 14, QFont.Bold))
+        title_label.setStyleSheet("color: #58a6ff; border: none;")
+        layout.addWidget(title_label)
+        
+        subtitle_label = QLabel("Chocolatey Package Installer")
+        subtitle_label.setFont(QFont("Segoe UI", 9))
+        subtitle_label.setStyleSheet("color: #8b949e; border: none;")
+        layout.addWidget(subtitle_label)
+        
+        # Admin indicator
+        admin = is_admin()
+        admin_label = QLabel("🛡️ Admin" if admin else "⚠️ Limited")
+        admin_label.setFont(QFont("Segoe UI", 8, QFont.Bold))
+        admin_label.setStyleSheet("color: #3fb950; border: none;" if admin else "color: #f85149; border: none;")
+        layout.addWidget(admin_label)
         
         layout.addStretch()
         
@@ -424,16 +3744,16 @@ class PulseButton(QPushButton):
             self.stop_pulse()
 
 class ModernCheckBox(QFrame):
-    stateChanged = Signal(bool)
-    
-    def __init__(self, title, description="", app_id="", app_size=50, app_icon="📦", parent=None):
+    def __init__(self, title, description="", app_id="", app_size=50, app_icon="📦", size_measured=False, parent=None):
         super().__init__(parent)
         self.title = title
         self.description = description
         self.app_id = app_id
         self.app_size = app_size
+        self.size_measured = size_measured
         self.app_icon = app_icon
         self.is_checked = False
+        self.appearance_checked = False  # State the checkbox style sheet currently shows
         self.setup_ui()
         self.setup_style()
     
@@ -447,6 +3767,7 @@ class ModernCheckBox(QFrame):
         layout.setSpacing(12)
         
         icon_label = QLabel(self.app_icon)
+        self.icon_label = icon_label
         icon_label.setFont(QFont("Segoe UI", 16))
         icon_label.setFixedSize(32, 32)
         icon_label.setAlignment(Qt.AlignCenter)
@@ -463,7 +3784,7 @@ class ModernCheckBox(QFrame):
         
         self.checkbox = QCheckBox()
         self.checkbox.setFixedSize(20, 20)
-        self.checkbox.stateChanged.connect(self._on_checkbox_changed)
+        self.checkbox.toggled.connect(self._on_checkbox_toggled)
         layout.addWidget(self.checkbox)
         
         text_layout = QVBoxLayout()
@@ -473,6 +3794,7 @@ class ModernCheckBox(QFrame):
         title_layout.setSpacing(8)
         
         title_label = QLabel(self.title)
+        self.title_label = title_label
         title_label.setFont(QFont("Segoe UI", 11, QFont.Bold))
         title_label.setStyleSheet("color: #f0f6fc; border: none;")
         title_label.setWordWrap(True)
@@ -495,34 +3817,63 @@ class ModernCheckBox(QFrame):
             }
         """)
         
-        tooltip_text = f"{self.app_icon} {self.title}\n📦 Package Manager: Chocolatey\n📊 Version: Latest\n💾 Size: ~{self.app_size}MB\n\nClick for more details"
-        info_btn.setToolTip(tooltip_text)
-        info_btn.clicked.connect(lambda: self.show_app_info())
+        self.info_btn = info_btn
+        self.update_tooltip()
+        info_btn.clicked.connect(self.show_app_info)
         title_layout.addWidget(info_btn)
         title_layout.addStretch()
         
         text_layout.addLayout(title_layout)
         
-        if self.description:
-            desc_label = QLabel(self.description)
-            desc_label.setFont(QFont("Segoe UI", 9))
-            desc_label.setStyleSheet("color: #8b949e; border: none;")
-            desc_label.setWordWrap(True)
-            desc_label.setMaximumHeight(40)
-            text_layout.addWidget(desc_label)
+        # Always created so a reused widget can show an app that has a description
+        self.desc_label = QLabel(self.description)
+        self.desc_label.setFont(QFont("Segoe UI", 9))
+        self.desc_label.setStyleSheet("color: #8b949e; border: none;")
+        self.desc_label.setWordWrap(True)
+        self.desc_label.setMaximumHeight(40)
+        self.desc_label.setVisible(bool(self.description))
+        text_layout.addWidget(self.desc_label)
         
         layout.addLayout(text_layout)
         
-        size_label = QLabel(f"{self.app_size} MB")
-        size_label.setFont(QFont("Segoe UI", 9))
-        size_label.setStyleSheet("color: #8b949e; border: none;")
-        size_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        layout.addWidget(size_label)
+        self.size_label = QLabel(format_size(self.app_size, self.size_measured))
+        self.size_label.setFont(QFont("Segoe UI", 9))
+        self.size_label.setStyleSheet("color: #8b949e; border: none;")
+        self.size_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        layout.addWidget(self.size_label)
     
-    def _on_checkbox_changed(self, state):
-        self.is_checked = state == Qt.Checked.value
-        self.update_checkbox_appearance(state)
-        self.stateChanged.emit(self.is_checked)
+    def update_tooltip(self):
+        tooltip_text = f"{self.app_icon} {self.title}\n📦 Package Manager: Chocolatey\n📊 Version: Latest\n💾 Size: {format_size(self.app_size, self.size_measured)}\n\nClick for more details"
+        self.info_btn.setToolTip(tooltip_text)
+    
+    def set_size(self, app_size, measured):
+        self.app_size = app_size
+        self.size_measured = measured
+        self.size_label.setText(format_size(app_size, measured))
+        self.update_tooltip()
+    
+    def bind(self, title, description, app_id, app_size, app_icon, size_measured, checked):
+        """Show another app in this widget without emitting stateChanged"""
+        self.title = title
+        self.description = description
+        self.app_id = app_id
+        self.app_icon = app_icon
+        self.icon_label.setText(app_icon)
+        self.title_label.setText(title)
+        self.desc_label.setText(description)
+        self.desc_label.setVisible(bool(description))
+        self.set_size(app_size, size_measured)
+        self.show_checked(checked)
+    
+    @property
+    def stateChanged(self):
+        # Forward the inner checkbox's own signal: PySide6 6.12.0 drops a reference to True on every
+        # Signal.emit() made from Python and aborts once it reaches zero
+        return self.checkbox.toggled
+    
+    def _on_checkbox_toggled(self, checked):
+        self.is_checked = checked
+        self.update_checkbox_appearance(Qt.Checked.value if checked else Qt.Unchecked.value)
     
     def show_app_info(self):
         QMessageBox.information(self, f"{self.title} - Information", 
@@ -530,7 +3881,8 @@ class ModernCheckBox(QFrame):
                                f"Package Manager: Chocolatey\n"
                                f"Description: {self.description}\n"
                                f"Version: Latest Available\n"
-                               f"Size: ~{self.app_size} MB\n"
+                               f"Size: {format_size(self.app_size, self.size_measured)}"
+                               f"{'' if self.size_measured else ' (estimated)'}\n"
                                f"Installation: Automated via Chocolatey")
     
     def setup_style(self):
@@ -565,7 +3917,11 @@ class ModernCheckBox(QFrame):
         """)
     
     def update_checkbox_appearance(self, state):
-        if state == Qt.Checked.value:
+        checked = state == Qt.Checked.value
+        if checked == self.appearance_checked:
+            return  # Re-parsing an identical style sheet is the slow part of rebinding a widget
+        self.appearance_checked = checked
+        if checked:
             self.checkbox.setText("✓")
             self.checkbox.setStyleSheet("""
                 QCheckBox {
@@ -611,13 +3967,16 @@ class ModernCheckBox(QFrame):
         return self.checkbox.isChecked()
     
     def setChecked(self, checked):
+        self.checkbox.setChecked(checked)
+    
+    def show_checked(self, checked):
+        """Set the checkbox, is_checked and the appearance without emitting stateChanged"""
         self.checkbox.blockSignals(True)
         self.checkbox.setChecked(checked)
         self.checkbox.blockSignals(False)
         
         self.is_checked = checked
         self.update_checkbox_appearance(Qt.Checked.value if checked else Qt.Unchecked.value)
-        self.stateChanged.emit(checked)
     
     def get_size(self):
         return self.app_size
@@ -672,91 +4031,484 @@ class CategoryButton(QPushButton):
                 }
             """)
     
-    def set_active(self, active):
-        self.is_active = active
-        self.update_style()
+    def set_active(self, active):
+        self.is_active = active
+        self.update_style()
+    
+    def set_count(self, count):
+        self.count = count
+        display_text = f"{self.category_text} ({count})"
+        if len(display_text) > 20:
+            display_text = f"{self.category_text[:12]}... ({count})"
+        self.setText(display_text)
+
+class EmptyStateWidget(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setup_ui()
+    
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 40, 20, 40)
+        layout.setSpacing(15)
+        layout.setAlignment(Qt.AlignCenter)
+        
+        icon_label = QLabel("📦")
+        icon_label.setFont(QFont("Segoe UI", 32))
+        icon_label.setStyleSheet("color: #30363d;")
+        icon_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(icon_label)
+        
+        title_label = QLabel("No Applications Selected")
+        title_label.setFont(QFont("Segoe UI", 16, QFont.Bold))
+        title_label.setStyleSheet("color: #8b949e;")
+        title_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title_label)
+        
+        message_label = QLabel("Select applications from the list above to install them via Chocolatey.")
+        message_label.setFont(QFont("Segoe UI", 11))
+        message_label.setStyleSheet("color: #6e7681;")
+        message_label.setAlignment(Qt.AlignCenter)
+        message_label.setWordWrap(True)
+        layout.addWidget(message_label)
+
+class StreamingCatalogParser:
+    """Incrementally parse a {category: {app: info}} catalog, reporting each entry as it arrives
+    
+    Only the unparsed tail of the document is buffered, so memory stays bounded by
+    the largest single app entry rather than the size of the whole catalog.
+    """
+    
+    def __init__(self, on_category=None, on_app=None, on_category_end=None):
+        self.on_category = on_category
+        self.on_app = on_app
+        self.on_category_end = on_category_end
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ""
+        self.pos = 0
+        self.state = "start"
+        self.category = None
+        self.app_name = None
+    
+    def feed(self, data, final=False):
+        if isinstance(data, bytes):
+            data = self.text_decoder.decode(data, final)
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        self.parse(final)
+    
+    def close(self):
+        self.feed(b"", final=True)
+        if self.state != "end":
+            raise ValueError("Catalog ended before it was complete")
+    
+    def expect(self, char, expected):
+        if char != expected:
+            raise ValueError(f"Malformed catalog: expected '{expected}' at offset {self.pos}, found '{char}'")
+        self.pos += 1
+    
+    def decode_value(self, final):
+        """Decode the next JSON value, or return None if it has not fully arrived yet"""
+        try:
+            value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        return (value,)
+    
+    def decode_key(self, char, final):
+        if char != '"':
+            raise ValueError(f"Malformed catalog: expected a name at offset {self.pos}, found '{char}'")
+        return self.decode_value(final)
+    
+    def parse(self, final):
+        while True:
+            self.pos = CATALOG_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos >= len(self.buffer):
+                return
+            char = self.buffer[self.pos]
+            state = self.state
+            
+            if state == "start":
+                self.expect(char, "{")
+                self.state = "category_key_or_end"
+            elif state in ("category_key_or_end", "category_key"):
+                if char == "}" and state == "category_key_or_end":
+                    self.pos += 1
+                    self.state = "end"
+                    continue
+                decoded = self.decode_key(char, final)
+                if decoded is None:
+                    return
+                self.category = decoded[0]
+                self.state = "category_colon"
+            elif state == "category_colon":
+                self.expect(char, ":")
+                self.state = "category_open"
+            elif state == "category_open":
+                self.expect(char, "{")
+                self.state = "app_key_or_end"
+                if self.on_category:
+                    self.on_category(self.category)
+            elif state in ("app_key_or_end", "app_key"):
+                if char == "}" and state == "app_key_or_end":
+                    self.pos += 1
+                    self.end_category()
+                    continue
+                decoded = self.decode_key(char, final)
+                if decoded is None:
+                    return
+                self.app_name = decoded[0]
+                self.state = "app_colon"
+            elif state == "app_colon":
+                self.expect(char, ":")
+                self.state = "app_value"
+            elif state == "app_value":
+                decoded = self.decode_value(final)
+                if decoded is None:
+                    return
+                if self.on_app:
+                    self.on_app(self.category, self.app_name, decoded[0])
+                self.state = "after_app"
+            elif state == "after_app":
+                if char == ",":
+                    self.pos += 1
+                    self.state = "app_key"
+                else:
+                    self.expect(char, "}")
+                    self.end_category()
+            elif state == "after_category":
+                if char == ",":
+                    self.pos += 1
+                    self.state = "category_key"
+                else:
+                    self.expect(char, "}")
+                    self.state = "end"
+            else:
+                raise ValueError(f"Unexpected data after the end of the catalog at offset {self.pos}")
+    
+    def end_category(self):
+        self.state = "after_category"
+        if self.on_category_end:
+            self.on_category_end(self.category)
+
+class AppBitSet:
+    """Set of integer app ids stored as one bit per app"""
+    
+    __slots__ = ('bits', 'count')
+    
+    def __init__(self):
+        self.bits = bytearray()
+        self.count = 0
+    
+    def __contains__(self, app_id):
+        byte = app_id >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (app_id & 7)))
+    
+    def __len__(self):
+        return self.count
+    
+    def __iter__(self):
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield (byte_index << 3) | bit
+    
+    def add(self, app_id):
+        byte, mask = app_id >> 3, 1 << (app_id & 7)
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        if not self.bits[byte] & mask:
+            self.bits[byte] |= mask
+            self.count += 1
+    
+    def discard(self, app_id):
+        byte, mask = app_id >> 3, 1 << (app_id & 7)
+        if byte < len(self.bits) and self.bits[byte] & mask:
+            self.bits[byte] &= ~mask & 0xFF
+            self.count -= 1
+    
+    def set(self, app_id, value):
+        if value:
+            self.add(app_id)
+        else:
+            self.discard(app_id)
+    
+    def clear(self):
+        self.bits = bytearray()
+        self.count = 0
+
+class CatalogChunk:
+    """The columns of one catalog category, built on the loader thread
+    
+    CatalogStore.add_category only has to append them, so the GUI thread never
+    walks the parsed apps itself.
+    """
+    
+    def __init__(self, apps=None):
+        self.names = []
+        self.descriptions = []
+        self.icons = []
+        self.sizes = array('d')
+        self.extras = []
+        self.haystacks = []
+        for app_name, app_info in (apps or {}).items():
+            self.append(app_name, app_info)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def append(self, app_name, app_info):
+        app_name = sys.intern(app_name)
+        description = app_info.get('description', '')
+        icon = app_info.get('icon')
+        
+        self.names.append(app_name)
+        self.descriptions.append(description)
+        self.icons.append(sys.intern(icon) if isinstance(icon, str) else icon)
+        size = app_info.get('size', DEFAULT_APP_SIZE)
+        self.sizes.append(size if isinstance(size, (int, float)) else DEFAULT_APP_SIZE)
+        
+        extras = []
+        for key, value in app_info.items():
+            if key not in ('description', 'icon', 'size'):
+                extras.append(sys.intern(key))
+                extras.append(value)
+        self.extras.append(tuple(extras))
+        self.haystacks.append(f"{app_name}\n{description}".lower())
+
+class CatalogStore:
+    """Column-oriented catalog where every app is an integer id into parallel arrays
+    
+    Names, categories and field keys are interned, sizes live in a float array and
+    selection and measured-size flags are bitsets, so an app costs a few references
+    instead of a nested dict plus a selection record keyed by "category:name".
+    """
+    
+    def __init__(self):
+        self.categories = []  # in catalog order, including categories still being parsed
+        self.category_apps = {}  # category -> array of app ids, once the category has loaded
+        self.names = []
+        self.category_of = array('I')
+        self.descriptions = []
+        self.icons = []
+        self.sizes = array('d')
+        self.extras = []  # remaining catalog fields as a flat (key, value, key, value...) tuple
+        self.haystacks = []  # lowercase "name\ndescription" for search
+        self.selected = AppBitSet()
+        self.measured = AppBitSet()
+        self.name_lookup = {}  # category -> {name: app id}, built on first lookup
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __bool__(self):
+        return bool(self.categories)
+    
+    def discover(self, category):
+        category = sys.intern(category)
+        if category not in self.categories:
+            self.categories.append(category)
+        return category
+    
+    def add_category(self, category, apps):
+        """Append a category given as a CatalogChunk, or as a {name: info} dict to build one from"""
+        chunk = apps if isinstance(apps, CatalogChunk) else CatalogChunk(apps)
+        category = self.discover(category)
+        category_index = self.categories.index(category)
+        app_ids = self.category_apps.setdefault(category, array('I'))
+        self.name_lookup.pop(category, None)
+        
+        first = len(self.names)
+        self.names.extend(chunk.names)
+        self.category_of.extend(array('I', [category_index]) * len(chunk))
+        self.descriptions.extend(chunk.descriptions)
+        self.icons.extend(chunk.icons)
+        self.sizes.extend(chunk.sizes)
+        self.extras.extend(chunk.extras)
+        self.haystacks.extend(chunk.haystacks)
+        app_ids.extend(range(first, len(self.names)))
+    
+    def is_loaded(self, category):
+        return category in self.category_apps
+    
+    def category(self, app_id):
+        return self.categories[self.category_of[app_id]]
     
-    def set_count(self, count):
-        self.count = count
-        display_text = f"{self.category_text} ({count})"
-        if len(display_text) > 20:
-            display_text = f"{self.category_text[:12]}... ({count})"
-        self.setText(display_text)
-
-class EmptyStateWidget(QWidget):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setup_ui()
+    def app_key(self, app_id):
+        """Return the "category:name" key used for logs, caches and carrying selections"""
+        return f"{self.category(app_id)}:{self.names[app_id]}"
     
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(20, 40, 20, 40)
-        layout.setSpacing(15)
-        layout.setAlignment(Qt.AlignCenter)
-        
-        icon_label = QLabel("📦")
-        icon_label.setFont(QFont("Segoe UI", 32))
-        icon_label.setStyleSheet("color: #30363d;")
-        icon_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(icon_label)
-        
-        title_label = QLabel("No Applications Selected")
-        title_label.setFont(QFont("Segoe UI", 16, QFont.Bold))
-        title_label.setStyleSheet("color: #8b949e;")
-        title_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(title_label)
-        
-        message_label = QLabel("Select applications from the list above to install them via Chocolatey.")
-        message_label.setFont(QFont("Segoe UI", 11))
-        message_label.setStyleSheet("color: #6e7681;")
-        message_label.setAlignment(Qt.AlignCenter)
-        message_label.setWordWrap(True)
-        layout.addWidget(message_label)
+    def find(self, category, app_name):
+        lookup = self.name_lookup.get(category)
+        if lookup is None:
+            lookup = {self.names[app_id]: app_id for app_id in self.category_apps.get(category, ())}
+            self.name_lookup[category] = lookup
+        return lookup.get(app_name)
+    
+    def find_key(self, app_key):
+        category, _, app_name = app_key.partition(":")
+        return self.find(category, app_name)
+    
+    def get(self, app_id, key, default=None):
+        if key == 'description':
+            return self.descriptions[app_id]
+        if key == 'icon':
+            icon = self.icons[app_id]
+            return default if icon is None else icon
+        if key == 'size':
+            return self.sizes[app_id]
+        extras = self.extras[app_id]
+        for i in range(0, len(extras), 2):
+            if extras[i] == key:
+                return extras[i + 1]
+        return default
+    
+    def info(self, app_id):
+        """Rebuild the catalog entry for an app as a dict"""
+        extras = self.extras[app_id]
+        info = {'description': self.descriptions[app_id], 'size': self.sizes[app_id]}
+        if self.icons[app_id] is not None:
+            info['icon'] = self.icons[app_id]
+        info.update(zip(extras[::2], extras[1::2]))
+        return info
+    
+    def set_measured_size(self, app_id, size_mb):
+        self.sizes[app_id] = size_mb
+        self.measured.add(app_id)
+    
+    def search(self, text):
+        return [app_id for app_id, haystack in enumerate(self.haystacks) if text in haystack]
 
 class DataLoader(QThread):
-    data_loaded = Signal(dict)
+    category_discovered = Signal(str, str)
+    category_loaded = Signal(str, str, object)
+    data_loaded = Signal(str)
     status_updated = Signal(str)
-    error_occurred = Signal(str)
+    error_occurred = Signal(str, str)
     
-    def __init__(self, url=None, use_chocolatey=True):
+    def __init__(self, url=None, use_chocolatey=True, bundle=None):
         super().__init__()
-        self.url = url or ("https://raw.githubusercontent.com/ice-exe/Spaller/refs/heads/main/resources/choco_data.json" if use_chocolatey else "https://raw.githubusercontent.com/ice-exe/Spaller/refs/heads/main/resources/apps_data.json")
+        self.mode = "chocolatey" if use_chocolatey else "direct"
+        self.url = url or CATALOG_URLS[self.mode]
         self.use_chocolatey = use_chocolatey
+        self.bundle = bundle
+        self.chunk = CatalogChunk()
+    
+    def on_category(self, category):
+        self.chunk = CatalogChunk()
+        self.category_discovered.emit(self.mode, category)
+    
+    def on_app(self, category, app_name, app_info):
+        self.chunk.append(app_name, app_info)
+    
+    def on_category_end(self, category):
+        # Hand each finished category to the GUI as ready-made columns and keep nothing behind in the worker
+        chunk, self.chunk = self.chunk, CatalogChunk()
+        self.category_loaded.emit(self.mode, category, chunk)
     
     def run(self):
+        started = time.monotonic()
         try:
-            self.status_updated.emit("Connecting to server...")
-            response = requests.get(self.url, timeout=15)
-            response.raise_for_status()
-            
-            self.status_updated.emit("Processing data...")
-            data = response.json()
+            parser = StreamingCatalogParser(self.on_category, self.on_app, self.on_category_end)
+            if self.bundle:
+                self.status_updated.emit("Reading offline bundle...")
+                path = self.bundle.catalog_path(self.mode)
+                if not path or not os.path.exists(path):
+                    raise ValueError(f"Offline bundle has no {self.mode} catalog")
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CATALOG_CHUNK_SIZE), b""):
+                        parser.feed(chunk)
+            else:
+                self.status_updated.emit("Connecting to server...")
+                with requests.get(self.url, timeout=15, stream=True) as response:
+                    response.raise_for_status()
+                    
+                    self.status_updated.emit("Processing data...")
+                    for chunk in response.iter_content(CATALOG_CHUNK_SIZE):
+                        parser.feed(chunk)
+            parser.close()
+            METRICS.catalog_fetch_seconds.observe(time.monotonic() - started, self.mode)
             
             self.status_updated.emit("Ready!")
-            self.data_loaded.emit(data)
+            self.data_loaded.emit(self.mode)
             
         except Exception as e:
-            self.error_occurred.emit(str(e))
+            self.error_occurred.emit(self.mode, str(e))
+
+class SizeProbeThread(QThread):
+    size_measured = Signal(int, float)
+    
+    def __init__(self, app_urls, prober=None):
+        super().__init__()
+        self.app_urls = app_urls  # list of (int app_id, url)
+        self.prober = prober or SizeProber()
+        self.stopped = False
+    
+    def stop(self):
+        self.stopped = True
+    
+    def run(self):
+        app_ids_by_url = {}
+        for app_id, url in self.app_urls:
+            app_ids_by_url.setdefault(url, []).append(app_id)
+        
+        def on_measured(url, entry):
+            for app_id in app_ids_by_url.get(url, []):
+                self.size_measured.emit(app_id, entry['size'] / BYTES_PER_MB)
+        
+        try:
+            self.prober.probe_many(app_ids_by_url.keys(), on_measured, lambda: self.stopped)
+        except Exception as e:
+            print(f"Size probing failed: {e}")
+
+class OutdatedCheckThread(QThread):
+    """Run the batched 'choco outdated' query for the Updates button"""
+    
+    checked = Signal(dict, str)  # {package id: (installed, available)}, error
+    
+    def __init__(self, source=None):
+        super().__init__()
+        self.source = source
+    
+    def run(self):
+        try:
+            self.checked.emit(query_outdated_packages(self.source), "")
+        except RuntimeError as e:
+            self.checked.emit({}, str(e))
 
 class ChocolateySetupThread(QThread):
     setup_completed = Signal(bool, str)
     progress_updated = Signal(str)
+    prerequisites_probed = Signal(dict)
+    
+    def __init__(self, prober=None, bundle=None):
+        super().__init__()
+        self.prober = prober or PrerequisiteProber()
+        self.bundle = bundle
     
     def run(self):
         try:
-            self.progress_updated.emit("Checking Chocolatey installation...")
+            self.progress_updated.emit("Checking system requirements...")
+            
+            results = self.prober.probe_all()
+            self.prerequisites_probed.emit(results)
             
-            if check_chocolatey_installed():
+            chocolatey = results.get('chocolatey') or {}
+            if chocolatey.get('path'):
                 self.setup_completed.emit(True, "Chocolatey is already installed")
                 return
             
             self.progress_updated.emit("Installing Chocolatey...")
             
-            if install_chocolatey():
+            if install_chocolatey(self.bundle):
                 self.progress_updated.emit("Verifying installation...")
-                time.sleep(5)  # Wait for installation to complete
+                self.prober.invalidate('chocolatey')
                 
-                if check_chocolatey_installed():
+                if self.wait_for_chocolatey():
                     self.setup_completed.emit(True, "Chocolatey installed successfully")
                 else:
                     self.setup_completed.emit(False, "Chocolatey installation verification failed")
@@ -765,20 +4517,49 @@ class ChocolateySetupThread(QThread):
                 
         except Exception as e:
             self.setup_completed.emit(False, f"Error during setup: {str(e)}")
+    
+    def wait_for_chocolatey(self, timeout=5):
+        """Poll for choco.exe after installation instead of sleeping a fixed time"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.prober.probe_chocolatey(force=True).get('path'):
+                self.prober.save()
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.25)
 
 class SpallerMainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, bundle=None, peer_cache=None, lockfile=None):
         super().__init__()
-        self.apps_data = {}
-        self.selected_apps = {}
+        self.bundle = bundle
+        self.peer_cache = peer_cache
+        self.lockfile = lockfile or {}
+        self.catalog = CatalogStore()
         self.app_checkboxes = {}
         self.current_category = None
         self.category_buttons = {}
         self.downloading = False
         self.chocolatey_ready = False
         self.installation_mode = "chocolatey"  # or "direct"
+        self.prerequisites = {}
+        self.prober = PrerequisiteProber()
+        self.chocolatey_setup = None
+        self.catalogs = {}
+        self.catalog_errors = {}
+        self.catalog_complete = set()
+        self.loaders = {}
+        self.pending_selection = set()
+        self.size_prober = SizeProber()
+        self.size_probe_thread = None
+        self.pending_size_probes = {}
+        self.size_probes_queued = AppBitSet()
+        self.restart_summary = None  # RunFinished of the last run if it asked for a restart
+        self.outdated_check = None
+        self.checkbox_pool = []  # Hidden ModernCheckBox widgets waiting to show another app
         
         self.setup_ui()
+        self.prefetch_catalogs()
         self.check_prerequisites()
     
     def setup_ui(self):
@@ -883,7 +4664,12 @@ class SpallerMainWindow(QMainWindow):
                 border-color: #58a6ff;
             }
         """)
-        self.search_bar.textChanged.connect(self.filter_apps)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(lambda: self.filter_apps(self.search_bar.text()))
+        # Restarted on every keystroke, so the list is rebuilt once typing pauses
+        self.search_bar.textChanged.connect(self.search_timer.start)
         search_layout.addWidget(self.search_bar)
         
         header_layout.addLayout(search_layout)
@@ -900,6 +4686,12 @@ class SpallerMainWindow(QMainWindow):
         self.select_all_btn.clicked.connect(self.toggle_select_all)
         selection_group.addWidget(self.select_all_btn)
         
+        self.updates_btn = PulseButton("Updates", "accent")
+        self.updates_btn.setFixedSize(85, 30)
+        self.updates_btn.setToolTip("Check installed Chocolatey packages for newer versions")
+        self.updates_btn.clicked.connect(self.check_for_updates)
+        selection_group.addWidget(self.updates_btn)
+        
         # Add manual restart button if not admin
         if not is_admin():
             self.restart_admin_btn = PulseButton("Run as Admin", "warning", "🛡️")
@@ -1023,6 +4815,8 @@ class SpallerMainWindow(QMainWindow):
         self.scroll_layout = QVBoxLayout(self.scroll_widget)
         self.scroll_layout.setContentsMargins(0, 0, 8, 0)
         self.scroll_layout.setSpacing(6)
+        # One stretch for the window's lifetime; rows are inserted above it
+        self.scroll_layout.addStretch()
         
         self.empty_state = EmptyStateWidget()
         
@@ -1258,25 +5052,48 @@ class SpallerMainWindow(QMainWindow):
     
     def setup_chocolatey(self):
         """Setup Chocolatey if needed"""
-        self.chocolatey_setup = ChocolateySetupThread()
+        self.chocolatey_setup = ChocolateySetupThread(self.prober, self.bundle)
         self.chocolatey_setup.progress_updated.connect(self.update_setup_status)
+        self.chocolatey_setup.prerequisites_probed.connect(self.on_prerequisites_probed)
         self.chocolatey_setup.setup_completed.connect(self.on_chocolatey_setup_complete)
         self.chocolatey_setup.start()
     
+    def chocolatey_setup_running(self):
+        return self.chocolatey_setup is not None and self.chocolatey_setup.isRunning()
+    
     def update_setup_status(self, status):
         """Update status during Chocolatey setup"""
         if hasattr(self, 'status_label'):
             self.status_label.setText(status)
     
+    def on_prerequisites_probed(self, results):
+        """Store probe results and surface anything that will get in the way"""
+        self.prerequisites = results
+        
+        network = results.get('network') or {}
+        disk = results.get('disk') or {}
+        
+        if network and not network.get('reachable') and not self.bundle:
+            self.status_label.setText("Network unreachable")
+            self.status_label.setStyleSheet("color: #f85149; border: none;")
+        elif disk and disk.get('free', 0) < 1024 ** 3:
+            self.status_label.setText(f"Low disk space ({disk['free'] / 1024 ** 2:.0f} MB free)")
+            self.status_label.setStyleSheet("color: #fb8500; border: none;")
+    
+    def chocolatey_label(self):
+        version = (self.prerequisites.get('chocolatey') or {}).get('version')
+        return f"Chocolatey {version}" if version else "Chocolatey"
+    
     def on_chocolatey_setup_complete(self, success, message):
         """Handle Chocolatey setup completion"""
         if success:
             self.chocolatey_ready = True
             self.installation_mode = "chocolatey"
-            self.choco_status.setText("Chocolatey (Ready)")
+            self.choco_status.setText(f"{self.chocolatey_label()} (Ready)")
             self.choco_status.setStyleSheet("color: #3fb950; border: none;")
             self.load_data()
         else:
+            self.chocolatey_ready = False
             self.choco_status.setText("Chocolatey (Failed)")
             self.choco_status.setStyleSheet("color: #f85149; border: none;")
             
@@ -1305,40 +5122,147 @@ class SpallerMainWindow(QMainWindow):
             else:
                 self.close()
     
+    def prefetch_catalogs(self):
+        """Fetch and index both install-method catalogs while prerequisites are set up"""
+        for mode in CATALOG_URLS:
+            self.fetch_catalog(mode)
+    
+    def fetch_catalog(self, mode):
+        loader = self.loaders.get(mode)
+        if loader and loader.isRunning():
+            return
+        
+        self.catalog_errors.pop(mode, None)
+        self.catalog_complete.discard(mode)
+        self.catalogs[mode] = CatalogStore()
+        
+        loader = DataLoader(use_chocolatey=(mode == "chocolatey"), bundle=self.bundle)
+        loader.category_discovered.connect(self.on_category_discovered)
+        loader.category_loaded.connect(self.on_category_loaded)
+        loader.data_loaded.connect(self.on_data_loaded)
+        loader.error_occurred.connect(self.on_data_error)
+        self.loaders[mode] = loader
+        loader.start()
+    
+    def show_catalog(self, mode):
+        """Display a catalog, fetching it first if the prefetch has failed"""
+        if mode in self.catalog_errors:
+            self.fetch_catalog(mode)
+        # A catalog still streaming in is shown as far as it has been parsed and fills in as categories land
+        self.apply_catalog(mode)
+    
     def load_data_fallback(self):
         """Load data using the fallback direct download JSON"""
-        self.loader = DataLoader(use_chocolatey=False)
-        self.loader.data_loaded.connect(self.on_data_loaded)
-        self.loader.error_occurred.connect(self.on_data_error)
-        self.loader.start()
+        self.show_catalog("direct")
     
     def load_data(self):
         if self.chocolatey_ready:
-            self.choco_status.setText("Chocolatey (Ready)")
+            self.choco_status.setText(f"{self.chocolatey_label()} (Ready)")
             self.choco_status.setStyleSheet("color: #3fb950; border: none;")
         else:
             self.choco_status.setText("Chocolatey (Not Available)")
             self.choco_status.setStyleSheet("color: #f85149; border: none;")
         
-        self.loader = DataLoader(use_chocolatey=True)
-        self.loader.data_loaded.connect(self.on_data_loaded)
-        self.loader.error_occurred.connect(self.on_data_error)
-        self.loader.start()
+        if self.catalogs and self.catalog is self.catalogs.get("chocolatey"):
+            self.update_ready_status()
+        else:
+            self.show_catalog("chocolatey")
+    
+    def on_category_discovered(self, mode, category):
+        """Show a category button as soon as its header has been parsed"""
+        catalog = self.catalogs[mode]
+        if category in catalog.categories:
+            return
+        category = catalog.discover(category)
+        if self.catalog is catalog:
+            self.add_category_button(category)
+        elif mode == self.installation_mode:
+            self.apply_catalog(mode)
+    
+    def on_category_loaded(self, mode, category, chunk):
+        catalog = self.catalogs[mode]
+        catalog.add_category(category, chunk)
+        
+        if self.catalog is not catalog:
+            return
+        
+        if category in self.category_buttons:
+            self.category_buttons[category].count = len(catalog.category_apps[category])
+        self.apply_pending_selection(category)
+        
+        # The first category becomes usable while the rest of the catalog is still parsing
+        if self.current_category is None or self.current_category == category or \
+                self.current_category not in catalog.categories:
+            if not self.search_bar.text():
+                self.switch_category(category)
     
-    def on_data_loaded(self, data):
-        self.apps_data = data
+    def on_data_loaded(self, mode):
+        self.catalog_complete.add(mode)
+        
+        if self.catalog is self.catalogs[mode]:
+            # Selections for apps the finished catalog does not offer are dropped
+            self.pending_selection.clear()
+            if self.search_bar.text():
+                self.filter_apps(self.search_bar.text())
+            self.update_ready_status()
+        elif mode == "direct" and self.catalog:
+            # The direct catalog carries the installer URLs used to measure Chocolatey app sizes
+            shown = list(self.size_probes_queued)
+            self.size_probes_queued.clear()
+            for app_id in shown:
+                self.prepare_app_size(app_id)
+            self.start_size_probing()
+    
+    def apply_catalog(self, mode):
+        previous_selection = {self.catalog.app_key(app_id) for app_id in self.catalog.selected}
+        self.catalog.selected.clear()
+        
+        self.catalog = self.catalogs[mode]
         self.initialize_selection_state()
+        
+        # Carry selections over when switching between catalogs, including categories that have not arrived yet
+        self.pending_selection = previous_selection | self.pending_selection
+        for category in list(self.catalog.category_apps):
+            self.apply_pending_selection(category)
+        
         self.setup_categories()
-        if self.apps_data:
-            first_category = list(self.apps_data.keys())[0]
-            self.switch_category(first_category)
+        if not self.catalog.is_loaded(self.current_category):
+            self.current_category = next(iter(self.catalog.category_apps), None)
+        if self.current_category:
+            self.switch_category(self.current_category)
+        else:
+            self.show_catalog_loading()
         
-        if self.chocolatey_ready:
+        self.update_ready_status()
+        self.start_size_probing()
+    
+    def apply_pending_selection(self, category):
+        prefix = f"{category}:"
+        for app_key in [app_key for app_key in self.pending_selection if app_key.startswith(prefix)]:
+            self.pending_selection.discard(app_key)
+            app_id = self.catalog.find_key(app_key)
+            if app_id is not None:
+                self.catalog.selected.add(app_id)
+                self.prepare_app_size(app_id)
+    
+    def update_ready_status(self):
+        if self.installation_mode == "direct":
+            self.status_label.setText("Ready to download and install")
+        elif self.chocolatey_ready:
             self.status_label.setText("Ready to install packages")
+        elif self.chocolatey_setup_running():
+            self.status_label.setText("Setting up Chocolatey...")
         else:
             self.status_label.setText("Limited functionality - Chocolatey not available")
+        self.status_label.setStyleSheet("color: #f0f6fc; border: none;")
     
-    def on_data_error(self, error):
+    def on_data_error(self, mode, error):
+        self.catalog_errors[mode] = error
+        
+        # A failed prefetch of the inactive catalog is retried when it is needed
+        if mode != self.installation_mode:
+            return
+        
         result = QMessageBox.critical(
             self,
             "Connection Error",
@@ -1352,25 +5276,118 @@ class SpallerMainWindow(QMainWindow):
         self.close()
     
     def initialize_selection_state(self):
-        self.selected_apps = {}
-        for category, apps in self.apps_data.items():
-            for app_name, app_info in apps.items():
-                app_id = f"{category}:{app_name}"
-                app_size = app_info.get('size', 50)
-                self.selected_apps[app_id] = {
-                    'selected': False,
-                    'info': app_info,
-                    'category': category,
-                    'name': app_name,
-                    'size': app_size
-                }
+        self.pending_size_probes = {}
+        self.size_probes_queued = AppBitSet()
+    
+    def get_app_download_url(self, app_id):
+        """Return the direct installer URL for an app, borrowing it from the direct catalog if needed"""
+        url = self.catalog.get(app_id, 'url')
+        if not url:
+            direct = self.catalogs.get("direct")
+            direct_id = direct.find(self.catalog.category(app_id), self.catalog.names[app_id]) if direct else None
+            url = direct_id is not None and direct.get(direct_id, 'url')
+        return url or None
+    
+    def prepare_app_size(self, app_id):
+        """Apply a cached measurement for an app being shown and queue a fresh probe for it"""
+        if app_id in self.size_probes_queued:
+            return
+        self.size_probes_queued.add(app_id)
+        
+        url = self.get_app_download_url(app_id)
+        if not url:
+            return
+        entry = self.size_prober.get_cached(url, fresh_only=False)
+        if entry:
+            self.catalog.set_measured_size(app_id, entry['size'] / BYTES_PER_MB)
+        if not self.bundle:
+            self.pending_size_probes[app_id] = url
+    
+    def start_size_probing(self):
+        """Measure real installer sizes in the background for apps that have been shown"""
+        if not self.pending_size_probes:
+            return
+        # A running probe picks up the queued apps when it finishes
+        if self.size_probe_thread and self.size_probe_thread.isRunning():
+            return
+        
+        app_urls = list(self.pending_size_probes.items())
+        self.pending_size_probes = {}
+        
+        catalog = self.catalog
+        self.size_probe_thread = SizeProbeThread(app_urls, self.size_prober)
+        self.size_probe_thread.size_measured.connect(
+            lambda app_id, size_mb: self.set_measured_size(app_id, size_mb, catalog)
+        )
+        self.size_probe_thread.finished.connect(self.start_size_probing)
+        self.size_probe_thread.start()
+    
+    def set_measured_size(self, app_id, size_mb, catalog=None):
+        catalog = catalog or self.catalog
+        catalog.set_measured_size(app_id, size_mb)
+        if catalog is not self.catalog:
+            return
+        
+        if app_id in self.app_checkboxes:
+            self.app_checkboxes[app_id].set_size(size_mb, True)
+        if app_id in catalog.selected:
+            self.update_selected_count()
     
     def setup_categories(self):
-        for category in self.apps_data.keys():
-            btn = CategoryButton(category, len(self.apps_data[category]))
-            btn.clicked.connect(lambda checked, cat=category: self.switch_category(cat))
-            self.categories_container.addWidget(btn)
-            self.category_buttons[category] = btn
+        for btn in self.category_buttons.values():
+            self.categories_container.removeWidget(btn)
+            btn.deleteLater()
+        self.category_buttons.clear()
+        
+        for category in self.catalog.categories:
+            self.add_category_button(category)
+    
+    def add_category_button(self, category):
+        btn = CategoryButton(category, len(self.catalog.category_apps.get(category, ())))
+        btn.set_active(category == self.current_category)
+        btn.clicked.connect(lambda checked, cat=category: self.switch_category(cat))
+        self.categories_container.addWidget(btn)
+        self.category_buttons[category] = btn
+    
+    def clear_app_list(self):
+        """Empty the app list, keeping app widgets in a pool for the next category or search"""
+        self.app_checkboxes.clear()
+        while self.scroll_layout.count() > 1:
+            # removeWidget() frees the layout item as well; takeAt() hands it back and leaks it
+            widget = self.scroll_layout.itemAt(0).widget()
+            self.scroll_layout.removeWidget(widget)
+            if isinstance(widget, ModernCheckBox) and len(self.checkbox_pool) < APP_WIDGET_POOL_SIZE:
+                widget.hide()
+                self.checkbox_pool.append(widget)
+            else:
+                widget.deleteLater()
+    
+    def add_list_widget(self, widget):
+        self.scroll_layout.insertWidget(self.scroll_layout.count() - 1, widget)
+    
+    def show_catalog_loading(self):
+        self.clear_app_list()
+        self.category_title.setText("Loading catalog...")
+        self.category_count.setText("")
+        self.update_selected_count()
+    
+    def add_app_checkbox(self, app_id):
+        catalog = self.catalog
+        self.prepare_app_size(app_id)
+        
+        if self.checkbox_pool:
+            checkbox = self.checkbox_pool.pop()
+            checkbox.bind(catalog.names[app_id], catalog.descriptions[app_id], app_id, catalog.sizes[app_id],
+                          catalog.get(app_id, 'icon', '📦'), app_id in catalog.measured, app_id in catalog.selected)
+        else:
+            checkbox = ModernCheckBox(catalog.names[app_id], catalog.descriptions[app_id], app_id,
+                                      catalog.sizes[app_id], catalog.get(app_id, 'icon', '📦'),
+                                      app_id in catalog.measured)
+            checkbox.show_checked(app_id in catalog.selected)
+            checkbox.stateChanged.connect(self.on_checkbox_toggled)
+        self.add_list_widget(checkbox)
+        checkbox.show()
+        self.app_checkboxes[app_id] = checkbox
     
     def switch_category(self, category):
         for cat, btn in self.category_buttons.items():
@@ -1378,46 +5395,32 @@ class SpallerMainWindow(QMainWindow):
         
         self.current_category = category
         
-        apps_count = len(self.apps_data.get(category, {}))
         self.category_title.setText(category)
-        self.category_count.setText(f"({apps_count} applications available)")
-        
-        self.app_checkboxes.clear()
+        app_ids = self.catalog.category_apps.get(category)
+        if app_ids is not None:
+            self.category_count.setText(f"({len(app_ids)} applications available)")
+        else:
+            self.category_count.setText("(loading...)")
         
-        while self.scroll_layout.count():
-            child = self.scroll_layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        self.clear_app_list()
         
-        if category in self.apps_data:
-            for app_name, app_info in self.apps_data[category].items():
-                app_id = f"{category}:{app_name}"
-                
-                app_size = app_info.get('size', 50)
-                app_icon = app_info.get('icon', '📦')
-                
-                checkbox = ModernCheckBox(app_name, app_info['description'], app_id, app_size, app_icon)
-                self.scroll_layout.addWidget(checkbox)
-                
-                self.app_checkboxes[app_id] = checkbox
-                
-                if app_id in self.selected_apps:
-                    checkbox.setChecked(self.selected_apps[app_id]['selected'])
-                
-                checkbox.stateChanged.connect(
-                    lambda checked, aid=app_id: self.update_selection(aid, checked)
-                )
+        for app_id in app_ids or ():
+            self.add_app_checkbox(app_id)
         
-        self.scroll_layout.addStretch()
         self.update_selected_count()
+        self.start_size_probing()
+    
+    def on_checkbox_toggled(self, checked):
+        # The signal comes from the QCheckBox inside the ModernCheckBox
+        self.update_selection(self.sender().parent().app_id, checked)
     
     def update_selection(self, app_id, checked):
-        if app_id in self.selected_apps:
-            self.selected_apps[app_id]['selected'] = checked
-            self.update_selected_count()
+        self.catalog.selected.set(app_id, checked)
+        self.update_selected_count()
     
     def update_selected_count(self):
-        selected_count = sum(1 for app in self.selected_apps.values() if app['selected'])
+        catalog = self.catalog
+        selected_count = len(catalog.selected)
         
         if selected_count == 0:
             self.selected_count_label.setText("No applications selected")
@@ -1433,15 +5436,21 @@ class SpallerMainWindow(QMainWindow):
             self.size_info_label.setStyleSheet("color: #6e7681; border: none; font-style: italic;")
             self.install_btn.setEnabled(False)
         else:
-            estimated_size = sum(app['size'] for app in self.selected_apps.values() if app['selected'])
-            size_text = f"{estimated_size} MB" if estimated_size < 1000 else f"{estimated_size/1000:.1f} GB"
-        
+            selected = list(catalog.selected)
+            total_size = sum(catalog.sizes[app_id] for app_id in selected)
+            estimated_count = sum(1 for app_id in selected if app_id not in catalog.measured)
+            size_text = format_size(total_size, estimated_count == 0)
+            
             if selected_count == 1:
                 self.selected_count_label.setText(f"1 application selected")
-                self.size_info_label.setText(f"Estimated download: ~{size_text}")
+                label = "Download" if estimated_count == 0 else "Estimated download"
+                self.size_info_label.setText(f"{label}: {size_text}")
             else:
                 self.selected_count_label.setText(f"{selected_count} applications selected")
-                self.size_info_label.setText(f"Total estimated download: ~{size_text}")
+                if estimated_count == 0:
+                    self.size_info_label.setText(f"Total download: {size_text}")
+                else:
+                    self.size_info_label.setText(f"Total download: {size_text} ({estimated_count} estimated)")
         
             self.selected_count_label.setStyleSheet("color: #58a6ff; border: none; font-weight: bold;")
             self.size_info_label.setStyleSheet("color: #3fb950; border: none;")
@@ -1457,32 +5466,36 @@ class SpallerMainWindow(QMainWindow):
         if not self.current_category:
             return
         
-        category_app_ids = [app_id for app_id, app in self.selected_apps.items() 
-                          if app['category'] == self.current_category]
+        catalog = self.catalog
+        category_app_ids = catalog.category_apps.get(self.current_category, ())
         
-        all_selected = all(self.selected_apps[app_id]['selected'] 
-                          for app_id in category_app_ids)
+        all_selected = all(app_id in catalog.selected for app_id in category_app_ids)
         
         for app_id in category_app_ids:
-            self.selected_apps[app_id]['selected'] = not all_selected
+            catalog.selected.set(app_id, not all_selected)
+            self.prepare_app_size(app_id)
             
             if app_id in self.app_checkboxes:
-                self.app_checkboxes[app_id].setChecked(not all_selected)
+                self.app_checkboxes[app_id].show_checked(not all_selected)
         
         self.select_category_btn.setText("Deselect All" if not all_selected else "Select All")
         self.update_selected_count()
+        self.start_size_probing()
     
     def toggle_select_all(self):
-        all_selected = all(app['selected'] for app in self.selected_apps.values())
+        catalog = self.catalog
+        all_selected = len(catalog.selected) == len(catalog)
         
-        for app_id, app_data in self.selected_apps.items():
-            app_data['selected'] = not all_selected
+        for app_id in range(len(catalog)):
+            catalog.selected.set(app_id, not all_selected)
+            self.prepare_app_size(app_id)
             
             if app_id in self.app_checkboxes:
-                self.app_checkboxes[app_id].setChecked(not all_selected)
+                self.app_checkboxes[app_id].show_checked(not all_selected)
         
         self.select_all_btn.setText("Deselect All" if not all_selected else "Select All")
         self.update_selected_count()
+        self.start_size_probing()
     
     def manual_restart_admin(self):
         """Manual restart as admin button"""
@@ -1518,7 +5531,7 @@ class SpallerMainWindow(QMainWindow):
     
     def filter_apps(self, text):
         """Filter applications globally across all categories"""
-        if not hasattr(self, 'apps_data') or not self.apps_data:
+        if not self.catalog:
             return
         
         search_text = text.lower()
@@ -1528,41 +5541,17 @@ class SpallerMainWindow(QMainWindow):
                 self.switch_category(self.current_category)
             return
         
-        self.app_checkboxes.clear()
-        while self.scroll_layout.count():
-            child = self.scroll_layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        self.clear_app_list()
         
-        found_apps = []
-        for category, apps in self.apps_data.items():
-            for app_name, app_info in apps.items():
-                if (search_text in app_name.lower() or 
-                    search_text in app_info.get('description', '').lower()):
-                    found_apps.append((category, app_name, app_info))
+        found_ids = self.catalog.search(search_text)
         
         self.category_title.setText(f"Search Results for '{text}'")
-        self.category_count.setText(f"({len(found_apps)} applications found)")
+        self.category_count.setText(f"({len(found_ids)} applications found)")
         
-        for category, app_name, app_info in found_apps:
-            app_id = f"{category}:{app_name}"
-            
-            app_size = app_info.get('size', 50)
-            app_icon = app_info.get('icon', '📦')
-            
-            checkbox = ModernCheckBox(app_name, app_info['description'], app_id, app_size, app_icon)
-            self.scroll_layout.addWidget(checkbox)
-            
-            self.app_checkboxes[app_id] = checkbox
-            
-            if app_id in self.selected_apps:
-                checkbox.setChecked(self.selected_apps[app_id]['selected'])
-            
-            checkbox.stateChanged.connect(
-                lambda checked, aid=app_id: self.update_selection(aid, checked)
-            )
+        for app_id in found_ids:
+            self.add_app_checkbox(app_id)
         
-        if not found_apps:
+        if not found_ids:
             empty_widget = QWidget()
             empty_layout = QVBoxLayout(empty_widget)
             empty_layout.setAlignment(Qt.AlignCenter)
@@ -1573,22 +5562,35 @@ class SpallerMainWindow(QMainWindow):
             empty_label.setAlignment(Qt.AlignCenter)
             
             empty_layout.addWidget(empty_label)
-            self.scroll_layout.addWidget(empty_widget)
+            self.add_list_widget(empty_widget)
         
-        self.scroll_layout.addStretch()
         self.update_selected_count()
+        self.start_size_probing()
     
     def start_installation(self):
         if self.downloading:
             return
         
-        selected_apps = [(app_id, app_data) for app_id, app_data in self.selected_apps.items() 
-                        if app_data['selected']]
+        catalog = self.catalog
+        selected_apps = [(catalog.app_key(app_id), {'info': catalog.info(app_id),
+                                                    'category': catalog.category(app_id),
+                                                    'name': catalog.names[app_id],
+                                                    'size': catalog.sizes[app_id]})
+                         for app_id in catalog.selected]
         
         if not selected_apps:
             QMessageBox.warning(self, "No Selection", "Please select at least one application to install.")
             return
         
+        if self.installation_mode == "chocolatey" and self.chocolatey_setup_running():
+            QMessageBox.information(
+                self,
+                "Chocolatey Setup In Progress",
+                "Chocolatey is still being set up.\n\n"
+                "Your selection will be kept - start the installation once it is ready."
+            )
+            return
+        
         if self.installation_mode == "chocolatey" and not self.chocolatey_ready:
             reply = QMessageBox.warning(
                 self,
@@ -1600,48 +5602,212 @@ class SpallerMainWindow(QMainWindow):
             if reply != QMessageBox.Yes:
                 return
         
+        total_size = sum(app_data['size'] for _, app_data in selected_apps)
+        shortfalls = preflight_disk_space(total_size)
+        if shortfalls:
+            details = "\n".join(
+                f"• {path}: needs {required / BYTES_PER_MB / 1000:.1f} GB, {free / BYTES_PER_MB / 1000:.1f} GB free"
+                for path, required, free in shortfalls
+            )
+            QMessageBox.critical(
+                self,
+                "Not Enough Disk Space",
+                f"The selected applications will not fit on the target drive:\n\n{details}\n\n"
+                "Free up some space or deselect some applications."
+            )
+            return
+        
+        self.launch_installation(selected_apps, self.installation_mode)
+    
+    def launch_installation(self, selected_apps, installation_mode, run_id=None, action="install"):
+        """Start the installation thread; run_id continues an interrupted run from the journal"""
         self.downloading = True
         self.install_btn.setEnabled(False)
         self.install_btn.stop_pulse()
-        self.install_btn.setText("Installing...")
+        self.install_btn.setText("Upgrading..." if action == "upgrade" else "Installing...")
+        self.updates_btn.setEnabled(False)
         self.cancel_btn.setEnabled(True)
         self.pause_btn.setEnabled(True)
         
-        self.installer = InstallationThread(selected_apps, self.installation_mode)
-        self.installer.progress_updated.connect(self.update_progress)
+        self.install_base_progress = 0
+        self.install_total_apps = len(selected_apps)
+        self.install_finished_apps = 0
+        self.restart_summary = None
+        
+        self.installer = InstallationThread(selected_apps, installation_mode, self.bundle, self.peer_cache,
+                                            self.lockfile, run_id, action)
+        self.installer.events.connect(self.on_install_events)
         self.installer.finished.connect(self.installation_finished)
         self.installer.start()
     
-    def update_progress(self, value, status, current_app="", total_apps=0):
-        self.progress_bar.setValue(int(value))
+    def check_for_updates(self):
+        """Ask Chocolatey which catalog apps are outdated, off the GUI thread"""
+        if self.downloading or (self.outdated_check and self.outdated_check.isRunning()):
+            return
+        catalog = self.catalogs.get("chocolatey")
+        if not self.chocolatey_ready or not catalog:
+            QMessageBox.information(self, "Updates", "Checking for updates needs Chocolatey and its catalog.")
+            return
         
-        if value > 0:
-            self.progress_bar.setFormat(f"{int(value)}%")
-        else:
-            self.progress_bar.setFormat("")
+        self.updates_btn.setEnabled(False)
+        self.status_label.setText("Checking installed packages for newer versions...")
+        self.status_label.setStyleSheet("color: #58a6ff; border: none;")
+        self.outdated_check = OutdatedCheckThread(self.bundle.package_source() if self.bundle else None)
+        self.outdated_check.checked.connect(self.on_outdated_checked)
+        self.outdated_check.start()
+    
+    def on_outdated_checked(self, outdated, error):
+        self.updates_btn.setEnabled(not self.downloading)
+        if error:
+            self.status_label.setText(f"Update check failed: {error}")
+            self.status_label.setStyleSheet("color: #f85149; border: none;")
+            return
         
-        if current_app and total_apps > 0:
-            self.status_label.setText(f"{status}: {current_app}")
+        catalog = self.catalogs["chocolatey"]
+        candidates = [(catalog.app_key(app_id), {'info': catalog.info(app_id), 'category': catalog.category(app_id),
+                                                 'name': catalog.names[app_id], 'size': catalog.sizes[app_id]})
+                      for app_id in range(len(catalog))]
+        plan, _ = plan_upgrades(candidates, outdated)
+        if not plan:
+            self.status_label.setText("Everything is up to date")
+            self.status_label.setStyleSheet("color: #3fb950; border: none;")
+            return
+        
+        self.status_label.setText(f"{len(plan)} update(s) available")
+        lines = format_upgrade_plan(plan)
+        box = QMessageBox(self)
+        box.setWindowTitle("Updates Available")
+        box.setText(f"{len(plan)} installed application(s) have newer versions:\n\n"
+                    + "\n".join(lines[:10]) + (f"\n... and {len(lines) - 10} more" if len(lines) > 10 else "")
+                    + "\n\nUpgrade them now?")
+        box.setDetailedText("\n".join(lines))
+        box.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        if box.exec() == QMessageBox.Yes and not self.downloading:
+            self.launch_installation(plan, "chocolatey", action="upgrade")
+    
+    def offer_resume(self):
+        """Ask whether to continue the newest interrupted or cancelled run recorded in the journal"""
+        journal = open_journal("gui")
+        runs = journal.resumable_runs() if journal else []
+        if not runs or self.downloading:
+            return
+        
+        run = runs[0]
+        names = ", ".join(app_data['name'] for _, app_data in run['remaining'][:5])
+        if len(run['remaining']) > 5:
+            names += f" and {len(run['remaining']) - 5} more"
+        reply = QMessageBox.question(
+            self,
+            "Resume Installation",
+            f"An earlier installation was {run['state']} with {len(run['remaining'])} of {run['total']} "
+            f"applications not finished:\n\n{names}\n\n"
+            "Resume where it left off? Completed installs are skipped and partial downloads are reused.",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        for other in runs[1:]:
+            journal.abandon(other['id'])
+        if reply == QMessageBox.Yes:
+            self.launch_installation(run['remaining'], run['method'], run['id'], run['action'])
         else:
-            self.status_label.setText(status)
+            journal.abandon(run['id'])
+        journal.close()
+    
+    def on_install_events(self, batch):
+        """Reflect a batch of install events in the progress bar and status line"""
+        downloads = []
+        for event in batch:
+            if isinstance(event, Downloading):
+                downloads.append(event)
+            elif isinstance(event, RunFinished):
+                self.show_install_summary(event)
+            elif not isinstance(event, Queued):
+                self.show_install_event(event)
+        
+        if downloads:
+            self.update_download_progress(downloads)
+    
+    def show_install_event(self, event):
+        position = f"({event.index + 1} of {event.total})"
+        finished = isinstance(event, (Succeeded, Failed, Skipped))
+        # Apps install in parallel, so progress counts finished apps rather than the position
+        self.install_finished_apps += finished
+        self.install_base_progress = (self.install_finished_apps / event.total) * 100
+        
+        if isinstance(event, Succeeded):
+            text, color = f"Completed {position}: {event.app_name}", "#3fb950"
+        elif isinstance(event, Failed):
+            text, color = f"Failed {position}: {event.app_name} - {event.reason}", "#f85149"
+        elif isinstance(event, Skipped):
+            text, color = f"Skipped {position}: {event.app_name} - {event.reason}", "#fb8500"
+        elif isinstance(event, Verifying):
+            text, color = f"Verifying {position}: {event.app_name}", "#58a6ff"
+        elif isinstance(event, Resolving):
+            text, color = f"Preparing {position}: {event.app_name}", "#58a6ff"
+            if event.backend:
+                text += f" via {event.backend}"
+        else:
+            text, color = f"Installing {position}: {event.app_name}", "#58a6ff"
         
-        # Update install button text during installation
-        if self.downloading and total_apps > 0:
-            completed = int((value / 100) * total_apps)
-            self.install_btn.setText(f"Installing... ({completed}/{total_apps})")
+        self.set_install_progress(self.install_base_progress)
+        self.status_label.setText(text)
+        self.status_label.setStyleSheet(f"color: {color}; border: none;")
         
-        if "error" in status.lower() or "failed" in status.lower():
-            self.status_label.setStyleSheet("color: #f85149; border: none;")
-        elif "completed" in status.lower():
-            self.status_label.setStyleSheet("color: #3fb950; border: none;")
-        elif "installing" in status.lower():
-            self.status_label.setStyleSheet("color: #58a6ff; border: none;")
+        if self.downloading:
+            self.install_btn.setText(f"Installing... ({self.install_finished_apps}/{event.total})")
+    
+    def show_install_summary(self, event):
+        self.set_install_progress(100)
+        if event.error:
+            self.status_label.setText(f"Error: {event.error}")
+            color = "#f85149"
+        elif self.installer.engine.cancelled.is_set():
+            self.status_label.setText(f"Installation cancelled by user: {event.succeeded} completed, "
+                                      f"{event.skipped} skipped")
+            color = "#f85149"
+        elif event.failed:
+            self.status_label.setText(f"Installations finished: {event.succeeded} completed, {event.failed} failed")
+            color = "#f85149"
         else:
-            self.status_label.setStyleSheet("color: #f0f6fc; border: none;")
+            self.status_label.setText("All installations completed!")
+            color = "#3fb950"
+        if event.restart:
+            self.restart_summary = event
+            self.status_label.setText(self.status_label.text() + " Restart required.")
+            color = "#fb8500" if color == "#3fb950" else color
+        self.status_label.setStyleSheet(f"color: {color}; border: none;")
+    
+    def set_install_progress(self, value):
+        self.progress_bar.setValue(int(value))
+        self.progress_bar.setFormat(f"{int(value)}%" if value > 0 else "")
+    
+    def update_download_progress(self, events):
+        """Show byte-level progress for the active download(s) from a batch of Downloading events"""
+        if not self.downloading or not self.install_total_apps:
+            return
+        
+        app_share = 100 / self.install_total_apps
+        fraction = 0
+        details = []
+        for event in events:
+            if event.size:
+                fraction += min(event.done / event.size, 1.0)
+                text = f"{event.done / BYTES_PER_MB:.0f}/{event.size / BYTES_PER_MB:.0f} MB"
+            else:
+                text = f"{event.done / BYTES_PER_MB:.0f} MB"
+            if event.rate > 0:
+                text += f" · {event.rate / BYTES_PER_MB:.1f} MB/s"
+            if event.eta >= 0:
+                text += f" · ETA {format_duration(event.eta)}"
+            details.append(text)
+        
+        value = min(self.install_base_progress + fraction * app_share, 100)
+        self.progress_bar.setValue(int(value))
+        self.progress_bar.setFormat(f"{int(value)}% · " + " | ".join(details))
     
     def installation_finished(self):
         self.downloading = False
         self.install_btn.setEnabled(True)
+        self.updates_btn.setEnabled(True)
         
         if self.installation_mode == "chocolatey":
             self.install_btn.setText("📦 Install via Chocolatey")
@@ -1652,150 +5818,1718 @@ class SpallerMainWindow(QMainWindow):
         self.pause_btn.setEnabled(False)
         self.progress_bar.setFormat("")
         self.update_selected_count()
+        if self.restart_summary:
+            QTimer.singleShot(0, self.offer_restart)
+    
+    def offer_restart(self):
+        """One restart prompt for every installer in the run that asked for one"""
+        event, self.restart_summary = self.restart_summary, None
+        if not event or not hasattr(self, 'installer'):
+            return
+        engine = self.installer.engine
+        names = "\n".join(f"• {name}" for name in event.restart_apps[:10])
+        if len(event.restart_apps) > 10:
+            names += f"\n• and {len(event.restart_apps) - 10} more"
+        after = (f"\n\n{event.waiting} application(s) will be installed after the restart."
+                 if event.waiting else "")
+        
+        if event.restart == "initiated":
+            QMessageBox.information(
+                self,
+                "Windows Is Restarting",
+                f"An installer is restarting Windows to finish:\n\n{names}{after}"
+            )
+            return
+        
+        reply = QMessageBox.question(
+            self,
+            "Restart Required",
+            f"These applications need Windows to restart to finish installing:\n\n{names}{after}\n\n"
+            f"Restart now? Windows restarts in {RESTART_DELAY} seconds; save your work first.",
+            QMessageBox.Yes | QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            self.status_label.setText("Restart Windows to finish the installation")
+            return
+        engine.continue_after_restart()
+        if not restart_windows():
+            QMessageBox.warning(self, "Restart Failed", "Windows could not be restarted. Please restart it manually.")
+
+    def cancel_installation(self):
+        """Cancel the current installation"""
+        if hasattr(self, 'installer') and self.installer.isRunning():
+            # The engine stops its downloads and installers; the thread's finished signal re-enables the window
+            self.installer.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.pause_btn.setEnabled(False)
+            self.status_label.setText("Cancelling...")
+            self.status_label.setStyleSheet("color: #fb8500; border: none;")
+
+    def pause_installation(self):
+        """Pause/Resume installation (placeholder for future implementation)"""
+        if hasattr(self, 'installer') and self.installer.isRunning():
+            # This is a placeholder - actual pause/resume would require more complex implementation
+            QMessageBox.information(self, "Pause Feature", "Pause/Resume functionality will be available in a future update.")
+    
+    def closeEvent(self, event):
+        self.pending_size_probes = {}
+        if self.size_probe_thread and self.size_probe_thread.isRunning():
+            self.size_probe_thread.stop()
+            self.size_probe_thread.wait(2000)
+        super().closeEvent(event)
+
+def concurrency_class(app_info, command, installation_mode):
+    """Return the concurrency class an installer command runs under
+    
+    Package managers and msiexec are always serialized; otherwise the catalog's
+    "concurrency" tag decides, and untagged installers run alone.
+    """
+    if installation_mode in SERIAL_CONCURRENCY_CLASSES:
+        return installation_mode
+    if command and command[0] == 'msiexec':
+        return "msi"
+    declared = app_info.get('concurrency')
+    return declared if declared in CONCURRENCY_CLASSES else "exclusive"
+
+class InstallScheduler:
+    """Admit installer executions by concurrency class, up to max_parallel at once
+    
+    "parallel" installs overlap with anything but an "exclusive" one. "msi" and
+    "chocolatey" installs run one at a time within their class but alongside
+    parallel ones. "exclusive" installs run alone, and while one is waiting no new
+    installs are admitted so it cannot be starved.
+    """
+    
+    def __init__(self, max_parallel=INSTALL_PARALLELISM):
+        self.max_parallel = max(1, max_parallel)
+        self.condition = threading.Condition()
+        self.running = collections.Counter()
+        self.exclusive_waiting = 0
+    
+    def admissible(self, concurrency):
+        active = sum(self.running.values())
+        if concurrency == "exclusive":
+            return active == 0
+        if self.running["exclusive"] or self.exclusive_waiting or active >= self.max_parallel:
+            return False
+        return concurrency not in SERIAL_CONCURRENCY_CLASSES or not self.running[concurrency]
+    
+    def acquire(self, concurrency):
+        with self.condition:
+            exclusive = concurrency == "exclusive"
+            self.exclusive_waiting += exclusive
+            try:
+                self.condition.wait_for(lambda: self.admissible(concurrency))
+            finally:
+                self.exclusive_waiting -= exclusive
+            self.running[concurrency] += 1
+    
+    def release(self, concurrency):
+        with self.condition:
+            self.running[concurrency] -= 1
+            self.condition.notify_all()
+
+class SessionPool:
+    """Hand out requests sessions so their keep-alive connections outlive a single run
+    
+    Sessions are not shared between threads at the same time: each worker takes one
+    for the app it is on and gives it back afterwards.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = []
+    
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return requests.Session()
+    
+    def release(self, session):
+        with self.lock:
+            self.idle.append(session)
+
+class InstallBackend(ABC):
+    """One way of installing an app, registered in INSTALL_BACKENDS
+    
+    capabilities declares what the backend can do: "upgrade" (move an installed
+    app to its latest version), "offline" (install from an offline bundle),
+    "checksums" (installers are verified against known digests), "dependencies"
+    (pulls in what the app needs) and "per-user" (installs without elevation).
+    supports() says whether a catalog entry has what the backend needs and
+    available() whether its tool is on this machine. install() runs on an engine
+    worker and explains a failure through engine.failure_reason or
+    engine.skip_reason, like the rest of the engine.
+    """
+    
+    name = ""
+    capabilities = frozenset()
+    
+    def supports(self, app_info):
+        return False
+    
+    def available(self, platform):
+        return True
+    
+    @abstractmethod
+    def install(self, engine, app_id, app_name, app_info):
+        """Install the app and return whether it succeeded"""
+
+class ChocolateyBackend(InstallBackend):
+    name = "chocolatey"
+    capabilities = frozenset({"upgrade", "offline", "checksums", "dependencies"})
+    
+    def supports(self, app_info):
+        return bool(app_info.get('chocolatey'))
+    
+    def available(self, platform):
+        return platform.find_chocolatey() is not None
+    
+    def install(self, engine, app_id, app_name, app_info):
+        return engine.install_via_chocolatey(app_info, app_name, app_id)
+
+class DirectDownloadBackend(InstallBackend):
+    """Download the vendor's installer and run it with the switches for its framework"""
+    name = "direct"
+    capabilities = frozenset({"upgrade", "offline", "checksums"})
+    
+    def supports(self, app_info):
+        return bool(installer_urls(app_info)) and not is_msi_entry(app_info)
+    
+    def install(self, engine, app_id, app_name, app_info):
+        return engine.install_via_direct_download(app_info, app_name, app_id)
+
+class MsiBackend(DirectDownloadBackend):
+    """Windows Installer packages only, downloaded like any installer and run through msiexec"""
+    name = "msi"
+    
+    def supports(self, app_info):
+        return bool(installer_urls(app_info)) and is_msi_entry(app_info)
 
-    def cancel_installation(self):
-        """Cancel the current installation"""
-        if hasattr(self, 'installer') and self.installer.isRunning():
-            self.installer.terminate()
-            self.installer.wait(3000)  # Wait up to 3 seconds
-            self.installation_finished()
-            self.status_label.setText("Installation cancelled by user")
-            self.status_label.setStyleSheet("color: #f85149; border: none;")
+class WingetBackend(InstallBackend):
+    name = "winget"
+    capabilities = frozenset({"upgrade", "checksums", "dependencies"})
+    
+    def supports(self, app_info):
+        return bool(app_info.get('winget'))
+    
+    def available(self, platform):
+        return platform.find_tool('winget') is not None
+    
+    def install(self, engine, app_id, app_name, app_info):
+        # winget install also upgrades a package that is already there
+        command = ['winget', 'install', '--id', app_info['winget'], '--exact', '--silent',
+                   '--disable-interactivity', '--accept-package-agreements', '--accept-source-agreements']
+        result = engine.execute(app_id, command, concurrency_class(app_info, command, "winget"))
+        if result.reason == "exited" and result.returncode in WINGET_NOTHING_TO_DO_CODES:
+            return True
+        return engine.installer_succeeded(app_id, app_info, result, "winget")
 
-    def pause_installation(self):
-        """Pause/Resume installation (placeholder for future implementation)"""
-        if hasattr(self, 'installer') and self.installer.isRunning():
-            # This is a placeholder - actual pause/resume would require more complex implementation
-            QMessageBox.information(self, "Pause Feature", "Pause/Resume functionality will be available in a future update.")
+class ScoopBackend(InstallBackend):
+    name = "scoop"
+    capabilities = frozenset({"upgrade", "checksums", "dependencies", "per-user"})
+    
+    def supports(self, app_info):
+        return bool(app_info.get('scoop'))
+    
+    def available(self, platform):
+        return platform.find_tool('scoop') is not None
+    
+    def install(self, engine, app_id, app_name, app_info):
+        command = ['scoop', 'update' if engine.action == "upgrade" else 'install', app_info['scoop']]
+        # scoop is a PowerShell shim, so it needs the shell to resolve it
+        result = engine.execute(app_id, command, concurrency_class(app_info, command, "scoop"), shell=True)
+        return engine.installer_succeeded(app_id, app_info, result, "scoop")
 
-class InstallationThread(QThread):
-    progress_updated = Signal(float, str, str, int)
+def is_msi_entry(app_info):
+    """Whether a catalog entry's installer is a Windows Installer package"""
+    installer = app_info.get('installer') or next(iter(installer_urls(app_info)), '')
+    return app_info.get('installer_type') == "msi" or installer.lower().endswith('.msi')
+
+INSTALL_BACKENDS = {backend.name: backend for backend in (  # name -> InstallBackend
+    ChocolateyBackend(), DirectDownloadBackend(), MsiBackend(), WingetBackend(), ScoopBackend())}
+
+def register_install_backend(backend):
+    """Make an InstallBackend available to every InstallEngine, replacing one with the same name"""
+    INSTALL_BACKENDS[backend.name] = backend
+    return backend
+
+class InstallEngine:
+    """Install a list of apps, publishing typed events on an InstallEventBus
     
-    def __init__(self, selected_apps, installation_mode="chocolatey"):
-        super().__init__()
-        self.selected_apps = selected_apps
+    Each app is downloaded and installed by one of max_parallel workers; the
+    InstallScheduler decides which installers may actually run at the same time.
+    Every app goes through the install backends that support it and are available,
+    best first by the install time and success rate recorded on this machine,
+    falling back to the next backend when one fails.
+    Apps known to ask for a restart go last, and restart requests are collected
+    into one for the whole run rather than failing the app.
+    The engine has no Qt dependency; the GUI, the command line and the telemetry
+    log are all just subscribers to its bus.
+    """
+    
+    def __init__(self, selected_apps, installation_mode="chocolatey", bundle=None, peer_cache=None, bus=None,
+                 lockfile=None, max_parallel=INSTALL_PARALLELISM, action="install", sessions=None,
+                 journal=None, run_id=None, platform=None):
+        self.restart_history = RestartHistory()
+        self.selected_apps = order_for_restarts(selected_apps, self.restart_history)  # [(app_id, {'name', 'info', ...})]
         self.installation_mode = installation_mode
+        self.action = action  # "install", or "upgrade" to move installed apps to the latest version
+        self.sessions = sessions or SessionPool()
+        self.journal = journal
+        self.run_id = run_id or uuid.uuid4().hex
+        self.resume = {}  # app id -> artifact and partial download recorded by an earlier attempt
+        self.bundle = bundle
+        self.peer_cache = peer_cache
+        self.bus = bus or InstallEventBus()
+        self.lockfile = lockfile or {}  # app id -> pinned installer digests
+        self.installer_cache = peer_cache.cache if peer_cache else InstallerCache()
+        self.supervisor = InstallerSupervisor()
+        self.platform = platform or PLATFORM
+        self.backend_stats = BackendStats()
+        self.backends_available = {}  # backend name -> whether its tool is on this machine
+        self.installer_types = InstallerTypeCache()
+        self.mirror_stats = MirrorStats()
+        self.installer_hashes = {}  # local installer path -> SHA-256
+        self.detectors = {}  # local installer path -> framework detected while downloading
+        self.scheduler = InstallScheduler(max_parallel)
+        self.local = threading.local()  # failure and skip reasons and the HTTP session of each worker
+        self.progress = ProgressCoalescer(self.publish_downloads)
+        self.current = {}  # app id -> (app name, index) for the apps being installed
+        self.unstarted = len(self.selected_apps)
+        self.restarts = {}  # app id -> restart its installer asked for
+        self.waiting = 0  # apps left for after the restart
+        self.restart_initiated = threading.Event()
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+    
+    @property
+    def failure_reason(self):
+        return getattr(self.local, 'failure_reason', "")
+    
+    @failure_reason.setter
+    def failure_reason(self, value):
+        self.local.failure_reason = value
+    
+    @property
+    def skip_reason(self):
+        return getattr(self.local, 'skip_reason', "")
+    
+    @skip_reason.setter
+    def skip_reason(self, value):
+        self.local.skip_reason = value
+    
+    @property
+    def restart(self):
+        return getattr(self.local, 'restart', "")
+    
+    @restart.setter
+    def restart(self, value):
+        self.local.restart = value
+    
+    def cancel(self):
+        """Skip the apps that have not started and stop the downloads and installers in flight
+        
+        Workers notice within a download block or a supervisor poll, so run()
+        returns soon afterwards with the stopped apps reported as skipped.
+        """
+        self.cancelled.set()
+        self.supervisor.cancel()
+    
+    def publish(self, event_type, app_id, *args, **kwargs):
+        app_name, index = self.current[app_id]
+        event = event_type(app_id, app_name, index, len(self.selected_apps), *args, **kwargs)
+        self.bus.publish(event)
+        if self.journal and event_type is not Downloading:
+            self.journal.record(self.run_id, event)
+    
+    def publish_downloads(self, batch):
+        for app_id, done, total, rate, eta in batch:
+            if app_id in self.current:
+                self.publish(Downloading, app_id, done, total, rate, eta)
     
     def run(self):
+        if self.journal:
+            self.journal.start_run(self.run_id, self.selected_apps, self.installation_mode, self.action)
+            self.resume = self.journal.resume_state(self.run_id)
+        self.progress.start()
+        try:
+            return self.install_all()
+        finally:
+            self.progress.stop()
+    
+    def install_all(self):
+        """Install every app and return the number that failed"""
+        total_apps = len(self.selected_apps)
+        counts = {Succeeded: 0, Failed: 0, Skipped: 0}
+        error = ""
+        
         try:
-            total_apps = len(self.selected_apps)
-            
             for i, (app_id, app_data) in enumerate(self.selected_apps):
-                app_name = app_data['name']
-                app_info = app_data['info']
-                
-                base_progress = (i / total_apps) * 100
-                
-                self.progress_updated.emit(
-                    base_progress,
-                    f"Installing ({i+1} of {total_apps})",
-                    app_name,
-                    total_apps
-                )
-                
-                try:
-                    if self.installation_mode == "chocolatey":
-                        success = self.install_via_chocolatey(app_info, app_name)
-                    else:
-                        success = self.install_via_direct_download(app_info, app_name)
-                    
-                    if success:
-                        self.progress_updated.emit(
-                            ((i + 1) / total_apps) * 100,
-                            f"Completed ({i+1} of {total_apps})",
-                            app_name,
-                            total_apps
-                        )
-                    else:
-                        self.progress_updated.emit(
-                            ((i + 1) / total_apps) * 100,
-                            f"Failed ({i+1} of {total_apps})",
-                            f"{app_name} - Installation failed",
-                            total_apps
-                        )
-                    
-                except Exception as e:
-                    self.progress_updated.emit(
-                        ((i + 1) / total_apps) * 100,
-                        f"Error ({i+1} of {total_apps})",
-                        f"{app_name} - {str(e)}",
-                        total_apps
-                    )
-                
-                # Small delay between installations
-                time.sleep(1)
-            
-            self.progress_updated.emit(100, "All installations completed!", "", 0)
+                self.bus.publish(Queued(app_id, app_data['name'], i, total_apps))
+            METRICS.queue_depth.inc(amount=total_apps)
             
+            workers = min(self.scheduler.max_parallel, total_apps) or 1
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="install") as executor:
+                for outcome in executor.map(self.install_app, range(total_apps), self.selected_apps):
+                    counts[outcome] += 1
         except Exception as e:
-            self.progress_updated.emit(0, f"Error: {str(e)}", "", 0)
+            error = str(e)
+        self.backend_stats.save()
+        
+        with self.lock:
+            restarts = dict(self.restarts)
+        restart = "initiated" if self.restart_initiated.is_set() else "required" if restarts else ""
+        restart_apps = [app_data['name'] for app_id, app_data in self.selected_apps if app_id in restarts]
+        self.bus.publish(RunFinished(total_apps, counts[Succeeded], counts[Failed], counts[Skipped], error,
+                                     restart, restart_apps, self.waiting))
+        if self.journal:
+            if self.cancelled.is_set() or error:
+                state = "cancelled"
+            else:
+                state = "restart" if self.waiting else "completed"
+            self.journal.finish_run(self.run_id, state)
+        return counts[Failed] + (1 if error else 0)
+    
+    def continue_after_restart(self):
+        """Have the apps left waiting for a restart install at the next logon"""
+        if not (self.waiting and self.journal):
+            return False
+        return schedule_resume_after_restart(self.run_id, self.journal.source)
+    
+    def install_app(self, index, entry):
+        """Download and install one app on a worker thread and return its outcome event type"""
+        app_id, app_data = entry
+        app_name = app_data['name']
+        app_info = app_data['info']
+        with self.lock:
+            self.current[app_id] = (app_name, index)
+            self.unstarted -= 1
+        METRICS.queue_depth.inc(amount=-1)
+        METRICS.installs_active.inc()
+        self.local.session = self.sessions.acquire()
+        
+        try:
+            if self.cancelled.is_set():
+                self.publish(Skipped, app_id, "Cancelled")
+                return Skipped
+            if self.restart_initiated.is_set():
+                # Windows is on its way down; anything started now would be cut off
+                with self.lock:
+                    self.waiting += 1
+                self.publish(Skipped, app_id, RESTART_WAIT_REASON)
+                return Skipped
+            
+            self.failure_reason = ""
+            self.skip_reason = ""
+            self.restart = ""
+            started = time.monotonic()
+            success, backend = self.install_with_backends(app_id, app_name, app_info)
+            
+            duration = time.monotonic() - started
+            if success:
+                outcome = Succeeded
+                self.publish(Succeeded, app_id, duration, self.restart, backend)
+            elif self.skip_reason:
+                outcome = Skipped
+                if self.skip_reason == RESTART_WAIT_REASON:
+                    with self.lock:
+                        self.waiting += 1
+                self.publish(Skipped, app_id, self.skip_reason)
+            else:
+                outcome = Failed
+                self.publish(Failed, app_id, self.failure_reason or "Installation failed", duration)
+                METRICS.install_failures.inc(failure_label(self.failure_reason))
+            METRICS.install_duration.observe(duration, outcome.kind)
+            return outcome
+        finally:
+            self.sessions.release(self.local.session)
+            METRICS.installs_active.inc(amount=-1)
+            with self.lock:
+                del self.current[app_id]
     
-    def install_via_chocolatey(self, app_info, app_name):
+    def candidate_backends(self, app_id, app_info):
+        """Return the backends that can install an app here, best first"""
+        candidates = []
+        for backend in INSTALL_BACKENDS.values():
+            if not backend.supports(app_info):
+                continue
+            if self.action == "upgrade" and "upgrade" not in backend.capabilities:
+                continue
+            if self.bundle and "offline" not in backend.capabilities:
+                continue
+            with self.lock:
+                available = self.backends_available.get(backend.name)
+            if available is None:
+                available = bool(backend.available(self.platform))
+                with self.lock:
+                    self.backends_available[backend.name] = available
+            if available:
+                candidates.append(backend)
+        return self.backend_stats.rank(app_id, candidates, PREFERRED_BACKENDS.get(self.installation_mode, ()))
+    
+    def install_with_backends(self, app_id, app_name, app_info):
+        """Install through the best backend, trying the next one after a failure; return (success, backend name)"""
+        backends = self.candidate_backends(app_id, app_info)
+        if not backends:
+            needed = [backend.name for backend in INSTALL_BACKENDS.values() if backend.supports(app_info)]
+            if needed:
+                self.failure_reason = f"No install backend available for this app (needs {' or '.join(needed)})"
+            elif self.installation_mode == "chocolatey":
+                self.failure_reason = "No Chocolatey package for this app"
+            else:
+                self.failure_reason = "No download URL for this app"
+            return False, ""
+        
+        reasons = []
+        for backend in backends:
+            self.failure_reason = ""
+            self.publish(Resolving, app_id, backend.name)
+            started = time.monotonic()
+            try:
+                success = backend.install(self, app_id, app_name, app_info)
+            except Exception as e:
+                success = False
+                self.failure_reason = str(e)
+            
+            if success or not self.skip_reason:
+                self.backend_stats.record(app_id, backend.name, success, time.monotonic() - started)
+                METRICS.backend_installs.inc(backend.name, "succeeded" if success else "failed")
+            if success or self.skip_reason:
+                return success, backend.name
+            reasons.append(f"{backend.name}: {self.failure_reason or 'Installation failed'}")
+            if self.cancelled.is_set() or self.restart_initiated.is_set():
+                break
+        
+        if len(reasons) > 1:
+            self.failure_reason = "; ".join(reasons)
+        return False, ""
+    
+    def execute(self, app_id, command, concurrency, **kwargs):
+        """Run an installer command once the scheduler admits its concurrency class"""
+        self.scheduler.acquire(concurrency)
+        try:
+            self.publish(Installing, app_id)
+            return self.platform.run_installer(self.supervisor, command, **kwargs)
+        finally:
+            self.scheduler.release(concurrency)
+    
+    def installer_succeeded(self, app_id, app_info, result, backend):
+        """Judge a finished installer, treating the backend's restart exit codes as success or a deferral"""
+        if result.reason == "cancelled":
+            self.skip_reason = "Cancelled"
+            return False
+        request = restart_request(result, backend, app_info)
+        if not request:
+            if not result.succeeded:
+                self.failure_reason = result.describe()
+            return result.succeeded
+        
+        METRICS.restart_requests.inc(request)
+        self.restart_history.record(app_id)
+        with self.lock:
+            self.restarts[app_id] = request
+            unstarted = self.unstarted
+        if request == "initiated":
+            self.restart_initiated.set()
+            if unstarted and self.journal:
+                # This process may not survive to the end of the run
+                schedule_resume_after_restart(self.run_id, self.journal.source)
+        if request == "deferred":
+            self.skip_reason = RESTART_WAIT_REASON
+            return False
+        self.restart = request
+        return True
+    
+    def install_via_chocolatey(self, app_info, app_name, app_id=None):
         """Install using Chocolatey command"""
         chocolatey_command = app_info.get('chocolatey', '')
         
-        if not chocolatey_command or chocolatey_command == "Built-in with Windows":
+        if chocolatey_command == "Built-in with Windows":
+            self.skip_reason = "Built in with Windows"
             return False
+        if not chocolatey_command:
+            self.failure_reason = "No Chocolatey package for this app"
+            return False
+        
+        command = chocolatey_command.split()
+        if self.action == "upgrade" and 'install' in command:
+            # choco upgrade also installs packages that are missing
+            command[command.index('install')] = 'upgrade'
+        if self.bundle:
+            # Air-gapped: resolve packages and dependencies from the bundle only
+            self.publish(Verifying, app_id)
+            if not self.bundle.packages_verified(app_id):
+                self.failure_reason = "Bundled packages are missing or do not match the manifest"
+                return False
+            command += ['--source', self.bundle.package_source()]
         
         try:
-            result = subprocess.run(
-                chocolatey_command.split(),
-                capture_output=True,
-                text=True,
-                timeout=600,  # 10 minutes timeout
-                shell=True
-            )
-            return result.returncode == 0
-        except subprocess.TimeoutExpired:
-            return False
+            result = self.execute(app_id, command, concurrency_class(app_info, command, "chocolatey"), shell=True)
+            return self.installer_succeeded(app_id, app_info, result, "chocolatey")
         except Exception:
             return False
     
-    def install_via_direct_download(self, app_info, app_name):
+    def install_via_direct_download(self, app_info, app_name, app_id=None):
         """Install using direct download"""
-        download_url = app_info.get('url', '')
-        installer_name = app_info.get('installer', f"{app_name.replace(' ', '_')}_installer.exe")
+        download_url = next(iter(installer_urls(app_info)), '')
+        
+        if self.bundle:
+            self.publish(Verifying, app_id)
+            download_path = self.bundle.installer_for(app_id)
+            if not download_path:
+                self.failure_reason = "Installer is missing from the bundle or does not match the manifest"
+        elif download_url:
+            download_path = self.obtain_installer(app_info, app_name, app_id)
+        else:
+            download_path = None
+            self.failure_reason = "No download URL for this app"
         
-        if not download_url:
+        if not download_path:
             return False
         
         try:
-            # Download the installer
-            download_path = os.path.join(os.path.expanduser("~"), "Downloads", installer_name)
-            
-            response = requests.get(download_url, timeout=300, stream=True)
-            response.raise_for_status()
+            framework = self.detect_installer_type(download_path)
+            command = build_installer_command(download_path, framework, app_info)
             
-            with open(download_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # For MSI the real work happens in the Windows Installer service
+            watch_names = ('msiexec.exe',) if command[0] == 'msiexec' else ()
+            result = self.execute(app_id, command, concurrency_class(app_info, command, "direct"),
+                                  watch_names=watch_names)
+            return self.installer_succeeded(app_id, app_info, result, "msi" if command[0] == 'msiexec' else "direct")
             
-            # Run the installer
-            if download_path.endswith('.msi'):
-                # MSI installer
-                result = subprocess.run([
-                    'msiexec', '/i', download_path, '/quiet', '/norestart'
-                ], capture_output=True, timeout=600)
+        except Exception:
+            return False
+    
+    def detect_installer_type(self, path):
+        """Return the framework for an installer, using the hash-keyed cache when possible"""
+        sha256 = self.installer_hashes.get(path)
+        framework = self.installer_types.get(sha256) if sha256 else None
+        if not framework:
+            framework = self.detectors.pop(path, None) or InstallerDetector.detect_file(path)
+            if sha256:
+                self.installer_types.put(sha256, framework)
+        return framework
+    
+    def obtain_installer(self, app_info, app_name, app_id=None):
+        """Return a local installer path from the cache, a LAN peer or the origin URL"""
+        download_url = installer_urls(app_info)[0]
+        installer_name = app_info.get('installer', f"{app_name.replace(' ', '_')}_installer.exe")
+        expected = expected_digests(app_info, self.lockfile.get(app_id))
+        resume = self.resume.get(app_id, {})
+        
+        if expected.get('sha256'):
+            sha256 = expected['sha256']
+        elif resume.get('sha256'):
+            sha256 = resume['sha256']  # Downloaded before this run was interrupted
+        elif self.action == "upgrade":
+            sha256 = None  # "latest" URLs may serve a newer release than the one cached
+        else:
+            sha256, _ = self.installer_cache.lookup_url(download_url)
+        cached_path = self.installer_cache.get(sha256) if sha256 else None
+        if cached_path and not digest_mismatches(expected, self.installer_cache.digests(sha256)):
+            METRICS.cache_requests.inc("hit")
+            self.installer_hashes[cached_path] = sha256
+            return cached_path
+        METRICS.cache_requests.inc("miss")
+        
+        download_path = os.path.join(get_download_dir(), installer_name)
+        progress_key = app_id or app_name
+        
+        def report(done, total):
+            if self.cancelled.is_set():
+                raise InstallCancelledError("Cancelled")
+            self.progress.update(progress_key, done, total)
+        
+        detector = InstallerDetector()
+        
+        # Peers are only asked for a hash this machine already trusts, never one they advertise
+        trusted_sha256 = sha256
+        try:
+            sha256 = None
+            if self.peer_cache and trusted_sha256:
+                sha256 = self.peer_cache.fetch(download_url, download_path, trusted_sha256, report,
+                                               observers=[detector.feed])
+            elif self.peer_cache:
+                print(f"Peer cache skipped for {app_name}: no catalog or lockfile SHA-256 pins it, "
+                      f"downloading from the origin")
+            if sha256:
+                # The peer transfer was verified by SHA-256; other pinned digests need a pass
+                digests = file_digests(download_path, expected) if set(expected) - {'sha256'} else {'sha256': sha256}
             else:
-                # EXE installer
-                result = subprocess.run([
-                    download_path, '/S', '/silent', '/quiet'
-                ], capture_output=True, timeout=600)
+                detector = InstallerDetector()
+                hasher = StreamingHasher(expected)
+                urls = installer_urls(app_info)
+                fsync_policy = DEFAULT_FSYNC_POLICY
+                journal_sync = record_source = None
+                if self.journal:
+                    # Only bytes known to be on disk are journaled, so a resume never continues past a gap
+                    fsync_policy = "interval"
+                    journal_sync = lambda done: self.journal.record_progress(self.run_id, app_id, done)
+                    record_source = lambda url, response: self.journal.begin_partial(
+                        self.run_id, app_id, download_path, url, resume_validator(response))
+                
+                self.installer_cache.begin(download_url)
+                try:
+                    offset = 0
+                    if (resume.get('partial') == download_path and resume.get('partial_url') in urls
+                            and resume.get('partial_validator') and os.path.isfile(download_path)):
+                        offset = min(resume['partial_bytes'], os.path.getsize(download_path))
+                    if offset:
+                        # Pick up the download an interrupted run left behind, re-hashing only its prefix
+                        feed_file_prefix(download_path, offset, [detector.feed, hasher.feed])
+                        try:
+                            resume_download(resume['partial_url'], download_path, offset, resume['partial_validator'],
+                                            session=self.local.session, fsync_policy=fsync_policy,
+                                            progress_callback=report, observers=[detector.feed, hasher.feed],
+                                            sync_callback=journal_sync)
+                        except (ResumeRejectedError, IncompleteDownloadError, requests.RequestException, OSError) as e:
+                            print(f"Downloading {app_name} again from the start: {e}")
+                            if isinstance(e, ResumeRejectedError):
+                                os.remove(download_path)
+                            offset = 0
+                            detector = InstallerDetector()
+                            hasher = StreamingHasher(expected)
+                    
+                    if not offset and len(urls) > 1:
+                        MirrorDownloader(session=self.local.session, stats=self.mirror_stats,
+                                         fsync_policy=fsync_policy).download(
+                            urls, download_path, progress_callback=report,
+                            observers=[detector.feed, hasher.feed], validate=True, installer_name=installer_name,
+                            sync_callback=journal_sync, response_callback=record_source)
+                    elif not offset:
+                        download_file(download_url, download_path, session=self.local.session,
+                                      fsync_policy=fsync_policy, progress_callback=report,
+                                      observers=[detector.feed, hasher.feed], validate=True,
+                                      installer_name=installer_name, sync_callback=journal_sync,
+                                      response_callback=record_source)
+                finally:
+                    self.installer_cache.end(download_url)
+                # Deliver the final byte count before announcing verification
+                self.progress.finish(progress_key)
+                self.progress.flush()
+                if app_id in self.current:
+                    self.publish(Verifying, app_id)
+                digests = hasher.hexdigests()
+                sha256 = digests['sha256']
             
-            # Clean up downloaded file
+            mismatched = digest_mismatches(expected, digests)
+            if mismatched:
+                quarantine_file(download_path, download_url, expected, digests)
+                self.failure_reason = (f"Downloaded installer does not match the pinned {'/'.join(mismatched)} "
+                                       f"checksum; moved to quarantine")
+                return None
+        except InstallCancelledError:
+            # The partial file stays behind for 'resume'
+            self.skip_reason = "Cancelled"
+            return None
+        except ContentValidationError as e:
+            self.failure_reason = str(e)
+            return None
+        except Exception as e:
+            self.failure_reason = f"Download failed: {e}"
+            return None
+        finally:
+            self.progress.finish(progress_key)
+        
+        cached_path = self.installer_cache.add(download_path, download_url, sha256, digests)
+        self.installer_hashes[cached_path] = sha256
+        if self.journal:
+            self.journal.record_artifact(self.run_id, app_id, cached_path, sha256)
+        if detector.scanned or detector.result:
+            # The detector saw every block (or found a marker), so its answer is final
+            self.detectors[cached_path] = detector.finish()
+        return cached_path
+
+class InstallationThread(QThread):
+    """Run an InstallEngine off the GUI thread and forward its events as Qt signals"""
+    
+    events = Signal(list)
+    
+    def __init__(self, selected_apps, installation_mode="chocolatey", bundle=None, peer_cache=None, lockfile=None,
+                 run_id=None, action="install"):
+        super().__init__()
+        self.bus = InstallEventBus()
+        self.engine = InstallEngine(selected_apps, installation_mode, bundle, peer_cache, self.bus, lockfile,
+                                    action=action, journal=open_journal("gui"), run_id=run_id)
+        self.bus.subscribe(self.events.emit)
+        JsonlEventLog(run_id=self.engine.run_id).attach(self.bus)
+    
+    def cancel(self):
+        self.engine.cancel()
+    
+    def run(self):
+        try:
+            self.engine.run()
+        finally:
+            self.bus.close()
+
+def load_agent_token(create=False):
+    """Return the agent token kept in the state directory, generating it first if asked"""
+    path = os.path.join(get_state_dir(), AGENT_TOKEN_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+    if not create:
+        return None
+    
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    return token
+
+class AgentJob:
+    """One queued install or upgrade request and everything the agent has seen of it"""
+    
+    def __init__(self, selected_apps, method, action, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.selected_apps = selected_apps
+        self.method = method
+        self.action = action
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = ""
+        self.engine = None
+        self.cancelled = False
+        self.check_outdated = False
+        self.events = []  # lifecycle events as dicts, in order
+        self.progress = {}  # app id -> latest Downloading event as a dict
+        self.sequence = 0  # bumped on every change so streaming clients can wait for news
+        self.condition = threading.Condition()
+    
+    @property
+    def done(self):
+        return self.state in ("succeeded", "failed", "cancelled")
+    
+    def record(self, batch):
+        """Event bus handler: keep lifecycle events and the latest progress per app"""
+        with self.condition:
+            for event in batch:
+                if isinstance(event, Downloading):
+                    self.progress[event.app_id] = event.to_dict()
+                else:
+                    self.events.append(event.to_dict())
+                    self.progress.pop(event.app_id, None)
+            self.sequence += 1
+            self.condition.notify_all()
+    
+    def set_state(self, state, error=""):
+        with self.condition:
+            self.state = state
+            self.error = error or self.error
+            if state == "running":
+                self.started = time.time()
+            elif self.done:
+                self.finished = time.time()
+                self.progress = {}
+            self.sequence += 1
+            self.condition.notify_all()
+    
+    def status(self):
+        with self.condition:
+            apps = {app_id: {'app_id': app_id, 'app': app_data['name'], 'state': "queued"}
+                    for app_id, app_data in self.selected_apps}
+            for app_id, app_data in self.selected_apps:
+                if app_data.get('upgrade'):
+                    apps[app_id]['upgrade'] = app_data['upgrade']
+            summary = None
+            for event in self.events:
+                if event['event'] == "finished":
+                    summary = {key: event[key] for key in ('succeeded', 'failed', 'skipped', 'restart',
+                                                           'restart_apps', 'waiting')}
+                elif event['app_id'] in apps:
+                    apps[event['app_id']]['state'] = event['event']
+                    if event.get('reason'):
+                        apps[event['app_id']]['reason'] = event['reason']
+                    if event.get('backend'):
+                        apps[event['app_id']]['backend'] = event['backend']
+            for app_id, progress in self.progress.items():
+                apps[app_id]['download'] = {key: progress[key] for key in ('done', 'size', 'rate', 'eta')}
+            return {'id': self.id, 'state': self.state, 'method': self.method, 'action': self.action,
+                    'created': self.created, 'started': self.started, 'finished': self.finished,
+                    'error': self.error, 'summary': summary, 'apps': list(apps.values())}
+
+class SpallerAgent:
+    """Long-running installer service driven through a local HTTP/JSON API
+    
+    Catalogs are loaded once and HTTP sessions stay open between jobs, so a job
+    only pays for its own downloads and installs. Jobs run one at a time in the
+    order they were submitted; apps within a job still install in parallel.
+    """
+    
+    def __init__(self, port=AGENT_PORT, bind="127.0.0.1", token=None, bundle=None, peer_cache=None,
+                 lockfile=None, max_parallel=INSTALL_PARALLELISM):
+        self.port = port
+        self.bind = bind
+        self.token = token or load_agent_token(create=True)  # Always required, even on loopback
+        self.bundle = bundle
+        self.peer_cache = peer_cache
+        self.lockfile = lockfile or {}
+        self.max_parallel = max_parallel
+        self.sessions = SessionPool()
+        self.journal = open_journal("agent")
+        self.catalogs = {}
+        self.catalogs_loaded = None
+        self.jobs = collections.OrderedDict()  # job id -> AgentJob, oldest first
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.started = time.time()
+        self.server = None
+    
+    def load_catalogs(self):
+        """(Re)load both catalogs from the bundle or the network"""
+        if self.bundle:
+            catalogs = {mode: read_json_file(self.bundle.catalog_path(mode)) or {} for mode in CATALOG_URLS}
+        else:
+            catalogs = fetch_catalogs()
+        with self.condition:
+            self.catalogs = catalogs
+            self.catalogs_loaded = time.time()
+        return catalogs
+    
+    def start(self):
+        self.load_catalogs()
+        self.requeue_interrupted()
+        self.server = ThreadingHTTPServer((self.bind, self.port), AgentRequestHandler)
+        self.server.daemon_threads = True
+        self.server.agent = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="agent-server", daemon=True).start()
+        threading.Thread(target=self.run_jobs, name="agent-jobs", daemon=True).start()
+        return self
+    
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+            running = [job for job in self.jobs.values() if job.engine and not job.done]
+        for job in running:
+            job.engine.cancel()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+    
+    def submit(self, selectors, method="chocolatey", action="install"):
+        """Queue a job for the apps matching selectors; raises ValueError for a bad request"""
+        if method not in CATALOG_URLS:
+            raise ValueError(f"Unknown method '{method}'")
+        if action not in ("install", "upgrade"):
+            raise ValueError(f"Unknown action '{action}'")
+        with self.condition:
+            catalog = self.catalogs.get(method) or {}
+        if not selectors and action == "upgrade":
+            app_ids = [f"{category}:{app_name}" for category, apps in catalog.items() for app_name in apps]
+        else:
+            app_ids = resolve_app_selection(catalog, selectors)
+        if not app_ids:
+            raise ValueError("Nothing selected")
+        
+        selected_apps = catalog_selection(catalog, app_ids)
+        
+        job = AgentJob(selected_apps, method, action)
+        # Narrowed to the outdated apps when the job starts, with one 'choco outdated'
+        job.check_outdated = action == "upgrade" and method == "chocolatey"
+        with self.condition:
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            finished = [job_id for job_id, old in self.jobs.items() if old.done]
+            for job_id in finished[:max(0, len(self.jobs) - AGENT_JOB_HISTORY)]:
+                del self.jobs[job_id]
+            self.condition.notify_all()
+        return job
+    
+    def requeue_interrupted(self):
+        """Queue the unfinished part of jobs cut short by a crash or reboot, under their old ids"""
+        for run in reversed(self.journal.resumable_runs() if self.journal else []):
+            if run['state'] not in ("interrupted", "waiting for a restart"):
+                continue
+            job = AgentJob(run['remaining'], run['method'], run['action'], run['id'])
+            with self.condition:
+                self.jobs[job.id] = job
+                self.queue.append(job)
+            print(f"Resuming job {job.id}: {len(run['remaining'])} of {run['total']} apps left")
+    
+    def cancel(self, job):
+        """Drop a queued job, or skip the remaining apps of a running one"""
+        with self.condition:
+            job.cancelled = True
+            if job in self.queue:
+                self.queue.remove(job)
+                self.finish_cancelled(job)
+            elif job.engine:
+                job.engine.cancel()
+    
+    def run_jobs(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                while not self.queue and not self.stop_event.is_set():
+                    self.condition.wait()
+                if self.stop_event.is_set():
+                    return
+                job = self.queue.popleft()
+            self.run_job(job)
+    
+    def finish_cancelled(self, job):
+        job.set_state("cancelled")
+        if self.journal:
+            self.journal.finish_run(job.id, "cancelled")
+    
+    def run_job(self, job):
+        with self.condition:
+            cancelled = job.cancelled
+        if cancelled:
+            self.finish_cancelled(job)
+            return
+        if job.method == "chocolatey" and not check_chocolatey_installed():
+            job.set_state("failed", "Chocolatey is not installed")
+            return
+        if job.check_outdated:
             try:
-                os.remove(download_path)
-            except:
-                pass
-            
-            return result.returncode == 0
-            
-        except Exception:
+                outdated = query_outdated_packages(self.bundle.package_source() if self.bundle else None)
+            except RuntimeError as e:
+                job.set_state("failed", str(e))
+                return
+            with job.condition:
+                job.selected_apps, _ = plan_upgrades(job.selected_apps, outdated)
+        
+        bus = InstallEventBus()
+        bus.subscribe(job.record)
+        JsonlEventLog(run_id=job.id).attach(bus)
+        engine = InstallEngine(job.selected_apps, job.method, self.bundle, self.peer_cache, bus,
+                               self.lockfile, self.max_parallel, job.action, self.sessions,
+                               self.journal, job.id)
+        # cancel() looks for job.engine under the same lock, so a cancel that arrived while the
+        # job was being prepared is seen here and a later one reaches the engine
+        with self.condition:
+            if not job.cancelled:
+                job.engine = engine
+        if not job.engine:
+            bus.close()
+            self.finish_cancelled(job)
+            return
+        job.set_state("running")
+        try:
+            failed = job.engine.run()
+        except Exception as e:
+            failed, job.error = 1, str(e)
+        finally:
+            bus.close()
+        job.set_state("cancelled" if job.cancelled else "failed" if failed else "succeeded")
+    
+    def health(self):
+        with self.condition:
+            return {'state': "stopping" if self.stop_event.is_set() else "ready",
+                    'uptime': time.time() - self.started, 'catalogs_loaded': self.catalogs_loaded,
+                    'apps': {mode: sum(len(apps) for apps in catalog.values())
+                             for mode, catalog in self.catalogs.items()},
+                    'queued': len(self.queue),
+                    'running': [job.id for job in self.jobs.values() if job.state == "running"]}
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON front end of a SpallerAgent
+    
+    GET  /v1/health                  agent state and catalog sizes
+    POST /v1/catalogs/reload         fetch the catalogs again
+    GET  /v1/jobs                    every known job
+    POST /v1/jobs                    {"apps": [...], "method": "direct", "action": "install"}
+                                     (an "upgrade" job without apps covers every outdated catalog app)
+    GET  /v1/jobs/<id>               one job with per-app state and download progress
+    GET  /v1/jobs/<id>/events        newline-delimited JSON events, streamed until the job ends
+    POST /v1/jobs/<id>/cancel        drop a queued job or stop a running one
+    """
+    
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        if not self.authorized():
+            return
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip('/').split('/')
+        agent = self.server.agent
+        
+        if parts == ['v1', 'health']:
+            self.send_json(200, agent.health())
+        elif parts == ['v1', 'jobs']:
+            with agent.condition:
+                jobs = list(agent.jobs.values())
+            self.send_json(200, {'jobs': [job.status() for job in jobs]})
+        elif len(parts) == 3 and parts[:2] == ['v1', 'jobs']:
+            job = self.find_job(parts[2])
+            if job:
+                self.send_json(200, job.status())
+        elif len(parts) == 4 and parts[:2] == ['v1', 'jobs'] and parts[3] == 'events':
+            job = self.find_job(parts[2])
+            if job:
+                since = parse_qs(parsed.query).get('since', ['0'])[0]
+                self.stream_events(job, int(since) if since.isdigit() else 0)
+        else:
+            self.send_json(404, {'error': "not found"})
+    
+    def do_POST(self):
+        if not self.authorized():
+            return
+        parts = urlparse(self.path).path.strip('/').split('/')
+        agent = self.server.agent
+        
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != "application/json":
+            self.send_json(415, {'error': "request body must be application/json"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as e:
+            self.send_json(400, {'error': f"Invalid JSON: {e}"})
+            return
+        
+        if parts == ['v1', 'jobs']:
+            try:
+                job = agent.submit(body.get('apps') or [], body.get('method', "chocolatey"),
+                                   body.get('action', "install"))
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            self.send_json(202, job.status())
+        elif len(parts) == 4 and parts[:2] == ['v1', 'jobs'] and parts[3] == 'cancel':
+            job = self.find_job(parts[2])
+            if job:
+                agent.cancel(job)
+                self.send_json(200, job.status())
+        elif parts == ['v1', 'catalogs', 'reload']:
+            try:
+                agent.load_catalogs()
+            except Exception as e:
+                self.send_json(502, {'error': f"Could not load catalogs: {e}"})
+                return
+            self.send_json(200, agent.health())
+        else:
+            self.send_json(404, {'error': "not found"})
+    
+    def authorized(self):
+        """Check the bearer token, and turn away browsers and DNS-rebound host names"""
+        if self.headers.get('Origin') is not None:
+            self.send_json(403, {'error': "cross-origin requests are not accepted"})
+            return False
+        host = urlparse(f"//{self.headers.get('Host', '')}").hostname or ""
+        if host not in AGENT_LOOPBACK_HOSTS | {self.connection.getsockname()[0]}:
+            self.send_json(403, {'error': f"unexpected Host '{host}'"})
             return False
+        expected = f"Bearer {self.server.agent.token}".encode('utf-8')
+        if not hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'), expected):
+            self.send_json(401, {'error': "missing or wrong bearer token"})
+            return False
+        return True
+    
+    def find_job(self, job_id):
+        with self.server.agent.condition:
+            job = self.server.agent.jobs.get(job_id)
+        if not job:
+            self.send_json(404, {'error': f"no job {job_id}"})
+        return job
+    
+    def stream_events(self, job, since=0):
+        """Write events as JSON lines while the job runs; the connection closes when it is done
+        
+        Lifecycle events are numbered by their position, so a client that reconnects
+        with ?since=N only gets what it missed. Download progress is sent as it changes.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        
+        sent = since
+        sent_progress = {}
+        sequence = -1
+        try:
+            while True:
+                with job.condition:
+                    job.condition.wait_for(lambda: job.sequence != sequence, timeout=AGENT_HEARTBEAT_INTERVAL)
+                    sequence = job.sequence
+                    events = job.events[sent:]
+                    progress = [event for app_id, event in job.progress.items()
+                                if sent_progress.get(app_id) != event['time']]
+                    done, state = job.done, job.state
+                
+                lines = []
+                for offset, event in enumerate(events):
+                    lines.append(dict(event, seq=sent + offset))
+                for event in progress:
+                    sent_progress[event['app_id']] = event['time']
+                    lines.append(event)
+                lines.sort(key=lambda line: line['time'])
+                if done:
+                    lines.append({'event': "job", 'id': job.id, 'state': state})
+                elif not lines:
+                    lines.append({'event': "heartbeat", 'time': time.time()})
+                self.wfile.write("".join(json.dumps(line) + "\n" for line in lines).encode('utf-8'))
+                self.wfile.flush()
+                sent += len(events)
+                if done:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+    
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class AgentClient:
+    """Minimal client for a SpallerAgent, used by the 'job' command"""
+    
+    def __init__(self, url, token=None, timeout=30):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        self.timeout = timeout
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+    
+    def request(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.url}{path}", timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('error', response.text)
+            except ValueError:
+                message = response.text
+            raise ValueError(f"Agent returned {response.status_code}: {message}")
+        return response.json()
+    
+    def health(self):
+        return self.request('GET', "/v1/health")
+    
+    def submit(self, apps, method="chocolatey", action="install"):
+        return self.request('POST', "/v1/jobs", json={'apps': apps, 'method': method, 'action': action})
+    
+    def job(self, job_id):
+        return self.request('GET', f"/v1/jobs/{job_id}")
+    
+    def jobs(self):
+        return self.request('GET', "/v1/jobs")['jobs']
+    
+    def cancel(self, job_id):
+        return self.request('POST', f"/v1/jobs/{job_id}/cancel", json={})
+    
+    def events(self, job_id, since=0):
+        """Yield event dicts until the job ends"""
+        with self.session.get(f"{self.url}/v1/jobs/{job_id}/events", params={'since': since}, stream=True,
+                              timeout=(self.timeout, AGENT_HEARTBEAT_INTERVAL * 2)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+def fetch_catalogs():
+    """Download both catalogs for command-line use"""
+    catalogs = {}
+    for mode, url in CATALOG_URLS.items():
+        started = time.monotonic()
+        response = requests.get(url, timeout=15)
+        response.raise_for_status()
+        catalogs[mode] = response.json()
+        METRICS.catalog_fetch_seconds.observe(time.monotonic() - started, mode)
+    return catalogs
+
+def run_bundle_command(args):
+    """Build an offline bundle for a selection or profile"""
+    catalogs = fetch_catalogs()
+    merged = {}
+    for catalog in catalogs.values():
+        for category, apps in catalog.items():
+            merged.setdefault(category, {}).update(apps)
+    
+    selectors = list(args.apps or [])
+    if args.profile:
+        selectors.extend(load_profile(args.profile))
+    if not selectors:
+        print("Nothing selected: pass --apps and/or --profile")
+        return 2
+    
+    app_ids = resolve_app_selection(merged, selectors)
+    print(f"Bundling {len(app_ids)} application(s) into {args.output}")
+    
+    manifest = BundleBuilder(args.output, catalogs, app_ids).build()
+    failed = [app_id for app_id, entry in manifest['apps'].items() if 'error' in entry]
+    total_size = sum(entry['size'] for entry in manifest['files'].values())
+    
+    if args.archive:
+        archive_path = shutil.make_archive(os.path.abspath(args.output), 'zip', args.output)
+        print(f"Archive written to {archive_path}")
+    
+    print(f"{len(manifest['files'])} files, {total_size / BYTES_PER_MB:.0f} MB"
+          + (f", {len(failed)} app(s) failed: {', '.join(failed)}" if failed else ""))
+    return 1 if failed else 0
+
+def run_install_command(args, peer_cache=None):
+    """Install apps without the GUI, printing progress events to the terminal"""
+    bundle = OfflineBundle(args.offline) if args.offline else None
+    if bundle:
+        catalog = read_json_file(bundle.catalog_path(args.method)) or {}
+    else:
+        catalog = fetch_catalogs()[args.method]
+    
+    selectors = list(args.apps or [])
+    if args.profile:
+        selectors.extend(load_profile(args.profile))
+    if not selectors:
+        print("Nothing selected: pass --apps and/or --profile")
+        return 2
+    try:
+        app_ids = resolve_app_selection(catalog, selectors)
+    except ValueError as e:
+        print(e)
+        return 2
+    
+    if args.method == "chocolatey" and not check_chocolatey_installed():
+        print("Chocolatey is not installed: install it or use --method direct")
+        return 2
+    
+    selected_apps = catalog_selection(catalog, app_ids)
+    
+    try:
+        lockfile = load_lockfile(args.lockfile)
+    except ValueError as e:
+        print(e)
+        return 2
+    
+    return run_engine_in_terminal(selected_apps, args.method, bundle, peer_cache, lockfile, args.parallel,
+                                  restart_policy=args.restart)
+
+def run_upgrade_command(args, peer_cache=None):
+    """Upgrade the catalog apps that one batched 'choco outdated' reports as behind"""
+    bundle = OfflineBundle(args.offline) if args.offline else None
+    if bundle:
+        catalog = read_json_file(bundle.catalog_path("chocolatey")) or {}
+    else:
+        catalog = fetch_catalogs()["chocolatey"]
+    
+    selectors = list(args.apps or [])
+    if args.profile:
+        selectors.extend(load_profile(args.profile))
+    try:
+        if selectors:
+            app_ids = resolve_app_selection(catalog, selectors)
+        else:
+            app_ids = [f"{category}:{app_name}" for category, apps in catalog.items() for app_name in apps]
+        lockfile = load_lockfile(args.lockfile)
+    except ValueError as e:
+        print(e)
+        return 2
+    
+    print("Checking installed packages for newer versions...")
+    started = time.monotonic()
+    try:
+        outdated = query_outdated_packages(bundle.package_source() if bundle else None)
+    except RuntimeError as e:
+        print(e)
+        return 2
+    plan, others = plan_upgrades(catalog_selection(catalog, app_ids), outdated)
+    
+    print(f"{len(plan)} app(s) to upgrade, checked in {format_duration(time.monotonic() - started)}")
+    for line in format_upgrade_plan(plan):
+        print(f"  {line}")
+    if others and not selectors:
+        print(f"Not in the catalog, left alone: {', '.join(others)}")
+    if not plan or args.dry_run:
+        return 0
+    return run_engine_in_terminal(plan, "chocolatey", bundle, peer_cache, lockfile, args.parallel, "upgrade",
+                                  restart_policy=args.restart)
+
+def run_engine_in_terminal(selected_apps, method, bundle=None, peer_cache=None, lockfile=None,
+                           max_parallel=INSTALL_PARALLELISM, action="install", run_id=None, restart_policy="ask"):
+    """Run an InstallEngine with terminal output, journaled so 'resume' can continue it"""
+    bus = InstallEventBus()
+    CliEventRenderer().attach(bus)
+    journal = open_journal("cli")
+    engine = InstallEngine(selected_apps, method, bundle, peer_cache, bus, lockfile, max_parallel, action,
+                           journal=journal, run_id=run_id)
+    JsonlEventLog(run_id=engine.run_id).attach(bus)
+    try:
+        failed = engine.run()
+    except KeyboardInterrupt:
+        engine.cancel()
+        if journal:
+            journal.finish_run(engine.run_id, "cancelled")
+        print(f"\nInterrupted; continue later with: Spaller resume --run {engine.run_id}")
+        return 130
+    finally:
+        bus.close()
+    
+    if engine.restarts and not engine.restart_initiated.is_set():
+        finish_with_restart(engine, restart_policy)
+    elif engine.restart_initiated.is_set():
+        print("An installer is restarting Windows" + ("; the rest of the run continues after the restart"
+                                                       if engine.waiting else ""))
+    return 1 if failed else 0
+
+def finish_with_restart(engine, policy):
+    """Handle the single restart a run asked for: "auto" restarts, "ask" asks on a terminal, "never" only reports"""
+    if policy == "ask" and sys.stdin.isatty():
+        answer = input(f"Restart Windows now (in {RESTART_DELAY} seconds)? [y/N] ")
+        policy = "auto" if answer.strip().lower() in ("y", "yes") else "never"
+    
+    if policy == "auto":
+        scheduled = engine.continue_after_restart()
+        if restart_windows():
+            print(f"Restarting Windows in {RESTART_DELAY} seconds"
+                  + ("; the run continues after the restart" if scheduled else ""))
+            return
+        print("Could not restart Windows; restart it manually")
+    elif engine.waiting:
+        print(f"Restart Windows, then continue with: Spaller resume --run {engine.run_id}")
+    else:
+        print("Restart Windows to finish the installation")
+
+def run_resume_command(args, peer_cache=None):
+    """List or continue command-line runs that were interrupted or cancelled"""
+    journal = open_journal("cli")
+    runs = journal.resumable_runs() if journal else []
+    if args.list or not runs:
+        for run in runs:
+            print(f"{run['id']}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created']))}  "
+                  f"{run['method']} {run['action']}, {run['state']}: "
+                  f"{len(run['remaining'])} of {run['total']} apps left")
+        if not runs:
+            print("Nothing to resume")
+        return 0
+    
+    run = next((run for run in runs if run['id'] == args.run), None) if args.run else runs[0]
+    if not run:
+        print(f"No resumable run {args.run}")
+        return 2
+    if not is_admin():
+        # Installers need elevation; continue in an elevated copy of this command instead
+        if run_as_admin():
+            print("Continuing the run in an elevated window")
+            return 0
+        print("Resuming needs administrator rights: run this from an elevated prompt")
+        return 1
+    if run['method'] == "chocolatey" and not check_chocolatey_installed():
+        print("Chocolatey is not installed: install it or use --method direct")
+        return 2
+    try:
+        lockfile = load_lockfile(args.lockfile)
+    except ValueError as e:
+        print(e)
+        return 2
+    
+    print(f"Resuming run {run['id']}: {len(run['remaining'])} of {run['total']} apps left")
+    bundle = OfflineBundle(args.offline) if args.offline else None
+    return run_engine_in_terminal(run['remaining'], run['method'], bundle, peer_cache, lockfile, args.parallel,
+                                  run['action'], run['id'], args.restart)
+
+def run_agent_command(args, peer_cache=None):
+    """Serve the job API until interrupted"""
+    bundle = OfflineBundle(args.offline) if args.offline else None
+    try:
+        lockfile = load_lockfile(args.lockfile)
+    except ValueError as e:
+        print(e)
+        return 2
+    
+    agent = SpallerAgent(args.port, args.bind, args.token, bundle, peer_cache, lockfile, args.parallel)
+    try:
+        agent.start()
+    except Exception as e:
+        print(f"Could not start the agent: {e}")
+        return 1
+    print(f"Agent listening on http://{agent.bind}:{agent.port}/v1/ "
+          f"({sum(agent.health()['apps'].values())} apps in the catalogs)")
+    if not args.token:
+        print(f"Clients must send the bearer token in {os.path.join(get_state_dir(), AGENT_TOKEN_FILE)}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        agent.stop()
+    return 0
+
+def run_job_command(args):
+    """Send a job to a running agent and optionally follow it to the end"""
+    selectors = list(args.apps or [])
+    if args.profile:
+        selectors.extend(load_profile(args.profile))
+    if not selectors and args.action != "upgrade":
+        print("Nothing selected: pass --apps and/or --profile")
+        return 2
+    
+    client = AgentClient(args.agent, args.token or load_agent_token())
+    try:
+        job = client.submit(selectors, args.method, args.action)
+        print(f"Job {job['id']} queued with {len(job['apps'])} app(s)")
+        if not args.follow:
+            return 0
+        for event in client.events(job['id']):
+            if event['event'] == "job":
+                print(f"Job {job['id']} {event['state']}")
+                return 0 if event['state'] == "succeeded" else 1
+            if event['event'] in LIFECYCLE_EVENTS and event['event'] != "finished":
+                reason = f" - {event['reason']}" if event.get('reason') else ""
+                if event.get('backend'):
+                    reason = f" via {event['backend']}"
+                if event.get('restart'):
+                    reason += f" (restart {event['restart']})"
+                print(f"[{event['index'] + 1}/{event['total']}] {event['app']}: {event['event']}{reason}")
+            elif event['event'] == "finished" and event.get('restart'):
+                print(f"Restart required by: {', '.join(event['restart_apps'])}")
+    except (ValueError, requests.RequestException) as e:
+        print(e)
+        return 2
+    return 1
+
+def run_lockfile_command(args):
+    """Write a lockfile pinning the direct-download installers this machine has cached"""
+    catalog = fetch_catalogs()["direct"]
+    cache = InstallerCache()
+    pins = {}
+    for category, apps in catalog.items():
+        for app_name, app_info in apps.items():
+            # The cache indexes a download under the first URL, whichever mirror served it
+            sha256, _ = cache.lookup_url(installer_urls(app_info)[0], max_age=float('inf'))
+            if sha256:
+                pins[f"{category}:{app_name}"] = cache.digests(sha256)
+    
+    total = sum(len(apps) for apps in catalog.values())
+    print(f"Pinned {len(pins)} of {total} direct-download app(s) in {args.output}")
+    if len(pins) < total:
+        print("Apps without a pin are downloaded from the origin; install them here once and run this again")
+    if args.merge:
+        try:
+            pins = dict(load_lockfile(args.output), **pins)
+        except ValueError:
+            pass
+    write_json_file(args.output, {'apps': pins})
+    return 0
+
+def start_peer_cache(args):
+    """Start serving and querying the LAN peer cache if it was requested"""
+    if not (args.peer_cache or args.command == 'peer-serve'):
+        return None
+    if args.peer_cache and args.command != 'peer-serve' and not args.lockfile:
+        print("WARNING: --peer-cache only fetches installers whose SHA-256 is pinned by the catalog or a lockfile. "
+              "The bundled catalog pins none, so without --lockfile every installer comes from the origin. "
+              "Create one on a machine that has downloaded them with 'Spaller.py lockfile --output site.lock.json'.")
+    peers = parse_peer_list(args.peers or os.environ.get('SPALLER_PEERS'))
+    return PeerCache(InstallerCache(), args.peer_port, peers, discovery=not args.no_discovery).start()
+
+def start_metrics(args):
+    """Serve metrics and write JSON snapshots if a metrics port was requested"""
+    if args.metrics_port is None:
+        return None
+    exporter = MetricsExporter(port=args.metrics_port).start()
+    atexit.register(exporter.stop)
+    print(f"Serving metrics on http://{exporter.bind}:{exporter.port}/metrics")
+    return exporter
+
+def start_stall_watchdog(args, app):
+    """Watch the GUI event loop for stalls if --stall-watchdog was given"""
+    if args.stall_watchdog is None:
+        return None
+    watchdog = StallWatchdog(args.stall_watchdog / 1000).start()
+    app.aboutToQuit.connect(watchdog.stop)
+    print(f"Logging GUI stalls over {args.stall_watchdog} ms to {watchdog.log_path}")
+    return watchdog
+
+def run_peer_serve_command(args, peer_cache):
+    """Serve the local installer cache to peers until interrupted"""
+    print(f"Serving installer cache {peer_cache.cache.root} on port {peer_cache.port}")
+    try:
+        while True:
+            time.sleep(PEER_BEACON_INTERVAL)
+    except KeyboardInterrupt:
+        peer_cache.stop()
+    return 0
+
+def add_peer_arguments(parser):
+    parser.add_argument('--peer-port', type=int, default=int(os.environ.get('SPALLER_PEER_PORT', PEER_CACHE_PORT)),
+                        help="port to serve the installer cache on (0 picks a free port)")
+    parser.add_argument('--peers', help="comma-separated host:port list of peers to ask before the origin")
+    parser.add_argument('--no-discovery', action='store_true', help="only use --peers, do not discover peers")
+
+def add_restart_argument(parser):
+    parser.add_argument('--restart', choices=["ask", "auto", "never"], default="ask",
+                        help="what to do when installers need Windows restarted: ask on a terminal, restart "
+                             "and continue the run after logon, or only report it (default: ask)")
+
+def run_lint_command(args):
+    """Check every catalog URL concurrently and report the ones that do not serve an installer"""
+    if args.catalog:
+        if os.path.exists(args.catalog):
+            catalog = read_json_file(args.catalog)
+        else:
+            response = requests.get(args.catalog, timeout=15)
+            response.raise_for_status()
+            catalog = response.json()
+        catalogs = {"catalog": catalog}
+    else:
+        catalogs = fetch_catalogs()
+    
+    checks = []
+    for catalog in catalogs.values():
+        for category, apps in catalog.items():
+            for app_name, app_info in apps.items():
+                for url in installer_urls(app_info):
+                    checks.append((f"{category}:{app_name}", url, app_info.get('installer')))
+                for package_id in parse_chocolatey_packages(app_info.get('chocolatey', '')):
+                    checks.append((f"{category}:{app_name}", f"choco:{package_id}", None))
+    
+    local = threading.local()
+    def run_check(check):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        app_id, target, installer_name = check
+        if target.startswith("choco:"):
+            return check_chocolatey_package(local.session, target[len("choco:"):])
+        return check_installer_url(local.session, target, installer_name)
+    
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        problems = list(executor.map(run_check, checks))
+    
+    broken = [(check, problem) for check, problem in zip(checks, problems) if problem]
+    for (app_id, target, _), problem in broken:
+        print(f"BROKEN  {app_id}\n        {target}\n        {problem}")
+    print(f"{len(checks)} URL(s) checked, {len(broken)} broken")
+    return 1 if broken else 0
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="Spaller", description="Software Package Installer")
+    parser.add_argument('--offline', metavar="BUNDLE",
+                        help="install from an offline bundle directory or .zip instead of the network")
+    parser.add_argument('--peer-cache', action='store_true', default=bool(os.environ.get('SPALLER_PEER_CACHE')),
+                        help="share downloaded installers with other Spaller instances on the LAN")
+    parser.add_argument('--lockfile', default=os.environ.get('SPALLER_LOCKFILE'),
+                        help="JSON file pinning installer SHA-256/SHA-512 digests by 'Category:Name'")
+    parser.add_argument('--metrics-port', type=int,
+                        default=int(os.environ['SPALLER_METRICS_PORT']) if os.environ.get('SPALLER_METRICS_PORT') else None,
+                        help="serve Prometheus metrics on this port and write metrics.json snapshots")
+    parser.add_argument('--stall-watchdog', type=int, nargs='?', metavar="MS", const=int(STALL_THRESHOLD * 1000),
+                        default=int(os.environ['SPALLER_STALL_WATCHDOG']) if os.environ.get('SPALLER_STALL_WATCHDOG') else None,
+                        help="log GUI freezes longer than MS milliseconds (default 250), with the stack that "
+                             "caused them, to ui_stalls.log in the state directory")
+    parser.add_argument('--after-restart', action='store_true', help=argparse.SUPPRESS)
+    add_peer_arguments(parser)
+    commands = parser.add_subparsers(dest='command')
+    
+    lint_parser = commands.add_parser('lint', help="check that every catalog URL serves an installer")
+    lint_parser.add_argument('--catalog', help="catalog file or URL to check (default: both published catalogs)")
+    lint_parser.add_argument('--workers', type=int, default=LINT_WORKERS, help="concurrent checks")
+    
+    install_parser = commands.add_parser('install', help="install apps without opening the window")
+    install_parser.add_argument('--apps', nargs='+', metavar="APP",
+                                help="apps to install, as 'Category:Name', 'Category:*' or 'Name'")
+    install_parser.add_argument('--profile', help="JSON selection profile listing apps to install")
+    install_parser.add_argument('--method', choices=list(CATALOG_URLS), default="chocolatey",
+                                help="install through Chocolatey or by downloading installers directly")
+    install_parser.add_argument('--parallel', type=int, default=INSTALL_PARALLELISM,
+                                help="apps to download and install at the same time (installers tagged "
+                                     "\"concurrency\": \"parallel\" in the catalog may run together)")
+    add_restart_argument(install_parser)
+    
+    upgrade_parser = commands.add_parser('upgrade', help="upgrade installed apps that have a newer Chocolatey version")
+    upgrade_parser.add_argument('--apps', nargs='+', metavar="APP",
+                                help="only consider these apps, as 'Category:Name', 'Category:*' or 'Name' "
+                                     "(default: the whole catalog)")
+    upgrade_parser.add_argument('--profile', help="JSON selection profile listing apps to consider")
+    upgrade_parser.add_argument('--dry-run', action='store_true', help="only show installed and available versions")
+    upgrade_parser.add_argument('--parallel', type=int, default=INSTALL_PARALLELISM,
+                                help="apps to download and upgrade at the same time")
+    add_restart_argument(upgrade_parser)
+    
+    agent_parser = commands.add_parser('agent', help="run as a long-lived agent that takes jobs over HTTP")
+    agent_parser.add_argument('--port', type=int, default=AGENT_PORT, help="port for the job API (0 picks a free port)")
+    agent_parser.add_argument('--bind', default="127.0.0.1", help="address to listen on")
+    agent_parser.add_argument('--token', default=os.environ.get('SPALLER_AGENT_TOKEN'),
+                              help=f"bearer token required on every request (default: generated into "
+                                   f"{AGENT_TOKEN_FILE} in the state directory)")
+    agent_parser.add_argument('--parallel', type=int, default=INSTALL_PARALLELISM,
+                              help="apps of a job to download and install at the same time")
+    
+    job_parser = commands.add_parser('job', help="send an install or upgrade job to a running agent")
+    job_parser.add_argument('--agent', default=f"http://127.0.0.1:{AGENT_PORT}", help="agent base URL")
+    job_parser.add_argument('--token', default=os.environ.get('SPALLER_AGENT_TOKEN'),
+                            help=f"agent bearer token (default: the one in {AGENT_TOKEN_FILE} in the state directory)")
+    job_parser.add_argument('--apps', nargs='+', metavar="APP",
+                            help="apps to install, as 'Category:Name', 'Category:*' or 'Name'")
+    job_parser.add_argument('--profile', help="JSON selection profile listing apps to install")
+    job_parser.add_argument('--method', choices=list(CATALOG_URLS), default="chocolatey",
+                            help="install through Chocolatey or by downloading installers directly")
+    job_parser.add_argument('--action', choices=["install", "upgrade"], default="install",
+                            help="an upgrade without --apps or --profile covers every outdated catalog app")
+    job_parser.add_argument('--follow', action='store_true', help="stream progress until the job finishes")
+    
+    resume_parser = commands.add_parser('resume', help="continue an interrupted or cancelled 'install' run")
+    resume_parser.add_argument('--run', help="run id to resume (default: the newest)")
+    resume_parser.add_argument('--list', action='store_true', help="only list the runs that can be resumed")
+    resume_parser.add_argument('--parallel', type=int, default=INSTALL_PARALLELISM,
+                               help="apps to download and install at the same time")
+    add_restart_argument(resume_parser)
+    
+    serve_parser = commands.add_parser('peer-serve', help="only serve the installer cache to LAN peers")
+    add_peer_arguments(serve_parser)
+    
+    bundle_parser = commands.add_parser('bundle', help="build an offline bundle for air-gapped machines")
+    bundle_parser.add_argument('--apps', nargs='+', metavar="APP",
+                               help="apps to include, as 'Category:Name', 'Category:*' or 'Name'")
+    bundle_parser.add_argument('--profile', help="JSON selection profile listing apps to include")
+    bundle_parser.add_argument('--output', required=True, help="directory to write the bundle to")
+    bundle_parser.add_argument('--archive', action='store_true', help="also pack the bundle into a .zip")
+    
+    lockfile_parser = commands.add_parser('lockfile', help="pin the installers in this machine's cache for "
+                                                           "--lockfile and --peer-cache")
+    lockfile_parser.add_argument('--output', required=True, help="lockfile to write")
+    lockfile_parser.add_argument('--merge', action='store_true', help="keep pins already in the output file")
+    
+    return parser.parse_args(argv)
 
 def main():
+    args = parse_arguments(sys.argv[1:])
+    if args.after_restart:
+        remove_resume_task()
+    start_metrics(args)
+    if args.command == 'bundle':
+        sys.exit(run_bundle_command(args))
+    if args.command == 'lint':
+        sys.exit(run_lint_command(args))
+    if args.command == 'lockfile':
+        sys.exit(run_lockfile_command(args))
+    if args.command == 'job':
+        sys.exit(run_job_command(args))
+    
+    peer_cache = start_peer_cache(args)
+    if args.command == 'peer-serve':
+        sys.exit(run_peer_serve_command(args, peer_cache))
+    if args.command == 'install':
+        sys.exit(run_install_command(args, peer_cache))
+    if args.command == 'upgrade':
+        sys.exit(run_upgrade_command(args, peer_cache))
+    if args.command == 'agent':
+        sys.exit(run_agent_command(args, peer_cache))
+    if args.command == 'resume':
+        sys.exit(run_resume_command(args, peer_cache))
+    
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
+    # The application owns the watchdog so its unparented heartbeat QTimer lives as long as the event loop
+    app.stall_watchdog = start_stall_watchdog(args, app)
     
     # Add error handling for the main function
     try:
@@ -1806,10 +7540,12 @@ def main():
         splash = LoadingScreen()
         splash.show()
         
-        window = SpallerMainWindow()
+        bundle = OfflineBundle(args.offline) if args.offline else None
+        window = SpallerMainWindow(bundle, peer_cache, load_lockfile(args.lockfile))
         
         QTimer.singleShot(3000, splash.close)
         QTimer.singleShot(3000, window.show)
+        QTimer.singleShot(3500, window.offer_resume)
         
         sys.exit(app.exec())
         
@@ -0,0 +1,122 @@
+"""
+Catalog memory benchmark
+
+Generates a synthetic Chocolatey-style catalog and loads it two ways: the
+legacy path (response.json() into nested dicts, an eager selection record per
+app keyed by "category:name" and a search index of tuples) and the streaming
+parser feeding a CatalogStore. Reports retained and peak bytes per app
+measured with tracemalloc, plus load time. For CatalogStore the load is split
+like DataLoader splits it: the parser builds a CatalogChunk per category on the
+loader thread and the GUI thread only appends it with add_category, which is
+timed separately.
+
+Usage: python benchmarks/bench_catalog_memory.py [--apps 50000] [--per-category 250]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from Spaller import CATALOG_CHUNK_SIZE, DEFAULT_APP_SIZE, CatalogChunk, CatalogStore, StreamingCatalogParser
+
+ICONS = ["📦", "🌐", "🛠️", "🎮", "🎵", "📝"]
+
+def generate_catalog(app_count, per_category):
+    catalog = {}
+    for i in range(app_count):
+        category = f"Category {i // per_category:04d}"
+        package = f"package-{i:06d}"
+        catalog.setdefault(category, {})[f"Application {i:06d}"] = {
+            "description": f"Synthetic application number {i} for memory measurements",
+            "chocolatey": f"choco install {package} -y",
+            "size": 20 + i % 400,
+            "icon": ICONS[i % len(ICONS)]
+        }
+    return json.dumps(catalog, ensure_ascii=False).encode("utf-8")
+
+def load_legacy(raw):
+    """The structures the GUI kept before the compact catalog"""
+    apps_data = json.loads(raw.decode("utf-8"))
+    
+    selected_apps = {}
+    for category, apps in apps_data.items():
+        for app_name, app_info in apps.items():
+            selected_apps[f"{category}:{app_name}"] = {
+                'selected': False,
+                'info': app_info,
+                'category': category,
+                'name': app_name,
+                'size': app_info.get('size', DEFAULT_APP_SIZE),
+                'size_measured': False
+            }
+    
+    index = []
+    for category, apps in apps_data.items():
+        for app_name, app_info in apps.items():
+            index.append((category, app_name, f"{app_name}\n{app_info.get('description', '')}".lower()))
+    return apps_data, selected_apps, index
+
+def load_compact(raw, gui_seconds):
+    store = CatalogStore()
+    chunk = CatalogChunk()
+    
+    def on_app(category, app_name, app_info):
+        chunk.append(app_name, app_info)
+    
+    def on_category_end(category):
+        nonlocal chunk
+        start = time.perf_counter()
+        store.add_category(category, chunk)
+        gui_seconds.append(time.perf_counter() - start)
+        chunk = CatalogChunk()
+    
+    parser = StreamingCatalogParser(store.discover, on_app, on_category_end)
+    for offset in range(0, len(raw), CATALOG_CHUNK_SIZE):
+        parser.feed(raw[offset:offset + CATALOG_CHUNK_SIZE])
+    parser.close()
+    return store
+
+def measure(loader, raw):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = loader(raw)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=50000, help="Number of apps in the synthetic catalog")
+    parser.add_argument("--per-category", type=int, default=250, help="Apps per category")
+    args = parser.parse_args()
+    
+    raw = generate_catalog(args.apps, args.per_category)
+    print(f"Catalog: {args.apps} apps, {len(raw) / 1000 / 1000:.1f} MB of JSON")
+    print()
+    
+    results = {}
+    gui_seconds = []
+    for name, loader in (("legacy dicts", load_legacy), ("CatalogStore", lambda raw: load_compact(raw, gui_seconds))):
+        retained, peak, elapsed = measure(loader, raw)
+        results[name] = retained
+        print(f"{name:14} retained {retained / args.apps:7.0f} B/app   "
+              f"peak {peak / args.apps:7.0f} B/app   load {elapsed:.2f} s")
+    print(f"{'':14} of which on the GUI thread: {sum(gui_seconds) * 1000:.1f} ms in total, "
+          f"{max(gui_seconds) * 1000:.2f} ms for the largest category")
+    
+    legacy, compact = results["legacy dicts"], results["CatalogStore"]
+    print()
+    print(f"Retained memory reduced by {(1 - compact / legacy) * 100:.0f}% "
+          f"({(legacy - compact) / args.apps:.0f} bytes per app)")
+
+if __name__ == "__main__":
+    main()
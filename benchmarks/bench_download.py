@@ -0,0 +1,106 @@
+"""
+Download throughput benchmark
+
+Serves a generated file from a local HTTP server (in a separate process, so
+only client-side CPU is measured) and downloads it with the legacy
+iter_content(8192) loop and with DownloadSink, reporting MB/s and CPU
+seconds per GB for each.
+
+Usage: python benchmarks/bench_download.py [--size-mb 512] [--runs 3] [--fsync never|end|interval]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import requests
+from Spaller import download_file
+
+def legacy_download(url, path):
+    """The original install_via_direct_download loop"""
+    response = requests.get(url, timeout=300, stream=True)
+    response.raise_for_status()
+    
+    with open(path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=8192):
+            f.write(chunk)
+
+def sink_download(url, path, fsync_policy):
+    download_file(url, path, fsync_policy=fsync_policy)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_server(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("HTTP server did not start")
+
+def measure(name, func, runs, size_bytes):
+    wall_times = []
+    cpu_times = []
+    for _ in range(runs):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        func()
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+    
+    best_wall = min(wall_times)
+    best_cpu = min(cpu_times)
+    gigabytes = size_bytes / 1e9
+    print(f"{name:<22} {size_bytes / 1e6 / best_wall:>10.1f} MB/s {best_cpu / gigabytes:>10.2f} CPU s/GB")
+    return best_wall, best_cpu
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--fsync', default="never", choices=("never", "end", "interval"))
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as serve_dir, tempfile.TemporaryDirectory() as out_dir:
+        size_bytes = args.size_mb * 1000 * 1000
+        source = os.path.join(serve_dir, "installer.exe")
+        with open(source, 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            remaining = size_bytes
+            while remaining:
+                remaining -= f.write(block[:min(len(block), remaining)])
+        
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1", "--directory", serve_dir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_server(port)
+            url = f"http://127.0.0.1:{port}/installer.exe"
+            target = os.path.join(out_dir, "download.bin")
+            
+            print(f"Downloading {args.size_mb} MB x{args.runs} (best run), fsync={args.fsync}")
+            before = measure("iter_content(8192)", lambda: legacy_download(url, target), args.runs, size_bytes)
+            after = measure("DownloadSink", lambda: sink_download(url, target, args.fsync), args.runs, size_bytes)
+            
+            if os.path.getsize(target) != size_bytes:
+                raise RuntimeError("Downloaded file has the wrong size")
+            
+            print(f"Speed-up: {before[0] / after[0]:.2f}x wall, {before[1] / max(after[1], 1e-9):.2f}x CPU")
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
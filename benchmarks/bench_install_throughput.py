@@ -0,0 +1,115 @@
+"""
+End-to-end install throughput benchmark
+
+Runs InstallEngine over a synthetic batch of apps on the simulation backend
+(benchmarks/simulation.py): installers come from a local farm with the given
+size, latency and failure rate, and choco, msiexec and the installers
+themselves are shims that take --install-seconds. Each engine configuration
+(install method, parallelism, cold or warm installer cache) gets a fresh state
+directory and reports wall time, apps per minute, and CPU seconds spent in the
+engine process and in the installer processes. Runs on Linux; nothing touches
+the real system.
+
+Usage: python benchmarks/bench_install_throughput.py [--apps 50] [--size-mb 8] [--parallel 1,4] [--methods direct,chocolatey]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import Spaller
+from Spaller import InstallEngine, InstallEventBus
+from simulation import InstallerFarm, SimulatedPlatform
+
+INSTALLER_KINDS = ("nsis", "inno", "msi")
+
+def generate_apps(farm, count, parallel_share, seed):
+    """Return selected_apps for count apps, cycling through the installer kinds"""
+    rng = random.Random(seed)
+    apps = []
+    for i in range(count):
+        kind = INSTALLER_KINDS[i % len(INSTALLER_KINDS)]
+        name = f"app-{i:03d}"
+        info = {
+            'url': farm.url(kind, name),
+            'installer': os.path.basename(farm.url(kind, name)),
+            'chocolatey': f"choco install sim-{name} -y",
+        }
+        if kind != "msi" and rng.random() < parallel_share:
+            info['concurrency'] = "parallel"
+        apps.append((f"Simulated:{name}", {'name': name, 'info': info}))
+    return apps
+
+def run_engine(apps, method, parallel, platform, state_dir):
+    """Run one batch and return (wall seconds, engine CPU, installer CPU, RunFinished event)"""
+    os.environ['SPALLER_STATE_DIR'] = state_dir
+    bus = InstallEventBus()
+    finished = []
+    bus.subscribe(finished.extend, kinds=("finished",))
+    engine = InstallEngine(apps, method, bus=bus, max_parallel=parallel, platform=platform)
+    
+    cpu_start = os.times()
+    wall_start = time.perf_counter()
+    engine.run()
+    wall = time.perf_counter() - wall_start
+    cpu_end = os.times()
+    bus.close()
+    
+    engine_cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    installer_cpu = ((cpu_end.children_user - cpu_start.children_user)
+                     + (cpu_end.children_system - cpu_start.children_system))
+    return wall, engine_cpu, installer_cpu, finished[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', type=int, default=50, help="apps in the batch")
+    parser.add_argument('--size-mb', type=float, default=8, help="size of each synthetic installer")
+    parser.add_argument('--latency', type=float, default=0.05, help="farm seconds before each response")
+    parser.add_argument('--download-failure-rate', type=float, default=0.0, help="share of downloads answered with 503")
+    parser.add_argument('--install-seconds', type=float, default=0.5, help="time each simulated install takes")
+    parser.add_argument('--install-failure-rate', type=float, default=0.0, help="share of installs that fail")
+    parser.add_argument('--parallel-share', type=float, default=0.5,
+                        help="share of .exe installers tagged as safe to run in parallel")
+    parser.add_argument('--parallel', default="1,4", help="comma-separated max_parallel values")
+    parser.add_argument('--methods', default="direct,chocolatey", help="comma-separated install methods")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    
+    parallel_values = [int(value) for value in args.parallel.split(',')]
+    methods = [method.strip() for method in args.methods.split(',')]
+    
+    with tempfile.TemporaryDirectory() as work_dir, \
+            InstallerFarm(args.size_mb, args.latency, args.download_failure_rate, args.seed) as farm:
+        download_dir = os.path.join(work_dir, "downloads")
+        os.makedirs(download_dir)
+        Spaller.get_download_dir = lambda: download_dir
+        platform = Spaller.PLATFORM = SimulatedPlatform(work_dir, args.install_seconds,
+                                                        args.install_failure_rate, args.seed)
+        apps = generate_apps(farm, args.apps, args.parallel_share, args.seed)
+        
+        configurations = []
+        for method in methods:
+            for parallel in parallel_values:
+                configurations.append((method, parallel, "cold"))
+                if method == "direct":
+                    configurations.append((method, parallel, "warm"))
+        
+        print(f"{args.apps} apps, {args.size_mb:g} MB installers, {args.latency * 1000:.0f} ms latency, "
+              f"{args.install_seconds:g} s per install")
+        print(f"{'method':<11} {'parallel':>8} {'cache':>5} {'wall s':>8} {'apps/min':>9} "
+              f"{'engine CPU s':>12} {'installer CPU s':>15} {'ok':>4} {'failed':>6}")
+        for method, parallel, cache in configurations:
+            state_dir = os.path.join(work_dir, f"state-{method}-{parallel}")
+            if cache == "cold":
+                os.makedirs(state_dir)
+            # A warm run reuses the state, and so the installer cache, of the cold run before it
+            wall, engine_cpu, installer_cpu, finished = run_engine(apps, method, parallel, platform, state_dir)
+            print(f"{method:<11} {parallel:>8} {cache:>5} {wall:>8.1f} {len(apps) * 60 / wall:>9.1f} "
+                  f"{engine_cpu:>12.2f} {installer_cpu:>15.2f} {finished.succeeded:>4} {finished.failed:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+UI churn and leak benchmark
+
+Builds the main window offscreen over a synthetic catalog, then hammers it the
+way a long kiosk session does: thousands of category switches, searches typed
+into the search bar and checkbox toggles. Every --sample-every iterations it
+records RSS, the number of live QObjects under the window, live ModernCheckBox
+wrappers and the Python object count, after flushing deferred deletes and
+collecting garbage. Growth between the first sample after warm-up and the last
+one must stay under the thresholds, otherwise the benchmark exits with status 1.
+
+PySide6 6.12.0 drops a reference to True on every Signal.emit() called from
+Python and aborts once it reaches zero. Nothing on the paths exercised here
+emits from Python (ModernCheckBox forwards its inner QCheckBox's own signal),
+so the benchmark runs on 6.12 as well as on 6.11.
+
+Usage: python benchmarks/bench_ui_churn.py [--iterations 500] [--categories 12] [--per-category 60]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from PySide6.QtCore import QCoreApplication, QEvent, QObject
+from PySide6.QtWidgets import QApplication
+
+from Spaller import CatalogStore, ModernCheckBox, SpallerMainWindow
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SEARCH_TERMS = ["app", "application 1", "tool", "synthetic", "zz-no-match", "4", "category", "number 2"]
+
+def generate_catalog(categories, per_category):
+    catalog = CatalogStore()
+    for c in range(categories):
+        apps = {}
+        for i in range(per_category):
+            apps[f"Application {c:02d}-{i:03d}"] = {
+                "description": f"Synthetic tool number {i} in category {c}",
+                "chocolatey": f"choco install package-{c}-{i} -y",
+                "size": 20 + i,
+                "icon": "📦"
+            }
+        catalog.add_category(f"Category {c:02d}", apps)
+    return catalog
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+def settle(app):
+    """Run pending events and deferred deletes so only live objects are counted"""
+    for _ in range(3):
+        app.processEvents()
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    gc.collect()
+
+def sample(app, window):
+    settle(app)
+    # findChildren() wraps every child QObject in Python, so count those before the Python objects
+    qobjects = len(window.findChildren(QObject))
+    gc.collect()
+    objects = gc.get_objects()
+    return {
+        'rss': rss_bytes(),
+        'qobjects': qobjects,
+        'checkboxes': sum(1 for obj in objects if isinstance(obj, ModernCheckBox)),
+        'pyobjects': len(objects),
+    }
+
+def build_window(catalog):
+    # No network: the catalog is injected instead of fetched and prerequisites are not probed
+    SpallerMainWindow.prefetch_catalogs = lambda self: None
+    SpallerMainWindow.check_prerequisites = lambda self: None
+    window = SpallerMainWindow()
+    window.catalogs["chocolatey"] = catalog
+    window.catalog_complete.add("chocolatey")
+    window.apply_catalog("chocolatey")
+    return window
+
+def pump(app):
+    """Return to the event loop once; outside app.exec() deleteLater() only runs when asked to"""
+    app.processEvents()
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+
+def churn(app, window, rng, categories):
+    """One iteration: switch category, toggle a few apps, type a search and clear it"""
+    window.switch_category(rng.choice(categories))
+    pump(app)
+    for checkbox in rng.sample(list(window.app_checkboxes.values()), k=min(3, len(window.app_checkboxes))):
+        checkbox.checkbox.click()
+    
+    # One event per keystroke; the debounce timer is fired by hand rather than waited out
+    term = rng.choice(SEARCH_TERMS)
+    for length in range(1, len(term) + 1):
+        window.search_bar.setText(term[:length])
+        pump(app)
+    window.search_timer.stop()
+    window.filter_apps(term)
+    pump(app)
+    window.search_bar.setText("")
+    window.search_timer.stop()
+    window.filter_apps("")
+    pump(app)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500, help="churn iterations to run")
+    parser.add_argument("--categories", type=int, default=12, help="categories in the synthetic catalog")
+    parser.add_argument("--per-category", type=int, default=60, help="apps per category")
+    parser.add_argument("--warmup", type=int, default=50, help="iterations before the baseline sample")
+    parser.add_argument("--sample-every", type=int, default=100, help="iterations between samples")
+    parser.add_argument("--max-rss-growth", type=float, default=16, help="allowed RSS growth in MB")
+    parser.add_argument("--max-qobject-growth", type=int, default=64, help="allowed growth in live QObjects")
+    parser.add_argument("--max-pyobject-growth", type=int, default=4000, help="allowed growth in Python objects")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = build_window(generate_catalog(args.categories, args.per_category))
+    categories = list(window.catalog.categories)
+    rng = random.Random(args.seed)
+    
+    for _ in range(args.warmup):
+        churn(app, window, rng, categories)
+    baseline = sample(app, window)
+    
+    print(f"{'iteration':>9} {'RSS MB':>8} {'QObjects':>9} {'checkboxes':>10} {'py objects':>10} {'ms/iter':>8}")
+    row = lambda i, s, ms: print(f"{i:>9} {s['rss'] / 1e6:>8.1f} {s['qobjects']:>9} {s['checkboxes']:>10} "
+                                 f"{s['pyobjects']:>10} {ms:>8.2f}")
+    row(0, baseline, 0)
+    
+    latest = baseline
+    started = time.perf_counter()
+    for i in range(1, args.iterations + 1):
+        churn(app, window, rng, categories)
+        if i % args.sample_every == 0 or i == args.iterations:
+            elapsed = time.perf_counter() - started
+            latest = sample(app, window)
+            row(i, latest, elapsed * 1000 / args.sample_every)
+            started = time.perf_counter()
+    
+    growth = {
+        'RSS': ((latest['rss'] - baseline['rss']) / 1e6, args.max_rss_growth, "MB"),
+        'QObjects': (latest['qobjects'] - baseline['qobjects'], args.max_qobject_growth, ""),
+        'Python objects': (latest['pyobjects'] - baseline['pyobjects'], args.max_pyobject_growth, ""),
+    }
+    print()
+    failed = False
+    for name, (value, limit, unit) in growth.items():
+        verdict = "ok" if value <= limit else "FAIL"
+        failed |= value > limit
+        print(f"{name:15} grew {value:8.1f}{unit:2} (limit {limit}{unit}) {verdict}")
+    
+    window.close()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
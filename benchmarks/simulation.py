@@ -0,0 +1,225 @@
+"""
+Simulation backend for running the install engine without Windows
+
+SimulatedPlatform stands in for Spaller's WindowsPlatform: it reports an elevated
+process, finds a fake choco shim instead of choco.exe, and runs every choco,
+msiexec and installer command through this script, which reads the installer,
+sleeps for the configured install time and fails at the configured rate. InstallerFarm serves synthetic installers
+(a valid header, a framework marker and filler) from a local HTTP server in a
+separate process, with configurable size, latency and failure rate.
+
+The script doubles as the shims and the farm:
+    
+    python benchmarks/simulation.py farm --port 8080 [--size-mb 8] [--latency 0.05] [--failure-rate 0]
+    python benchmarks/simulation.py choco [--seconds 0.5] [--failure-rate 0] install <package> -y
+    python benchmarks/simulation.py installer [--seconds 0.5] [--failure-rate 0] <path> [switches]
+    python benchmarks/simulation.py msiexec [--seconds 0.5] [--failure-rate 0] /i <path> [switches]
+"""
+import argparse
+import os
+import random
+import socket
+import stat
+import subprocess
+import sys
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SCRIPT = os.path.abspath(__file__)
+FILLER_BLOCK = 1024 * 1024
+CHOCO_VERSION = "2.2.2-simulated"
+
+# Leading bytes and framework marker of each synthetic installer kind, keyed by farm path prefix
+INSTALLER_KINDS = {
+    "nsis": (".exe", b"MZ\x90\x00", b"Nullsoft Install System"),
+    "inno": (".exe", b"MZ\x90\x00", b"Inno Setup Setup Data"),
+    "msi": (".msi", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", b""),
+}
+
+def fails(seed, name, rate):
+    """Decide once per seed and name whether a simulated step fails, so runs are repeatable"""
+    return rate > 0 and random.Random(f"{seed}:{name}").random() < rate
+
+class FarmRequestHandler(BaseHTTPRequestHandler):
+    """Serve /<kind>/<name> as a synthetic installer of the farm's configured size"""
+    
+    protocol_version = "HTTP/1.1"  # Keep-alive, as real CDNs do
+    
+    def do_GET(self):
+        farm = self.server.farm
+        time.sleep(farm.latency)
+        kind = self.path.strip('/').split('/')[0]
+        if kind not in INSTALLER_KINDS:
+            self.send_error(404)
+            return
+        if farm.rng.random() < farm.failure_rate:
+            self.send_error(503, "Simulated failure")
+            return
+        
+        _, magic, marker = INSTALLER_KINDS[kind]
+        header = magic + bytes(60) + marker
+        size = max(farm.size, len(header))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        
+        try:
+            self.wfile.write(header)
+            remaining = size - len(header)
+            filler = memoryview(farm.filler)
+            while remaining:
+                remaining -= self.wfile.write(filler[:min(remaining, len(filler))])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
+    def log_message(self, format, *args):
+        pass
+
+def serve_farm(args):
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FarmRequestHandler)
+    server.daemon_threads = True
+    server.farm = argparse.Namespace(size=int(args.size_mb * 1000 * 1000), latency=args.latency,
+                                     failure_rate=args.failure_rate, rng=random.Random(args.seed),
+                                     filler=random.Random(args.seed).randbytes(FILLER_BLOCK))
+    server.serve_forever()
+
+class InstallerFarm:
+    """Run the synthetic installer server in its own process, so only client CPU is measured"""
+    
+    def __init__(self, size_mb=8, latency=0.05, failure_rate=0.0, seed=1):
+        self.options = ['--size-mb', str(size_mb), '--latency', str(latency),
+                        '--failure-rate', str(failure_rate), '--seed', str(seed)]
+        self.port = None
+        self.process = None
+    
+    def start(self, timeout=10):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.process = subprocess.Popen([sys.executable, SCRIPT, 'farm', '--port', str(self.port)] + self.options,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return self
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("Installer farm did not start")
+    
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+    
+    def url(self, kind, name):
+        extension = INSTALLER_KINDS[kind][0]
+        return f"http://127.0.0.1:{self.port}/{kind}/{name}{extension}"
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def write_choco_shim(directory, options):
+    """Write an executable 'choco' that runs this script's choco command with fixed options"""
+    path = os.path.join(directory, "choco")
+    quoted = ' '.join(f'"{part}"' for part in [sys.executable, SCRIPT, 'choco'] + options + ['--'])
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nexec {quoted} "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+class SimulatedPlatform:
+    """Stands in for WindowsPlatform: elevated, Chocolatey present, every installer run by a shim"""
+    
+    def __init__(self, work_dir, install_seconds=0.5, failure_rate=0.0, seed=1):
+        self.options = ['--seconds', str(install_seconds), '--failure-rate', str(failure_rate), '--seed', str(seed)]
+        self.choco_path = write_choco_shim(work_dir, self.options)
+    
+    def is_admin(self):
+        return True
+    
+    def find_chocolatey(self):
+        return self.choco_path
+    
+    def chocolatey_version(self, choco_path):
+        return CHOCO_VERSION
+    
+    def find_tool(self, name):
+        return None  # Only Chocolatey is simulated; winget and Scoop backends stay unavailable
+    
+    def run_installer(self, supervisor, command, shell=False, watch_names=()):
+        if command[0] == 'choco':
+            command = [self.choco_path] + command[1:]
+        elif command[0] == 'msiexec':
+            command = [sys.executable, SCRIPT, 'msiexec'] + self.options + ['--'] + command[1:]
+        else:
+            command = [sys.executable, SCRIPT, 'installer'] + self.options + ['--'] + command
+        # No shell to resolve choco through and no Windows Installer service to watch
+        return supervisor.run(command)
+
+def simulate_install(args, name, path=None, failure_code=1):
+    """Read the installer like an extractor would, wait out the install time and exit"""
+    started = time.monotonic()
+    if path and os.path.isfile(path):
+        with open(path, 'rb') as f:
+            while f.read(FILLER_BLOCK):
+                pass
+    time.sleep(max(0.0, args.seconds - (time.monotonic() - started)))
+    return failure_code if fails(args.seed, name, args.failure_rate) else 0
+
+def run_choco(args):
+    command = args.command
+    if '--version' in command:
+        print(CHOCO_VERSION)
+        return 0
+    if command[:1] == ['outdated']:
+        return 0  # Nothing installed by the simulation is ever outdated
+    if command[:1] in (['install'], ['upgrade']) and len(command) > 1:
+        print(f"Simulated {command[0]} of {command[1]}")
+        return simulate_install(args, command[1])
+    print(f"Unsupported simulated choco command: {' '.join(command)}")
+    return 1
+
+def run_installer(args):
+    path = args.command[0] if args.command else ""
+    return simulate_install(args, os.path.basename(path), path)
+
+def run_msiexec(args):
+    command = args.command
+    path = command[command.index('/i') + 1] if '/i' in command[:-1] else ""
+    return simulate_install(args, os.path.basename(path), path, failure_code=1603)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='mode', required=True)
+    
+    farm = commands.add_parser('farm', help="serve synthetic installers")
+    farm.add_argument('--port', type=int, required=True)
+    farm.add_argument('--size-mb', type=float, default=8)
+    farm.add_argument('--latency', type=float, default=0.05, help="seconds before each response")
+    farm.add_argument('--failure-rate', type=float, default=0.0, help="share of requests answered with 503")
+    farm.add_argument('--seed', type=int, default=1)
+    
+    for name in ('choco', 'installer', 'msiexec'):
+        shim = commands.add_parser(name, help=f"behave like {name}")
+        shim.add_argument('--seconds', type=float, default=0.5, help="simulated install time")
+        shim.add_argument('--failure-rate', type=float, default=0.0, help="share of installs that fail")
+        shim.add_argument('--seed', type=int, default=1)
+        shim.add_argument('command', nargs=argparse.REMAINDER)
+    
+    args = parser.parse_args()
+    if args.mode == 'farm':
+        serve_farm(args)
+        return 0
+    if args.command[:1] == ['--']:
+        args.command = args.command[1:]
+    return {'choco': run_choco, 'installer': run_installer, 'msiexec': run_msiexec}[args.mode](args)
+
+if __name__ == "__main__":
+    sys.exit(main())